@@ -24,6 +24,7 @@ import inspect
 import sys
 import logging
 import os
+import threading
 
 from datetime import datetime
 from abc import ABCMeta, abstractmethod
@@ -32,10 +33,12 @@ import pandas as pd
 from numpy import nan
 
 from qtpylib.broker import Broker
+from qtpylib.instrument import Instrument
 from qtpylib.workflow import validate_columns as validate_csv_columns
-from qtpylib.blotter import prepare_history
+from qtpylib.blotter import Blotter, prepare_history
+from qtpylib.features import FeatureStore
 from qtpylib import (
-    tools, sms, asynctools
+    tools, sms, asynctools, metrics, futures, path
 )
 
 # =============================================
@@ -54,6 +57,12 @@ __threads__ = int(__threads__) if tools.is_number(__threads__) else None
 asynctools.multitasking.createPool(__name__, __threads__)
 
 # =============================================
+# runtime metrics
+_HANDLER_SECONDS = metrics.histogram(
+    "qtpylib_algo_handler_seconds", "Algo market data handler duration",
+    ("handler",))
+
+# =============================================
 
 
 class Algo(Broker):
@@ -65,7 +74,12 @@ class Algo(Broker):
             List of IB contract tuples. Default is empty list
         resolution : str
             Desired bar resolution (using pandas resolution: 1T, 1H, etc).
-            Use K for tick bars. Default is 1T (1min)
+            Use K for tick bars, V for volume bars and $ for dollar
+            (notional) bars. Default is 1T (1min)
+        resolutions : list
+            Additional (coarser, time-based) resolutions to build from
+            the bars (eg. ["15T", "1D"]), available via
+            ``instrument.get_bars(resolution=...)``. Default is None
         tick_window : int
             Length of tick lookback window to keep. Defaults to 1
         bar_window : int
@@ -80,7 +94,9 @@ class Algo(Broker):
             Tells preloader to construct continuous Futures contracts
             (default is True)
         blotter : str
-            Log trades to this Blotter's MySQL (default is "auto detect")
+            Log trades to this Blotter's MySQL (default is "auto detect").
+            Pass a ``Blotter`` instance to run it inside the algo's process
+            (embedded mode, streaming over ``inproc://``)
         sms: set
             List of numbers to text orders (default: None)
         log: str
@@ -101,15 +117,24 @@ class Algo(Broker):
             IB TWS/GW Client ID (default: 998)
         ibserver: str
             IB TWS/GW Server hostname (default: localhost)
+        metricsport: int
+            Expose runtime metrics (Prometheus format) on this
+            local HTTP port (default: None = disabled)
+        metricslog: int
+            Log runtime metrics every N seconds (default: 0 = disabled)
+        featurestore: str
+            Directory to store features registered with ``store_features()``
+            (Backtest). Default is the ``data`` directory (or the strategy's)
     """
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, instruments, resolution="1T",
+    def __init__(self, instruments, resolution="1T", resolutions=None,
                  tick_window=1, bar_window=100, timezone="UTC", preload=None,
                  continuous=True, blotter=None, sms=None, log=None,
                  backtest=False, start=None, end=None, data=None, output=None,
-                 ibclient=998, ibport=4001, ibserver="localhost", **kwargs):
+                 ibclient=998, ibport=4001, ibserver="localhost",
+                 metricsport=None, metricslog=0, featurestore=None, **kwargs):
 
         # detect algo name
         self.name = str(self.__class__).split('.')[-1].split("'")[0]
@@ -138,15 +163,45 @@ class Algo(Broker):
         self.bar_count = 0
         self.bar_hashes = {}
 
+        # streaming indicators {symbol: {name: (on, indicator)}}
+        self.indicators = {}
+        self._indicators_lock = threading.Lock()
+
+        # feature sets {symbol: [FeatureSet, cache]}
+        self.features = {}
+
+        # stored (backtest) features
+        self._feature_store = None
+        self._stored_features = {}
+
         self.tick_window = tick_window if tick_window > 0 else 1
         if "V" in resolution:
             self.tick_window = 1000
         self.bar_window = bar_window if bar_window > 0 else 100
         self.resolution = resolution.upper().replace("MIN", "T")
         self.timezone = timezone
+
+        # incremental tick/volume/dollar bars {symbol: TickBarBuilder}
+        self._tick_bar_builders = None
+        if self.resolution[-1] in ("K", "V", "$") and int("".join(
+                [s for s in self.resolution if s.isdigit()]) or 0) > 1:
+            self._tick_bar_builders = {}
+
+        # additional resolutions {resolution: {symbol: BarResampler}}
+        resolutions = self.args["resolutions"]
+        if isinstance(resolutions, str):
+            resolutions = resolutions.split(",")
+        self.resolutions = {
+            res.strip().upper().replace("MIN", "T"): {}
+            for res in (resolutions or []) if res.strip()}
+        for res in self.resolutions:
+            tools.BarResampler(res)  # validate
         self.preload = preload
         self.continuous = continuous
 
+        # streamed continuous futures {symbol_group: ContinuousContract}
+        self.continuous_contracts = {}
+
         # -----------------------------------
         # backtest info
         self.backtest = self.args["backtest"]
@@ -158,6 +213,11 @@ class Algo(Broker):
         self.sms_numbers = self.args["sms"]
         self.trade_log_dir = self.args["log"]
         self.blotter_name = self.args["blotter"]
+
+        # embedded blotter (same process)
+        if isinstance(self.blotter_name, Blotter):
+            self.blotter_name.start()
+            self.blotter_name = self.blotter_name.name
         self.record_output = self.args["output"]
 
         # ---------------------------------------
@@ -207,38 +267,17 @@ class Algo(Broker):
             self.datastore = tools.DataStore(self.args["output"])
 
         # ---------------------------------------
-        # add stale ticks for more accurate time--based bars
-        if not self.backtest and self.resolution[-1] not in ("S", "K", "V"):
-            self.bar_timer = asynctools.RecurringTask(
-                self.add_stale_tick, interval_sec=1, init_sec=1, daemon=True)
+        # close the (1-minute) streamed bars on time, even if
+        # no tick arrives after them
+        self.bar_timer = None
+        if not self.backtest and self.resolution[-1] not in ("S", "K", "V", "$"):
+            self.bar_timer = asynctools.BarTimer(60, self._on_bar_close)
 
         # ---------------------------------------
         # be aware of thread count
         self.threads = asynctools.multitasking.getPool(__name__)['threads']
 
 
-    # ---------------------------------------
-    def add_stale_tick(self):
-        ticks = self.ticks.copy()
-        if self.ticks.empty:
-            return
-
-        last_tick_sec = float(tools.datetime64_to_datetime(
-            ticks.index.values[-1]).strftime('%M.%S'))
-
-        for sym in list(self.ticks["symbol"].unique()):
-            tick = ticks[ticks['symbol'] ==
-                         sym][-5:].to_dict(orient='records')[-1]
-            tick['timestamp'] = datetime.utcnow()
-
-            if last_tick_sec != float(tick['timestamp'].strftime("%M.%S")):
-                tick = pd.DataFrame(index=[0], data=tick)
-                tick.set_index('timestamp', inplace=True)
-                tick = tools.set_timezone(tick, tz=self.timezone)
-                tick.loc[:, 'lastsize'] = 0  # no real size
-
-                self._tick_handler(tick, stale_tick=True)
-
     # ---------------------------------------
     def load_cli_args(self):
         """
@@ -277,6 +316,15 @@ class Algo(Broker):
         parser.add_argument('--continuous', default=self.args["continuous"],
                             help='Use continuous Futures contracts (flag)',
                             action='store_true')
+        parser.add_argument('--metricsport', default=self.args["metricsport"],
+                            help='Expose runtime metrics on this HTTP port')
+        parser.add_argument('--metricslog', default=self.args["metricslog"],
+                            help='Log runtime metrics every N seconds')
+        parser.add_argument('--resolutions', default=self.args["resolutions"],
+                            help='Additional bar resolutions (eg. 15T,1D)')
+        parser.add_argument('--featurestore',
+                            default=self.args["featurestore"],
+                            help='Path to store computed features (Backtest)')
 
         # only return non-default cmd line args
         # (meaning only those actually given)
@@ -296,9 +344,14 @@ class Algo(Broker):
 
         history = pd.DataFrame()
 
+        # expose runtime metrics
+        metrics.start(port=self.args["metricsport"],
+                      log_interval=self.args["metricslog"],
+                      logger=self.log_algo)
+
         # get history from csv dir
         if self.backtest and self.backtest_csv:
-            kind = "TICK" if self.resolution[-1] in ("S", "K", "V") else "BAR"
+            kind = "TICK" if self.resolution[-1] in ("S", "K", "V", "$") else "BAR"
             dfs = []
             for symbol in self.symbols:
                 file = "%s/%s.%s.csv" % (self.backtest_csv, symbol, kind)
@@ -387,14 +440,23 @@ class Algo(Broker):
             # initiate strategy
             self.on_start()
 
+            # load/compute stored features
+            self._load_stored_features(history)
+
             # drip history
             drip_handler = self._tick_handler if self.resolution[-1] in (
-                "S", "K", "V") else self._bar_handler
+                "S", "K", "V", "$") else self._bar_handler
             self.blotter.drip(history, drip_handler)
 
+            # write the remaining recorded data
+            if self.record_output:
+                self.datastore.flush()
+
         else:
             # place history self.bars
             self.bars = history
+            self._update_resolutions(history)
+            self._update_continuous(history)
 
             # add instruments to blotter in case they do not exist
             self.blotter.register(self.instruments)
@@ -409,7 +471,8 @@ class Algo(Broker):
                 quote_handler=self._quote_handler,
                 tick_handler=self._tick_handler,
                 bar_handler=self._bar_handler,
-                book_handler=self._book_handler
+                book_handler=self._book_handler,
+                snapshot_handler=self._snapshot_handler
             )
 
     # ---------------------------------------
@@ -471,6 +534,22 @@ class Algo(Broker):
         # raise NotImplementedError("Should implement on_bar()")
         pass
 
+    # ---------------------------------------
+    def on_continuous_bar(self, instrument):
+        """
+        Invoked on every bar of a futures group's continuous contract
+        (when ``continuous`` is True). Use ``self.get_continuous_bars()``
+        to get the back-adjusted continuous bars.
+
+        :Parameters:
+
+            instrument : object
+                `Instruments Object <#instrument-api>`_
+                (the group's active contract)
+
+        """
+        pass
+
     # ---------------------------------------
     @abstractmethod
     def on_orderbook(self, instrument):
@@ -532,6 +611,33 @@ class Algo(Broker):
         """
         return self.blotter.history(symbols, start, end, resolution, tz)
 
+    # ---------------------------------------
+    def get_continuous_bars(self, symbol_group, lookback=None):
+        """Get a futures group's streamed continuous contract
+        (back-adjusted at every roll)
+
+        :Parameters:
+            symbol_group : str / object
+                Symbol group (eg. "ES_F") or one of its contracts'
+                `Instruments Object <#instrument-api>`_
+
+        :Optional:
+            lookback : int
+                Number of bars to return (default: all kept)
+
+        :Returns:
+            bars : pd.DataFrame
+                The continuous contract's bars
+        """
+        symbol_group = str(symbol_group)
+        if "_FUT" in symbol_group:
+            symbol_group = tools.gen_symbol_group(symbol_group)
+
+        contract = self.continuous_contracts.get(symbol_group)
+        if contract is None:
+            return pd.DataFrame()
+        return contract.get_bars(lookback)
+
     # ---------------------------------------
     # shortcuts to broker._create_order
     # ---------------------------------------
@@ -580,11 +686,24 @@ class Algo(Broker):
                 Is this an iceberg (hidden) order
             tif: str
                 Time in force (DAY, GTC, IOC, GTD). default is ``DAY``
+
+        :Returns:
+            future : concurrent.futures.Future
+                The order id, once the order was sent (live trading only;
+                orders are queued and sent in the background). Invalid
+                orders raise a ``ValueError`` right away; errors while
+                sending the order are logged and raised by
+                ``future.result()``
         """
         self.log_algo.debug('ORDER: %s %4d %s %s', signal,
                             quantity, symbol, kwargs)
         if signal.upper() == "EXIT" or signal.upper() == "FLATTEN":
-            position = self.get_positions(symbol)
+            if self.backtest:
+                # include orders placed earlier on this bar (not yet filled)
+                position = self.ledger.get(self.get_symbol(symbol),
+                                           pending=True)
+            else:
+                position = self.get_positions(symbol)
             if position['position'] == 0:
                 return
 
@@ -595,12 +714,16 @@ class Algo(Broker):
             # print("EXIT", kwargs)
 
             try:
-                self.record({symbol+'_POSITION': 0})
+                position = 0
+                if self.backtest:
+                    self.ledger.order(symbol, -self.ledger.get(
+                        symbol, pending=True)['position'])
+                self.record({symbol+'_POSITION': position})
             except Exception as e:
                 pass
 
             if not self.backtest:
-                self._create_order(**kwargs)
+                return self._create_order(**kwargs)
 
         else:
             if quantity == 0:
@@ -617,12 +740,17 @@ class Algo(Broker):
                 quantity = abs(quantity)
                 if kwargs['direction'] != "BUY":
                     quantity = -quantity
+                if self.backtest:
+                    # simulated order (filled on the next bar's open)
+                    self.ledger.order(symbol, quantity)
+                    quantity = self.ledger.get(
+                        symbol, pending=True)['position']
                 self.record({symbol+'_POSITION': quantity})
             except Exception as e:
                 pass
 
             if not self.backtest:
-                self._create_order(**kwargs)
+                return self._create_order(**kwargs)
 
     # ---------------------------------------
     def cancel_order(self, orderId):
@@ -695,6 +823,154 @@ class Algo(Broker):
         self.quotes[quote['symbol']] = quote
         self.on_quote(self.get_instrument(quote))
 
+    # ---------------------------------------
+    def _snapshot_handler(self, snapshot):
+        """ seed quotes, order books and last prices from the blotter's
+        in-memory snapshot (strategy callbacks are not invoked).
+        the snapshot's ticks can be old (eg. an illiquid symbol's), so
+        they aren't added to the tick window """
+        for symbol, data in snapshot.items():
+            if "QUOTE" in data:
+                quote = data["QUOTE"]
+                quote.pop("kind", None)
+                self.quotes[symbol] = quote
+
+            if "ORDERBOOK" in data:
+                book = data["ORDERBOOK"]
+                book.pop("symbol", None)
+                book.pop("kind", None)
+                self.books[symbol] = book
+
+            if "TICK" in data:
+                tick = data["TICK"]
+                self.last_price[symbol] = float(tick['last'].values[0])
+
+    # ---------------------------------------
+    def _add_indicator(self, symbol, name, indicator, on="bar"):
+        """ register a streaming indicator and seed it with the
+        bars/ticks already available for the symbol """
+        data = self.ticks if on == "tick" else self.bars
+        with self._indicators_lock:
+            if not data.empty:
+                data = Instrument._get_symbol_dataframe(data, symbol)
+                for timestamp, row in zip(
+                        data.index, data.to_dict(orient='records')):
+                    indicator.update(row, None if on == "tick" else timestamp)
+
+            self.indicators.setdefault(str(symbol), {})[name] = (on, indicator)
+
+    # ---------------------------------------
+    def _set_features(self, symbol, features):
+        """ assign a FeatureSet to the symbol """
+        self.features[str(symbol)] = [features, {}]
+
+    # ---------------------------------------
+    def _get_features(self, instrument, names=None):
+        """ evaluate the symbol's features (values are cached
+        until the symbol's next bar) """
+        if str(instrument) not in self.features:
+            return None
+        features, cache = self.features[str(instrument)]
+        return features.evaluate(instrument.get_bars, names, cache)
+
+    # ---------------------------------------
+    def store_features(self, features):
+        """Pre-compute a FeatureSet over the entire backtest history
+        (call it in ``on_start``). Features are stored on disk and re-used
+        by future backtests as long as the history doesn't change.
+        ``get_bars()`` includes them as columns (multi-column features
+        are named ``<name>_<column>``). Ignored in live mode.
+        Not available for tick, volume and dollar bars ("K", "V" and "$"
+        resolutions), which are built from ticks while backtesting.
+
+        :Parameters:
+            features : FeatureSet
+                The features to store
+        """
+        if self.resolution[-1] in ("K", "V", "$"):
+            raise ValueError("Features can't be stored for %s bars (only "
+                             "for time-based resolutions)" % self.resolution)
+
+        if not self.backtest:
+            return
+
+        store_path = self.args["featurestore"]
+        if store_path is None:
+            store_path = os.path.join(self.backtest_csv if self.backtest_csv
+                                      else path['caller'], ".features")
+        self._feature_store = (FeatureStore(store_path), features)
+
+    # ---------------------------------------
+    def _load_stored_features(self, history):
+        """ get stored features for every symbol's history """
+        if self._feature_store is None or history.empty:
+            return
+
+        store, features = self._feature_store
+        for symbol in history['symbol'].unique():
+            bars = history[history['symbol'] == symbol]
+            stored = store.get(features, bars, symbol, self.resolution)
+
+            # unique and sorted, so bars can be matched by slicing
+            stored = stored[~stored.index.duplicated(keep='last')]
+            self._stored_features[str(symbol)] = stored.sort_index()
+
+    # ---------------------------------------
+    def _add_stored_features(self, df, symbol):
+        """ add stored features (up to the current bar) to bars """
+        if str(symbol) not in self._stored_features or df.empty:
+            return df
+
+        # only the stored rows within the bars' time range
+        stored = self._stored_features[str(symbol)]
+        start, end = stored.index.searchsorted(
+            [df.index.min(), df.index.max()])
+        return df.join(stored.iloc[start:end + 1], rsuffix='_feature')
+
+    # ---------------------------------------
+    def _reset_features(self, symbol, symbol_group):
+        """ drop cached feature values on a new bar """
+        for owner in set((symbol, symbol_group)):
+            if owner in self.features:
+                self.features[owner][1] = {}
+
+    # ---------------------------------------
+    def _get_latest_bars(self, bar):
+        """ the tail of self.bars that a new bar can have been
+        resampled into (one resolution period back) """
+        try:
+            since = bar.index[-1] - pd.tseries.frequencies.to_offset(
+                self.resolution)
+            return self.bars.iloc[self.bars.index.searchsorted(since):]
+        except Exception as e:
+            return self.bars
+
+    # ---------------------------------------
+    def _update_indicators(self, symbol, symbol_group, data, on="bar"):
+        """ feed the latest bar/tick to the symbol's streaming indicators
+        (a bar with an unchanged timestamp revises the last value).
+        ``data`` only needs to include the latest (resampled) bars """
+        if not self.indicators:
+            return
+
+        for owner in set((symbol, symbol_group)):
+            if owner not in self.indicators:
+                continue
+
+            latest = data
+            if on == "bar":
+                latest = Instrument._get_symbol_dataframe(data, owner)[-1:]
+            if latest.empty:
+                continue
+
+            row = latest.to_dict(orient='records')[0]
+            timestamp = None if on == "tick" else latest.index[0]
+
+            with self._indicators_lock:
+                for kind, indicator in self.indicators[owner].values():
+                    if kind == on:
+                        indicator.update(row, timestamp)
+
     # ---------------------------------------
     @staticmethod
     def _get_window_per_symbol(df, window):
@@ -728,15 +1004,17 @@ class Algo(Broker):
 
     # ---------------------------------------
     @asynctools.multitasking.task
+    @metrics.timed(_HANDLER_SECONDS.labels("tick"))
+    @metrics.traced
     def _tick_handler(self, tick, stale_tick=False):
-        self._cancel_expired_pending_orders()
-
         # tick symbol
         symbol = tick['symbol'].values
         if len(symbol) == 0:
             return
         symbol = symbol[0]
         self.last_price[symbol] = float(tick['last'].values[0])
+        if self.backtest:
+            self.ledger.update_price(symbol, self.last_price[symbol])
 
         # work on copy
         self_ticks = self.ticks.copy()
@@ -745,7 +1023,8 @@ class Algo(Broker):
         if self.record_ts is None:
             self.record_ts = tick.index[0]
 
-        if self.resolution[-1] not in ("S", "K", "V"):
+        if self.resolution[-1] not in ("S", "K", "V", "$") or \
+                self._tick_bar_builders is not None:
             if self.threads == 0:
                 self.ticks = self._update_window(
                     self.ticks, tick, window=self.tick_window)
@@ -754,6 +1033,14 @@ class Algo(Broker):
                     self_ticks, tick, window=self.tick_window)
                 self.ticks = self._thread_safe_merge(
                     symbol, self.ticks, self_ticks)  # assign back
+
+            # tick/volume/dollar bars: build incrementally
+            if self._tick_bar_builders is not None:
+                bar = self._build_tick_bar(symbol, tick)
+                if bar is not None:
+                    self.record_ts = tick.index[0]
+                    self._base_bar_handler(bar)
+                    self.record(bar)
         else:
             self.ticks = self._update_window(self.ticks, tick)
             # bars = tools.resample(self.ticks, self.resolution)
@@ -781,6 +1068,17 @@ class Algo(Broker):
             self.record(bars[-1:])
 
         if not stale_tick:
+            if self.bar_timer is not None:
+                size = tick['lastsize'].values[0]
+                self.bar_timer.update(
+                    symbol, tick.index[0].timestamp(), self.last_price[symbol],
+                    0 if pd.isnull(size) else float(size),
+                    symbol_group=tick['symbol_group'].values[0],
+                    asset_class=tick['asset_class'].values[0])
+
+            self._update_indicators(symbol, tick['symbol_group'].values[0],
+                                    tick, on="tick")
+
             if self.ticks[(self.ticks['symbol'] == symbol) | (
                     self.ticks['symbol_group'] == symbol)].empty:
                 return
@@ -788,6 +1086,105 @@ class Algo(Broker):
             if tick_instrument:
                 self.on_tick(tick_instrument)
 
+    # ---------------------------------------
+    def _on_bar_close(self, symbol, start, bar):
+        """ called (by the bar timer) at the boundary of the symbol's
+        current minute: passes the bar built from its ticks to the bar
+        handler, instead of waiting for the blotter's bar (which is only
+        sent once the next minute's first tick arrives) """
+        index = pd.DatetimeIndex([pd.Timestamp(start, unit='s', tz='UTC')])
+        bar = pd.DataFrame(index=index.tz_convert(self.timezone),
+                           data=[dict(bar, symbol=symbol)])
+        bar.index.name = 'datetime'
+        self._bar_handler(tools.force_options_columns(bar))
+
+    # ---------------------------------------
+    def _update_resolutions(self, bars):
+        """ aggregate new bars into the additional resolutions """
+        if not self.resolutions or bars.empty:
+            return
+
+        for timestamp, bar in zip(bars.index,
+                                  bars.to_dict(orient='records')):
+            for res, resamplers in self.resolutions.items():
+                symbol = bar['symbol']
+                if symbol not in resamplers:
+                    resamplers[symbol] = tools.BarResampler(
+                        res, window=self.bar_window)
+                resamplers[symbol].update(bar, timestamp)
+
+    # ---------------------------------------
+    def _update_continuous(self, bars, revised=False):
+        """ stitch new futures bars into their group's continuous
+        contract, at the algo's resolution (streamed 1-minute bars are
+        aggregated) and return the groups whose continuous contract
+        got a new bar (``revised=True`` replaces the last added bars
+        with the re-sent, updated bars) """
+        if not self.continuous or bars.empty or \
+                'asset_class' not in bars.columns:
+            return []
+
+        groups = []
+        bars = bars[bars['asset_class'] == "FUT"]
+        for timestamp, bar in zip(bars.index,
+                                  bars.to_dict(orient='records')):
+            group = bar['symbol_group']
+            if group not in self.continuous_contracts:
+                self.continuous_contracts[group] = \
+                    futures.ContinuousContract(
+                        group, maxlen=self.bar_window,
+                        resolution=self.resolution)
+
+            contract = self.continuous_contracts[group]
+            if revised:
+                contract.revise(timestamp, bar)
+            elif contract.add(timestamp, bar) is not None:
+                groups.append(group)
+        return groups
+
+    # ---------------------------------------
+    def _get_resolution_bars(self, symbol, resolution, lookback=None):
+        """ bars of an additional resolution """
+        resolution = resolution.upper().replace("MIN", "T")
+        if resolution not in self.resolutions:
+            raise ValueError("Resolution %s isn't available (use the "
+                             "algo's resolutions parameter)" % resolution)
+
+        resampler = self.resolutions[resolution].get(str(symbol))
+        if resampler is None:
+            return pd.DataFrame()
+        return resampler.to_dataframe(lookback)
+
+    # ---------------------------------------
+    def _build_tick_bar(self, symbol, tick):
+        """ add a tick to the symbol's bar builder and return
+        the completed bar (same as tools.resample) or None """
+        if symbol not in self._tick_bar_builders:
+            self._tick_bar_builders[symbol] = tools.TickBarBuilder(
+                self.resolution)
+
+        bar = self._tick_bar_builders[symbol].update(
+            tick.to_dict(orient='records')[0], tick.index[0])
+        if bar is None:
+            return None
+
+        bar = pd.DataFrame([bar]).set_index('datetime')
+        for col in ('symbol', 'symbol_group', 'asset_class'):
+            bar[col] = tick[col].values[0]
+
+        try:
+            bar.index = bar.index.tz_convert(self.timezone)
+        except Exception as e:
+            bar.index = bar.index.tz_localize('UTC').tz_convert(self.timezone)
+
+        # cleanup (as tools.resample)
+        bar.dropna(inplace=True, subset=[
+            'open', 'high', 'low', 'close', 'volume'])
+        if symbol[-3:] in ("OPT", "FOP"):
+            bar.dropna(inplace=True)
+
+        return None if bar.empty else bar
+
     # ---------------------------------------
     def _base_bar_handler(self, bar):
         """ non threaded bar handler (called by threaded _tick_handler) """
@@ -801,7 +1198,7 @@ class Algo(Broker):
         is_tick_or_volume_bar = False
         handle_bar = True
 
-        if self.resolution[-1] in ("S", "K", "V"):
+        if self.resolution[-1] in ("S", "K", "V", "$"):
             is_tick_or_volume_bar = True
             handle_bar = self._caller("_tick_handler")
 
@@ -831,6 +1228,13 @@ class Algo(Broker):
         if self.threads > 0:
             self.bars = self._thread_safe_merge(symbol, self.bars, self_bars)
 
+        self._update_indicators(
+            symbol, bar['symbol_group'].values[0],
+            bar if is_tick_or_volume_bar else self._get_latest_bars(bar),
+            on="bar")
+        self._update_resolutions(bar)
+        self._reset_features(symbol, bar['symbol_group'].values[0])
+
         # optimize pandas
         if len(self.bars) == 1:
             self.bars['symbol'] = self.bars['symbol'].astype('category')
@@ -847,6 +1251,14 @@ class Algo(Broker):
             newbar = self.bar_hashes[symbol] != this_bar_hash
         self.bar_hashes[symbol] = this_bar_hash
 
+        # continuous futures contracts
+        continuous = self._update_continuous(bar, revised=not newbar)
+
+        # fill simulated orders on the new bar's open
+        if newbar and self.backtest:
+            self.ledger.fill_pending(symbol, float(bar['open'].values[-1]))
+            self.ledger.update_price(symbol, float(bar['close'].values[-1]))
+
         if newbar and handle_bar:
             if self.bars[(self.bars['symbol'] == symbol) | (
                     self.bars['symbol_group'] == symbol)].empty:
@@ -858,8 +1270,13 @@ class Algo(Broker):
                 # if self.resolution[-1] not in ("S", "K", "V"):
                 self.record(bar)
 
+                if continuous:
+                    self.on_continuous_bar(bar_instrument)
+
     # ---------------------------------------
     @asynctools.multitasking.task
+    @metrics.timed(_HANDLER_SECONDS.labels("bar"))
+    @metrics.traced
     def _bar_handler(self, bar):
         """ threaded version of _base_bar_handler (called by blotter's) """
         self._base_bar_handler(bar)
@@ -19,17 +19,32 @@
 # limitations under the License.
 #
 
-from threading import Thread, Semaphore
+import heapq
+import logging
+import queue
+
+from concurrent.futures import Future
+from itertools import count
+from threading import Thread, Semaphore, Condition, Lock
 from multiprocessing import Process, cpu_count
 from sys import exit as sysexit, version_info as sys_version_info
 from os import _exit as osexit
 from time import sleep, time
 
+from qtpylib import metrics
+
 # =============================================
 # check min, python version
 if sys_version_info < (3, 4):
     raise SystemError("QTPyLib requires Python version >= 3.4")
 # =============================================
+# task backlog metrics
+_TASKS_QUEUED = metrics.gauge(
+    "qtpylib_tasks_queued", "Tasks waiting for a free pool slot", ("pool",))
+_TASKS_RUNNING = metrics.gauge(
+    "qtpylib_tasks_running", "Tasks currently running", ("pool",))
+
+# =============================================
 
 
 class multitasking():
@@ -90,9 +105,14 @@ class multitasking():
         if not cls.__POOLS__:
             cls.createPool()
 
-        def _run_via_pool(*args, **kwargs):
-            with cls.__POOLS__[cls.__POOL_NAME__]['pool']:
-                return callee(*args, **kwargs)
+        def _run_via_pool(pool_name, *args, **kwargs):
+            with cls.__POOLS__[pool_name]['pool']:
+                _TASKS_QUEUED.labels(pool_name).dec()
+                _TASKS_RUNNING.labels(pool_name).inc()
+                try:
+                    return callee(*args, **kwargs)
+                finally:
+                    _TASKS_RUNNING.labels(pool_name).dec()
 
         def async_method(*args, **kwargs):
             # no threads
@@ -101,8 +121,11 @@ class multitasking():
 
             # has threads
             if not cls.__KILL_RECEIVED__:
-                task = cls.__POOLS__[cls.__POOL_NAME__]['engine'](
-                    target=_run_via_pool, args=args, kwargs=kwargs, daemon=False)
+                pool_name = cls.__POOL_NAME__
+                _TASKS_QUEUED.labels(pool_name).inc()
+                task = cls.__POOLS__[pool_name]['engine'](
+                    target=_run_via_pool, args=(pool_name,) + args,
+                    kwargs=kwargs, daemon=False)
                 cls.__TASKS__.append(task)
                 task.start()
                 return task
@@ -191,3 +214,316 @@ class RecurringTask(Thread):
     def stop(self):
         """Stop the recurring task."""
         self._running = False
+
+# =============================================
+
+
+class Scheduler(Thread):
+    """Runs functions at given (wall clock) times from a single thread.
+
+    Pending calls are kept in a heap ordered by their deadline: the thread
+    sleeps until the earliest one (no polling), then spins for the last
+    millisecond so calls fire within microseconds of their deadline.
+    """
+
+    SPIN_SEC = 0.001
+
+    def __init__(self, name="Scheduler"):
+        super().__init__(name=name, daemon=True)
+        self._heap = []  # [(deadline, sequence, func, args, kwargs)]
+        self._cancelled = set()
+        self._sequence = count()
+        self._condition = Condition()
+        self._running = True
+        self.log = logging.getLogger(__name__)
+        self.start()
+
+    def __repr__(self):
+        return 'Scheduler({} pending)'.format(len(self._heap))
+
+    # ---------------------------------------
+    def call_at(self, when, func, *args, **kwargs):
+        """Call ``func(*args, **kwargs)`` at a given time
+
+        :Parameters:
+            when : float / datetime
+                Unix timestamp or (timezone aware) datetime
+
+        :Returns:
+            event : tuple
+                Event id (to use with ``cancel()``)
+        """
+        if not isinstance(when, (int, float)):
+            when = when.timestamp()
+
+        with self._condition:
+            event = (when, next(self._sequence))
+            heapq.heappush(self._heap, event + (func, args, kwargs))
+            # wake up if this is now the earliest deadline
+            if self._heap[0][:2] == event:
+                self._condition.notify()
+        return event
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """ Call ``func(*args, **kwargs)`` in ``delay`` seconds """
+        return self.call_at(time() + delay, func, *args, **kwargs)
+
+    def cancel(self, event):
+        """ Cancel a pending call (by the event returned by ``call_at``) """
+        with self._condition:
+            self._cancelled.add(event)
+
+    def stop(self):
+        """ Stop the scheduler (pending calls are dropped) """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    # ---------------------------------------
+    def _next(self):
+        """ wait for (and pop) the next due call """
+        with self._condition:
+            while self._running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                if self._heap[0][:2] in self._cancelled:
+                    self._cancelled.discard(heapq.heappop(self._heap)[:2])
+                    continue
+
+                remaining = self._heap[0][0] - time()
+                if remaining <= 0:
+                    return heapq.heappop(self._heap)
+                if remaining > self.SPIN_SEC:
+                    self._condition.wait(remaining - self.SPIN_SEC)
+                    continue
+
+                # spin (without the lock) for the last millisecond
+                self._condition.release()
+                try:
+                    while time() < self._heap[0][0]:
+                        pass
+                finally:
+                    self._condition.acquire()
+        return None
+
+    def run(self):
+        while self._running:
+            event = self._next()
+            if event is None:
+                break
+            try:
+                event[2](*event[3], **event[4])
+            except Exception as e:
+                self.log.exception("Scheduled call failed: %s", e)
+
+
+# =============================================
+
+class BarTimer():
+    """Closes time-based bars at their (wall clock) boundary, even when
+    no tick arrives after it.
+
+    Ticks are aggregated into each symbol's current bar, and a single
+    scheduler call is armed per bar: at the boundary the bar is passed to
+    ``callback(symbol, start, bar)`` (from the scheduler's thread). Symbols
+    without new ticks have nothing armed, so idle periods cost nothing.
+
+    Late ticks of a bar that was already replaced or closed (eg. delivered
+    out of order by threaded handlers) are ignored.
+
+    :Parameters:
+        interval : float
+            Bar length in seconds
+        callback : callable
+            Called with the symbol, the bar's start (unix timestamp) and the
+            bar (dict with open, high, low, close, volume and the last
+            tick's extra fields)
+
+    :Optional:
+        scheduler : Scheduler
+            Scheduler to use (default: a new one)
+    """
+
+    def __init__(self, interval, callback, scheduler=None):
+        self.interval = float(interval)
+        self.callback = callback
+        self.scheduler = scheduler if scheduler is not None else \
+            Scheduler(name="bar_timer")
+        self._bars = {}  # {symbol: (start, bar, scheduler event)}
+        self._closed = {}  # {symbol: start of the last closed bar}
+        self._lock = Lock()
+        self.log = logging.getLogger(__name__)
+
+    # ---------------------------------------
+    def update(self, symbol, timestamp, price, size=0, **fields):
+        """Add a tick to the symbol's current bar
+
+        :Parameters:
+            symbol : str
+                Tick's symbol
+            timestamp : float
+                Tick's unix timestamp
+            price : float
+                Tick's price
+
+        :Optional:
+            size : float
+                Tick's size
+            fields : mixed
+                Extra fields to pass along with the bar
+
+        :Returns:
+            added : bool
+                ``False`` if the tick was ignored (its bar is gone)
+        """
+        start = timestamp - timestamp % self.interval
+        closed = None
+
+        with self._lock:
+            current = self._bars.get(symbol)
+            if (current is not None and start < current[0]) or \
+                    start <= self._closed.get(symbol, float("-inf")):
+                self.log.debug("Ignoring late %s tick (%s)", symbol,
+                               timestamp)
+                return False
+
+            if current is not None and current[0] == start:
+                bar = current[1]
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+                bar["volume"] += size
+                bar.update(fields)
+                return True
+
+            # tick of a later bar arrived before the timer fired
+            if current is not None:
+                self.scheduler.cancel(current[2])
+                self._closed[symbol] = current[0]
+                closed = current
+
+            bar = dict(fields, open=price, high=price, low=price,
+                       close=price, volume=size)
+            event = self.scheduler.call_at(
+                start + self.interval, self._close, symbol, start)
+            self._bars[symbol] = (start, bar, event)
+
+        if closed is not None:
+            self.callback(symbol, closed[0], closed[1])
+        return True
+
+    def _close(self, symbol, start):
+        with self._lock:
+            current = self._bars.get(symbol)
+            if current is None or current[0] != start:
+                return
+            del self._bars[symbol]
+            self._closed[symbol] = start
+        self.callback(symbol, start, current[1])
+
+    def stop(self):
+        """ Stop the timer (open bars are dropped) """
+        self.scheduler.stop()
+
+
+# =============================================
+
+class TokenBucket():
+    """Rate limiter: allows ``rate`` tokens per second on average,
+    and bursts of up to ``capacity`` tokens.
+
+    :Parameters:
+        rate : float
+            Tokens added per second
+
+    :Optional:
+        capacity : float
+            Bucket size (default: rate)
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self._updated = time()
+
+    def _refill(self):
+        now = time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens=1):
+        """ seconds until ``tokens`` are available """
+        self._refill()
+        return max(0., (min(tokens, self.capacity) - self.tokens) / self.rate)
+
+    def acquire(self, tokens=1):
+        """ take tokens (sleeps until they're available) """
+        delay = self.wait_time(tokens)
+        while delay > 0:
+            sleep(delay)
+            delay = self.wait_time(tokens)
+        self.tokens -= min(tokens, self.capacity)
+
+
+# =============================================
+
+class PacedDispatcher(Thread):
+    """Runs submitted calls in order, from a single thread,
+    paced by a ``TokenBucket``.
+
+    ``submit()`` returns immediately with a
+    ``concurrent.futures.Future`` of the call's result.
+
+    :Parameters:
+        rate : float
+            Tokens (eg. API messages) per second
+
+    :Optional:
+        capacity : float
+            Max. burst (default: rate)
+    """
+
+    def __init__(self, rate, capacity=None, name="PacedDispatcher"):
+        super().__init__(name=name, daemon=True)
+        self.bucket = TokenBucket(rate, capacity)
+        self.queue = queue.Queue()
+        self.log = logging.getLogger(__name__)
+        self.start()
+
+    def __repr__(self):
+        return 'PacedDispatcher({}/sec, {} queued)'.format(
+            self.bucket.rate, self.queue.qsize())
+
+    def submit(self, func, args=(), kwargs=None, cost=1):
+        """Queue ``func(*args, **kwargs)``
+
+        :Optional:
+            cost : float
+                Tokens the call uses (default: 1)
+
+        :Returns:
+            future : concurrent.futures.Future
+                The call's result
+        """
+        future = Future()
+        self.queue.put((future, func, args, kwargs or {}, cost))
+        return future
+
+    def run(self):
+        while True:
+            future, func, args, kwargs, cost = self.queue.get()
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.bucket.acquire(cost)
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except Exception as e:
+                    self.log.exception("Dispatched call failed: %s", e)
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
@@ -31,6 +31,7 @@ import tempfile
 import time
 import glob
 import subprocess
+import threading
 
 from datetime import datetime
 from abc import ABCMeta
@@ -53,7 +54,7 @@ from ezibpy import (
 )
 
 from qtpylib import (
-    tools, asynctools, path, futures, __version__
+    tools, asynctools, metrics, sharedmem, path, futures, __version__
 )
 
 # =============================================
@@ -74,11 +75,32 @@ __threads__ = tools.read_single_argv("--threads")
 __threads__ = __threads__ if tools.is_number(__threads__) else None
 asynctools.multitasking.createPool(__name__, __threads__)
 
+# =============================================
+# runtime metrics
+_TICKS_RECEIVED = metrics.counter(
+    "qtpylib_blotter_ticks_total", "Ticks received from IB", ("symbol",))
+_BROADCASTS = metrics.counter(
+    "qtpylib_blotter_broadcasts_total", "Messages broadcast to algos", ("kind",))
+_DB_INSERT_SECONDS = metrics.histogram(
+    "qtpylib_blotter_db_insert_seconds", "MySQL insert+commit latency", ("kind",))
+
 # =============================================
 
 cash_ticks = {}
 
 
+# -------------------------------------------
+def _json_default(o):
+    """ json.dumps fallback for numpy int64 values (timestamps) """
+    if isinstance(o, np_int64):
+        try:
+            return pd.to_datetime(o, unit='ms').strftime(
+                ibDataTypes["DATE_TIME_FORMAT_LONG"])
+        except Exception as e:
+            return int(o)
+    raise TypeError
+
+
 class Blotter():
     """Broker class initilizer
 
@@ -112,6 +134,33 @@ class Blotter():
             MySQL server password (default: none)
         dbskip : str
             Skip MySQL logging (default: False)
+        metricsport : int
+            Expose runtime metrics (Prometheus format) on this
+            local HTTP port (default: None = disabled)
+        metricslog : int
+            Log runtime metrics every N seconds (default: 0 = disabled)
+        trace : bool
+            Stamp market data with monotonic stage timestamps
+            for end-to-end latency tracing (default: False)
+        snapshotport : str
+            ZeroMQ port serving the latest market data
+            snapshot (default: zmqport + 1)
+        shm : bool
+            Also publish ticks/bars to per-symbol shared memory ring
+            buffers for co-located algos (Python 3.8+, default: False)
+        shmsize : int
+            Number of ticks/bars kept per ring buffer (default: 4096)
+        zmqbind : str
+            ZeroMQ endpoint to publish on (tcp://, ipc:// or inproc://)
+            (default: tcp://*:zmqport)
+        zmqconnect : str
+            ZeroMQ endpoint clients connect to
+            (default: tcp://127.0.0.1:zmqport)
+        zmqhwm : int
+            Send/receive high water mark (messages queued per
+            subscriber before dropping) (default: None = ZeroMQ's 1000)
+        zmqiothreads : int
+            ZeroMQ I/O threads (default: 1)
     """
 
     __metaclass__ = ABCMeta
@@ -120,7 +169,10 @@ class Blotter():
                  ibport=4001, ibclient=999, ibserver="localhost",
                  dbhost="localhost", dbport="3306", dbname="qtpy",
                  dbuser="root", dbpass="", dbskip=False, orderbook=False,
-                 zmqport="12345", zmqtopic=None, **kwargs):
+                 zmqport="12345", zmqtopic=None, metricsport=None,
+                 metricslog=0, trace=False, snapshotport=None, shm=False,
+                 shmsize=4096, zmqbind=None, zmqconnect=None, zmqhwm=None,
+                 zmqiothreads=1, **kwargs):
 
         # whats my name?
         self.name = str(self.__class__).split('.')[-1].split("'")[0].lower()
@@ -151,6 +203,19 @@ class Blotter():
         self.context = None
         self.socket = None
         self.ibConn = None
+        self.metrics = None
+
+        # latest message per symbol/kind (served as snapshots)
+        self._seq = 0
+        self._latest = {}
+        self._broadcast_lock = threading.Lock()
+        self._snapshot_thread = None
+
+        # shared memory rings {symbol: RingWriter}
+        self._rings = {}
+
+        # set once sockets are bound (used by embedded mode)
+        self._ready = threading.Event()
 
         self.symbol_ids = {}  # cache
         self.cash_ticks = cash_ticks  # outside cache
@@ -222,6 +287,8 @@ class Blotter():
                 pass
 
         if terminate:
+            for ring in self._rings.values():
+                ring.close()
             os._exit(0)
 
     # -------------------------------------------
@@ -234,12 +301,17 @@ class Blotter():
     def _blotter_file_running():
         try:
             # not sure how this works on windows...
-            command = 'pgrep -f ' + sys.argv[0]
+            # (no shell, whose command line would match too)
+            if not sys.argv[0]:
+                return False
             process = subprocess.Popen(
-                command, shell=True, stdout=subprocess.PIPE)
+                ['pgrep', '-f', sys.argv[0]], stdout=subprocess.PIPE)
             stdout_list = process.communicate()[0].decode('utf-8').split("\n")
             stdout_list = list(filter(None, stdout_list))
-            return len(stdout_list) > 0
+
+            # this process (eg. an algo with an embedded blotter)
+            # isn't another running blotter
+            return len(set(stdout_list) - {str(os.getpid())}) > 0
         except Exception as e:
             return False
 
@@ -304,6 +376,33 @@ class Blotter():
         parser.add_argument('--dbskip', default=self.args['dbskip'],
                             required=False, help='Skip MySQL logging (flag)',
                             action='store_true')
+        parser.add_argument('--metricsport', default=self.args['metricsport'],
+                            help='Expose runtime metrics on this HTTP port',
+                            required=False)
+        parser.add_argument('--metricslog', default=self.args['metricslog'],
+                            help='Log runtime metrics every N seconds',
+                            required=False)
+        parser.add_argument('--snapshotport', default=self.args['snapshotport'],
+                            help='ZeroMQ snapshot port (default: zmqport+1)',
+                            required=False)
+        parser.add_argument('--zmqbind', default=self.args['zmqbind'],
+                            help='ZeroMQ endpoint to publish on', required=False)
+        parser.add_argument('--zmqconnect', default=self.args['zmqconnect'],
+                            help='ZeroMQ endpoint for clients', required=False)
+        parser.add_argument('--zmqhwm', default=self.args['zmqhwm'],
+                            help='ZeroMQ send/receive high water mark',
+                            required=False)
+        parser.add_argument('--zmqiothreads', default=self.args['zmqiothreads'],
+                            help='ZeroMQ I/O threads', required=False)
+        parser.add_argument('--shm', default=self.args['shm'],
+                            required=False, action='store_true',
+                            help='Publish ticks/bars to shared memory (flag)')
+        parser.add_argument('--shmsize', default=self.args['shmsize'],
+                            help='Ticks/bars kept per shared memory ring',
+                            required=False)
+        parser.add_argument('--trace', default=self.args['trace'],
+                            required=False, action='store_true',
+                            help='Stamp market data with latency traces (flag)')
 
         # only return non-default cmd line args
         # (meaning only those actually given)
@@ -315,6 +414,9 @@ class Blotter():
     # -------------------------------------------
     def ibCallback(self, caller, msg, **kwargs):
 
+        # monotonic receive time (for end-to-end latency tracing)
+        received = time.monotonic() if self.args["trace"] else None
+
         if caller == "handleConnectionClosed":
             self.log_blotter.info("Lost conncetion to Interactive Brokers...")
             self._on_exit(terminate=False)
@@ -324,16 +426,16 @@ class Blotter():
             self.on_ohlc_received(msg, kwargs)
 
         elif caller == "handleTickString":
-            self.on_tick_string_received(msg.tickerId, kwargs)
+            self.on_tick_string_received(msg.tickerId, kwargs, received)
 
         elif caller == "handleTickPrice" or caller == "handleTickSize":
-            self.on_quote_received(msg.tickerId)
+            self.on_quote_received(msg.tickerId, received)
 
         elif caller in "handleTickOptionComputation":
-            self.on_option_computation_received(msg.tickerId)
+            self.on_option_computation_received(msg.tickerId, received)
 
         elif caller == "handleMarketDepth":
-            self.on_orderbook_received(msg.tickerId)
+            self.on_orderbook_received(msg.tickerId, received)
 
         elif caller == "handleError":
             # don't display connection errors on ctrl+c
@@ -401,7 +503,7 @@ class Blotter():
 
     # -------------------------------------------
     @asynctools.multitasking.task
-    def on_tick_string_received(self, tickerId, kwargs):
+    def on_tick_string_received(self, tickerId, kwargs, received=None):
 
         # kwargs is empty
         if not kwargs:
@@ -464,11 +566,11 @@ class Blotter():
             data = tools.force_options_columns(data)
 
             # print('.', end="", flush=True)
-            self.on_tick_received(data)
+            self.on_tick_received(self._traced(data, received))
 
     # -------------------------------------------
     @asynctools.multitasking.task
-    def on_quote_received(self, tickerId):
+    def on_quote_received(self, tickerId, received=None):
         try:
 
             symbol = self.ibConn.tickerSymbol(tickerId)
@@ -493,6 +595,7 @@ class Blotter():
             quote['ask'] = tools.to_decimal(quote['ask'])
             quote['last'] = tools.to_decimal(quote['last'])
             quote["kind"] = "QUOTE"
+            quote = self._traced(quote, received)
 
             # cash markets do not get RTVOLUME (handleTickString)
             if quote["asset_class"] == "CSH":
@@ -516,7 +619,7 @@ class Blotter():
 
     # -------------------------------------------
     @asynctools.multitasking.task
-    def on_option_computation_received(self, tickerId):
+    def on_option_computation_received(self, tickerId, received=None):
         # try:
         symbol = self.ibConn.tickerSymbol(tickerId)
 
@@ -575,6 +678,8 @@ class Blotter():
             tick['timestamp'] = datetime.utcnow().strftime(
                 ibDataTypes['DATE_TIME_FORMAT_LONG_MILLISECS'])
 
+        tick = self._traced(tick, received)
+
         # treat as tick if last/volume changed
         if tick['last'] != prev_last or tick['lastsize'] != prev_lastsize:
             tick["kind"] = "TICK"
@@ -590,7 +695,7 @@ class Blotter():
 
     # -------------------------------------------
     @asynctools.multitasking.task
-    def on_orderbook_received(self, tickerId):
+    def on_orderbook_received(self, tickerId, received=None):
         orderbook = self.ibConn.marketDepthData[tickerId].dropna(
             subset=['bid', 'ask']).fillna(0).to_dict(orient='list')
 
@@ -600,6 +705,7 @@ class Blotter():
         orderbook["symbol_group"] = tools.gen_symbol_group(symbol)
         orderbook["asset_class"] = tools.gen_asset_class(symbol)
         orderbook["kind"] = "ORDERBOOK"
+        orderbook = self._traced(orderbook, received)
 
         # broadcast
         self.broadcast(orderbook, "ORDERBOOK")
@@ -629,6 +735,8 @@ class Blotter():
         if symbol not in self._bars:
             self._bars[symbol] = self._bars['~']
 
+        _TICKS_RECEIVED.labels(symbol).inc()
+
         # send tick to message self.broadcast
         tick["kind"] = "TICK"
         self.broadcast(tick, "TICK")
@@ -666,6 +774,10 @@ class Blotter():
             bar["timestamp"] = self._bars[symbol].index[0].strftime(
                 ibDataTypes["DATE_TIME_FORMAT_LONG"])
 
+            if metrics.TRACE_KEY in tick:
+                bar = self._traced(
+                    bar, tick[metrics.TRACE_KEY].get("callback"))
+
             bar["kind"] = "BAR"
             self.broadcast(bar, "BAR")
             self.log2db(bar, "BAR")
@@ -674,26 +786,162 @@ class Blotter():
             _raw_bars.drop(_raw_bars.index[:], inplace=True)
             self._raw_bars[symbol] = _raw_bars
 
+    # -------------------------------------------
+    @staticmethod
+    def _traced(data, received):
+        """ returns a copy of data stamped with callback/built times """
+        if received is None:
+            return data
+        data = dict(data)
+        data[metrics.TRACE_KEY] = {"callback": received}
+        metrics.trace_stamp(data[metrics.TRACE_KEY], "built")
+        return data
+
     # -------------------------------------------
     def broadcast(self, data, kind):
-        def int64_handler(o):
-            if isinstance(o, np_int64):
-                try:
-                    return pd.to_datetime(o, unit='ms').strftime(
-                        ibDataTypes["DATE_TIME_FORMAT_LONG"])
-                except Exception as e:
-                    return int(o)
-            raise TypeError
+        metrics.trace_stamp(data.get(metrics.TRACE_KEY), "broadcast")
 
-        string2send = "%s %s" % (
-            self.args["zmqtopic"], json.dumps(data, default=int64_handler))
+        # sequence + latest state are updated together with the
+        # send so snapshots are consistent with the stream
+        # (this also serializes access to the non thread-safe socket)
+        with self._broadcast_lock:
+            self._seq += 1
+            data["_seq"] = self._seq
+            self._latest.setdefault(data["symbol"], {})[kind] = data
+
+            if self.args["shm"] and kind in sharedmem.KINDS:
+                self._write_ring(data, kind)
+
+            string2send = "%s %s" % (
+                self.args["zmqtopic"], json.dumps(data, default=_json_default))
+
+            # print(kind, string2send)
+            try:
+                self.socket.send_string(string2send)
+                _BROADCASTS.labels(kind).inc()
+            except Exception as e:
+                pass
+
+    # -------------------------------------------
+    def _write_ring(self, data, kind):
+        # options carry more fields than a ring record holds
+        if data["asset_class"] in ("OPT", "FOP"):
+            return
 
-        # print(kind, string2send)
+        symbol = data["symbol"]
         try:
-            self.socket.send_string(string2send)
+            if symbol not in self._rings:
+                self._rings[symbol] = sharedmem.RingWriter(
+                    sharedmem.ring_name(self.name, symbol),
+                    int(self.args["shmsize"]))
+
+            try:
+                timestamp = pd.Timestamp(data["timestamp"])
+            except Exception as e:
+                timestamp = pd.Timestamp(parse_date(data["timestamp"]))
+
+            self._rings[symbol].write(kind, data["_seq"],
+                                      timestamp.value, data)
         except Exception as e:
             pass
 
+    # -------------------------------------------
+    def _zmq_context(self):
+        # shared process-wide context (required for inproc://)
+        return zmq.Context.instance(
+            io_threads=int(self.args.get("zmqiothreads") or 1))
+
+    def _set_hwm(self, sock, option):
+        if self.args.get("zmqhwm") is not None:
+            sock.setsockopt(option, int(self.args["zmqhwm"]))
+
+    def _endpoints(self):
+        """ (bind, connect) endpoints of the market data socket """
+        port = str(self.args['zmqport'])
+        return (self.args.get("zmqbind") or "tcp://*:" + port,
+                self.args.get("zmqconnect") or "tcp://127.0.0.1:" + port)
+
+    def _snapshot_endpoints(self):
+        """ (bind, connect) endpoints of the snapshot socket """
+        bind, connect = self._endpoints()
+        if not bind.startswith("tcp://"):
+            return bind + "_snapshot", connect + "_snapshot"
+
+        if self.args.get("snapshotport") is not None:
+            port = str(self.args["snapshotport"])
+        else:
+            port = str(int(bind.rsplit(":", 1)[1]) + 1)
+        return (bind.rsplit(":", 1)[0] + ":" + port,
+                connect.rsplit(":", 1)[0] + ":" + port)
+
+    # -------------------------------------------
+    def _get_snapshot(self, symbols=None):
+        """ latest quote, tick, in-progress 1T bar and
+        order book per symbol, along with the stream's sequence """
+        with self._broadcast_lock:
+            seq = self._seq
+            data = {symbol: {kind: msg for kind, msg in kinds.items()
+                             if kind != "BAR"}
+                    for symbol, kinds in self._latest.items()
+                    if not symbols or symbol in symbols}
+
+        # replace last completed bar with the in-progress one
+        for symbol in data:
+            try:
+                bars = self._bars[symbol]
+                if bars.empty:
+                    continue
+                bar = bars[-1:].to_dict(orient='records')[0]
+                tick = data[symbol].get("TICK", {})
+                bar["symbol"] = symbol
+                bar["symbol_group"] = tick.get(
+                    "symbol_group", tools.gen_symbol_group(symbol))
+                bar["asset_class"] = tick.get(
+                    "asset_class", tools.gen_asset_class(symbol))
+                bar["timestamp"] = bars.index[-1].strftime(
+                    ibDataTypes["DATE_TIME_FORMAT_LONG"])
+                bar["kind"] = "BAR"
+                data[symbol]["BAR"] = bar
+            except Exception as e:
+                pass
+
+        return {"seq": seq, "symbols": data}
+
+    # -------------------------------------------
+    def _serve_snapshots(self):
+        """ REP loop: request is a comma-separated list
+        of symbols (empty = all), reply is a json snapshot """
+        sock = None
+        while True:
+            try:
+                if sock is None:
+                    sock = self._zmq_context().socket(zmq.REP)
+                    sock.setsockopt(zmq.LINGER, 0)
+                    sock.bind(self._snapshot_endpoints()[0])
+
+                request = sock.recv_string()
+                try:
+                    symbols = [s.strip()
+                               for s in request.split(",") if s.strip()]
+                    reply = json.dumps(self._get_snapshot(symbols),
+                                       default=_json_default)
+                except Exception as e:
+                    reply = json.dumps({"seq": 0, "symbols": {}})
+                sock.send_string(reply)
+
+            except zmq.ContextTerminated:
+                break
+
+            except Exception as e:
+                # a REP socket that failed to reply can't receive
+                # again: start over with a new one
+                self.log_blotter.warning(
+                    "Snapshot server error (restarting): %s", e)
+                if sock is not None:
+                    sock.close()
+                sock = None
+                time.sleep(1)
+
     # -------------------------------------------
     def log2db(self, data, kind):
         if self.args['dbskip'] or len(data["symbol"].split("_")) > 2:
@@ -718,24 +966,25 @@ class Blotter():
                 data["symbol"], dbconn, dbcurr, self.ibConn)
             self.symbol_ids[symbol] = symbol_id
 
-        # insert to db
-        if kind == "TICK":
-            try:
-                mysql_insert_tick(data, symbol_id, dbcurr)
-            except Exception as e:
-                pass
-        elif kind == "BAR":
+        with _DB_INSERT_SECONDS.labels(kind).time():
+            # insert to db
+            if kind == "TICK":
+                try:
+                    mysql_insert_tick(data, symbol_id, dbcurr)
+                except Exception as e:
+                    pass
+            elif kind == "BAR":
+                try:
+                    mysql_insert_bar(data, symbol_id, dbcurr)
+                except Exception as e:
+                    pass
+
+            # commit
             try:
-                mysql_insert_bar(data, symbol_id, dbcurr)
+                dbconn.commit()
             except Exception as e:
                 pass
 
-        # commit
-        try:
-            dbconn.commit()
-        except Exception as e:
-            pass
-
         # disconect from mysql
         if self.threads > 0:
             dbcurr.close()
@@ -754,9 +1003,28 @@ class Blotter():
         # connect to mysql
         self.mysql_connect()
 
-        self.context = zmq.Context(zmq.REP)
+        # expose runtime metrics (once, run() is re-invoked on reconnect)
+        if self.metrics is None:
+            self.metrics = metrics.start(port=self.args['metricsport'],
+                                         log_interval=self.args['metricslog'],
+                                         logger=self.log_blotter)
+
+        # release the endpoint when re-invoked on reconnect
+        if self.socket is not None:
+            self.socket.close(linger=0)
+
+        self.context = self._zmq_context()
         self.socket = self.context.socket(zmq.PUB)
-        self.socket.bind("tcp://*:" + str(self.args['zmqport']))
+        self._set_hwm(self.socket, zmq.SNDHWM)
+        self.socket.bind(self._endpoints()[0])
+
+        # serve snapshots to (re)connecting clients
+        if self._snapshot_thread is None:
+            self._snapshot_thread = threading.Thread(
+                target=self._serve_snapshots, daemon=True)
+            self._snapshot_thread.start()
+
+        self._ready.set()
 
         db_modified = 0
         contracts = []
@@ -883,6 +1151,52 @@ class Blotter():
 
     # -------------------------------------------
     # CLIENT / STATIC
+    # -------------------------------------------
+    def start(self, timeout=30):
+        """Starts the blotter in a background thread (embedded mode)
+        and waits for its sockets to be ready.
+
+        Unless endpoints were set explicitly, the blotter publishes
+        over ``inproc://`` so it can only be streamed from this process.
+
+        :Optional:
+            timeout : int
+                Max seconds to wait for the blotter (default: 30)
+
+        :Returns:
+            thread : Thread
+                The blotter's thread
+
+        Raises ``RuntimeError`` if the blotter fails (eg. another blotter
+        with the same name is running) or isn't ready within ``timeout``.
+        """
+        if self.args.get("zmqbind") is None:
+            endpoint = "inproc://qtpylib_" + self.name
+            self.args["zmqbind"] = self.args["zmqconnect"] = endpoint
+
+        failed = []
+
+        def run():
+            try:
+                self.run()
+            except BaseException as e:
+                # eg. sys.exit() when another blotter is running
+                if self._ready.is_set():
+                    raise
+                failed.append(e)
+                self._ready.set()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Embedded Blotter failed to start "
+                               "(not ready after %s seconds)" % timeout)
+        if failed:
+            raise RuntimeError("Embedded Blotter failed to start (%r)" %
+                               failed[0]) from failed[0]
+        return thread
+
     # -------------------------------------------
     def _fix_history_sequence(self, df, table):
         """ fix out-of-sequence ticks/bars """
@@ -978,7 +1292,7 @@ class Blotter():
         self.mysql_connect()
 
         # --- build query
-        table = 'ticks' if resolution[-1] in ("K", "V", "S") else 'bars'
+        table = 'ticks' if resolution[-1] in ("K", "V", "$", "S") else 'bars'
 
         query = """SELECT tbl.*,
             CONCAT(s.`symbol`, "_", s.`asset_class`) as symbol, s.symbol_group, s.asset_class, s.expiry,
@@ -1021,31 +1335,220 @@ class Blotter():
         # setup dataframe
         return prepare_history(data=data, resolution=resolution, tz=tz, continuous=True)
 
+    # -------------------------------------------
+    def snapshot(self, symbols=None, timeout=1000):
+        """Fetches the latest quote, tick, in-progress bar and order book
+        per symbol from the running Blotter's memory
+
+        :Optional:
+            symbols : list
+                Symbols to fetch (default: all)
+            timeout : int
+                Max milliseconds to wait for the Blotter (default: 1000)
+
+        :Returns:
+            snapshot : dict
+                ``{"seq": last sequence, "symbols": {symbol: {kind: data}}}``
+                or None if the Blotter didn't respond in time
+        """
+        if isinstance(symbols, str):
+            symbols = symbols.split(',')
+
+        sock = self._zmq_context().socket(zmq.REQ)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self._snapshot_endpoints()[1])
+
+        try:
+            sock.send_string(",".join(symbols or []))
+            if sock.poll(timeout, zmq.POLLIN):
+                return json.loads(sock.recv_string())
+        except Exception as e:
+            pass
+        finally:
+            sock.close()
+
+        return None
+
+    # -------------------------------------------
+    @staticmethod
+    def _to_dataframe(data, tz="UTC"):
+        """ convert a TICK/BAR message to a single-row DataFrame """
+        try:
+            data["datetime"] = parse_date(data["timestamp"])
+        except Exception as e:
+            pass
+
+        df = pd.DataFrame(index=[0], data=data)
+        df.set_index('datetime', inplace=True)
+        df.index = pd.to_datetime(df.index, utc=True)
+        df.drop(["timestamp", "kind"], axis=1, inplace=True)
+
+        try:
+            df.index = df.index.tz_convert(tz)
+        except Exception as e:
+            df.index = df.index.tz_localize('UTC').tz_convert(tz)
+
+        # add options columns
+        return tools.force_options_columns(df)
+
+    # -------------------------------------------
+    def _prepare_snapshot(self, snapshot, tz="UTC"):
+        prepared = {}
+        for symbol, kinds in snapshot.items():
+            prepared[symbol] = {}
+            for kind, data in kinds.items():
+                data.pop("_seq", None)
+                data.pop(metrics.TRACE_KEY, None)
+                data.update((k, np_nan) for k, v in data.items() if v is None)
+                if kind in ("TICK", "BAR"):
+                    data = self._to_dataframe(data, tz)
+                prepared[symbol][kind] = data
+        return prepared
+
+    # -------------------------------------------
+    def _attach_rings(self, symbols, rings, seq=None):
+        """ attach to shared memory rings of co-located blotter
+        (symbols without a ring are streamed over ZeroMQ).
+        with ``seq`` (the last sequence received over ZeroMQ), new
+        readers start after it instead of at the rings' head """
+        for symbol in symbols:
+            if symbol in rings:
+                continue
+            try:
+                rings[symbol] = sharedmem.RingReader(
+                    sharedmem.ring_name(self.name, symbol))
+                if seq is not None:
+                    rings[symbol].seek(seq)
+            except Exception as e:
+                pass
+        return rings
+
+    # -------------------------------------------
+    @staticmethod
+    def _record_to_dataframe(symbol, record, tz="UTC"):
+        """ convert a shared memory ring record to a single-row DataFrame """
+        # missing sizes stay NaN (as over zeromq)
+        kind, data = sharedmem.record_values(record)
+        data.update({"symbol": symbol,
+                     "symbol_group": tools.gen_symbol_group(symbol),
+                     "asset_class": tools.gen_asset_class(symbol)})
+
+        df = pd.DataFrame(index=pd.to_datetime(
+            [int(record['timestamp'])], utc=True), data=data)
+        df.index.names = ['datetime']
+        df.index = df.index.tz_convert(tz)
+
+        return kind, tools.force_options_columns(df)
+
     # -------------------------------------------
     def stream(self, symbols, tick_handler=None, bar_handler=None,
-               quote_handler=None, book_handler=None, tz="UTC"):
+               quote_handler=None, book_handler=None, tz="UTC",
+               snapshot_handler=None):
         # load runtime/default data
         if isinstance(symbols, str):
             symbols = symbols.split(',')
         symbols = list(map(str.strip, symbols))
 
         # connect to zeromq self.socket
-        self.context = zmq.Context()
+        self.context = self._zmq_context()
         sock = self.context.socket(zmq.SUB)
+        self._set_hwm(sock, zmq.RCVHWM)
         sock.setsockopt_string(zmq.SUBSCRIBE, "")
-        sock.connect('tcp://127.0.0.1:' + str(self.args['zmqport']))
+        sock.connect(self._endpoints()[1])
+
+        # co-located blotter? read ticks/bars from shared memory
+        rings = {}
+        use_shm = self.args.get("shm") and sharedmem.AVAILABLE
+        if use_shm:
+            self._attach_rings(symbols, rings)
+        rings_checked = time.time()
+
+        # subscribed first, so no message falls between
+        # the snapshot and the deltas that follow it
+        snapshot_seq = 0
+        if snapshot_handler is not None:
+            snapshot = self.snapshot(symbols)
+            if snapshot is not None:
+                snapshot_seq = int(snapshot["seq"])
+                snapshot_handler(
+                    self._prepare_snapshot(snapshot["symbols"], tz))
+        ring_catchup = {symbol: snapshot_seq for symbol in rings}
+
+        # last sequence received (rings attached later start after it)
+        last_seq = snapshot_seq
+
+        def read_rings():
+            received = 0
+            for symbol, ring in list(rings.items()):
+                if ring.closed:
+                    # blotter restarted: back to zmq until re-attached
+                    ring.close()
+                    del rings[symbol]
+                    ring_catchup.pop(symbol, None)
+                    continue
+
+                for record in ring.read():
+                    received += 1
+                    if ring_catchup.get(symbol):
+                        if 0 < record['seq'] <= ring_catchup[symbol]:
+                            continue
+                        ring_catchup[symbol] = 0
+
+                    kind, df = self._record_to_dataframe(symbol, record, tz)
+                    if kind == "TICK" and tick_handler is not None:
+                        tick_handler(df)
+                    elif kind == "BAR" and bar_handler is not None:
+                        bar_handler(df)
+            return received
 
         try:
             while True:
+                if use_shm:
+                    received = read_rings()
+
+                    # look for new rings every few seconds
+                    if time.time() - rings_checked > 5:
+                        self._attach_rings(symbols, rings, last_seq)
+                        rings_checked = time.time()
+
+                    if not sock.poll(0):
+                        if received:
+                            continue
+
+                        # nothing new: block until the next message (ring
+                        # records are written before they're sent over
+                        # zeromq, so it also signals new ring records)
+                        if not sock.poll(100):
+                            continue
+                        read_rings()
+
                 message = sock.recv_string()
 
                 if self.args["zmqtopic"] in message:
                     message = message.split(self.args["zmqtopic"])[1].strip()
                     data = json.loads(message)
 
+                    # skip deltas already included in the snapshot
+                    seq = data.pop("_seq", 0)
+                    if seq:
+                        last_seq = seq
+                    if snapshot_seq:
+                        if 0 < seq <= snapshot_seq:
+                            continue
+                        snapshot_seq = 0
+
                     if data['symbol'] not in symbols:
                         continue
 
+                    # delivered via shared memory
+                    if data['symbol'] in rings and \
+                            data['kind'] in sharedmem.KINDS:
+                        continue
+
+                    # latency trace (blotter started with --trace)
+                    trace = metrics.trace_stamp(
+                        data.pop(metrics.TRACE_KEY, None), "received")
+
                     # convert None to np.nan !!
                     data.update((k, np_nan)
                                 for k, v in data.items() if v is None)
@@ -1054,30 +1557,23 @@ class Blotter():
                     if data['kind'] == "ORDERBOOK":
                         if book_handler is not None:
                             book_handler(data)
+                            if trace is not None:
+                                metrics.trace_record("ORDERBOOK", trace)
                             continue
                     # quote
                     if data['kind'] == "QUOTE":
                         if quote_handler is not None:
                             quote_handler(data)
+                            if trace is not None:
+                                metrics.trace_record("QUOTE", trace)
                             continue
 
-                    try:
-                        data["datetime"] = parse_date(data["timestamp"])
-                    except Exception as e:
-                        pass
-
-                    df = pd.DataFrame(index=[0], data=data)
-                    df.set_index('datetime', inplace=True)
-                    df.index = pd.to_datetime(df.index, utc=True)
-                    df.drop(["timestamp", "kind"], axis=1, inplace=True)
-
-                    try:
-                        df.index = df.index.tz_convert(tz)
-                    except Exception as e:
-                        df.index = df.index.tz_localize('UTC').tz_convert(tz)
+                    df = self._to_dataframe(data, tz)
 
-                    # add options columns
-                    df = tools.force_options_columns(df)
+                    # handlers decorated with metrics.traced complete it
+                    if trace is not None:
+                        metrics.trace_stamp(trace, "dataframe")
+                        metrics.trace_bind(df, data['kind'], trace)
 
                     if data['kind'] == "TICK":
                         if tick_handler is not None:
@@ -1135,7 +1631,7 @@ class Blotter():
         data.sort_index(inplace=True)
 
         # currenly only supporting minute-data
-        if resolution[-1] in ("K", "V"):
+        if resolution[-1] in ("K", "V", "$"):
             self.backfilled = True
             return None
 
@@ -1161,7 +1657,7 @@ class Blotter():
             return None
 
         self.backfill_resolution = "1 min" if resolution[-1] not in (
-            "K", "V", "S") else "1 sec"
+            "K", "V", "$", "S") else "1 sec"
         self.log_blotter.warning("Backfilling historical data from IB...")
 
         # request parameters
@@ -1518,7 +2014,7 @@ def prepare_history(data, resolution="1T", tz="UTC", continuous=True):
     data = tools.force_options_columns(data)
 
     # construct continuous contracts for futures
-    if continuous and resolution[-1] not in ("K", "V", "S"):
+    if continuous and resolution[-1] not in ("K", "V", "$", "S"):
         all_dfs = [data[data['asset_class'] != 'FUT']]
 
         # generate dict of df per future
@@ -38,8 +38,11 @@ import pymysql
 import ezibpy
 
 from qtpylib.instrument import Instrument
+from qtpylib.journal import TradeJournal
+from qtpylib.ledger import PositionLedger
+from qtpylib.orders import OrderStore
 from qtpylib import (
-    tools, sms
+    tools, sms, asynctools, futures
 )
 from qtpylib.blotter import (
     Blotter, load_blotter_args
@@ -127,6 +130,40 @@ class Broker():
 
         self.log_broker.info("Connection established...")
 
+        # -----------------------------------
+        self.dbcurr = None
+        self.dbconn = None
+
+        # -----------------------------------
+        # load blotter settings
+        self.blotter_args = load_blotter_args(
+            self.blotter_name, logger=self.log_broker)
+        self.blotter = Blotter(**self.blotter_args)
+
+        # connect to mysql using blotter's settings
+        if not self.blotter_args['dbskip']:
+            self.dbconn = pymysql.connect(
+                host=str(self.blotter_args['dbhost']),
+                port=int(self.blotter_args['dbport']),
+                user=str(self.blotter_args['dbuser']),
+                passwd=str(self.blotter_args['dbpass']),
+                db=str(self.blotter_args['dbname']),
+                autocommit=True
+            )
+            self.dbcurr = self.dbconn.cursor()
+
+        # resolve the futures universe's most active expiries at once
+        # (from the local bars when available, so only symbols
+        # without local data are looked up on CME)
+        symdata = [instrument.upper().split(".") for instrument in instruments
+                   if isinstance(instrument, str) and "FUT." in instrument.upper()]
+        active = [sym[1] for sym in symdata if len(sym) < 3 or sym[2] == ""]
+        if active:
+            try:
+                futures.get_active_contracts(active, dbconn=self.dbconn)
+            except Exception as e:
+                pass
+
         # -----------------------------------
         # create contracts
         instrument_tuples_dict = {}
@@ -145,12 +182,29 @@ class Broker():
         self.instruments = instrument_tuples_dict
         self.symbols = list(self.instruments.keys())
         self.instrument_combos = {}
+        self._combo_parents = {}  # {parent/leg symbol: parent symbol}
 
         # -----------------------------------
         # track orders & trades
         self.active_trades = {}
         self.trades = []
 
+        # simulated (backtest) positions
+        self.ledger = PositionLedger()
+
+        # expires pending orders on time {orderId: scheduler event}
+        self._pending_expiries = {}
+        self._order_timer = None
+        if not self.backtest:
+            self._order_timer = asynctools.Scheduler(name="order_timer")
+
+        # order gateway (paced to stay within IB's 50 messages/sec)
+        self._order_gateway = None
+        self._ticksizes = {}
+        if not self.backtest:
+            self._order_gateway = asynctools.PacedDispatcher(
+                rate=45, name="order_gateway")
+
         # shortcut
         self.account = self.ibConn.account
 
@@ -162,32 +216,16 @@ class Broker():
             pending={},
             filled={},
             active={},
-            history={},
+            history=OrderStore(),
             nextId=1,
             recent={}
         )
 
-        # -----------------------------------
-        self.dbcurr = None
-        self.dbconn = None
-
-        # -----------------------------------
-        # load blotter settings
-        self.blotter_args = load_blotter_args(
-            self.blotter_name, logger=self.log_broker)
-        self.blotter = Blotter(**self.blotter_args)
+        # trade log / database writer
+        self.journal = TradeJournal(
+            directory=self.trade_log_dir, strategy=self.strategy,
+            db_writer=self._store_trade if self.dbconn is not None else None)
 
-        # connect to mysql using blotter's settings
-        if not self.blotter_args['dbskip']:
-            self.dbconn = pymysql.connect(
-                host=str(self.blotter_args['dbhost']),
-                port=int(self.blotter_args['dbport']),
-                user=str(self.blotter_args['dbuser']),
-                passwd=str(self.blotter_args['dbpass']),
-                db=str(self.blotter_args['dbname']),
-                autocommit=True
-            )
-            self.dbcurr = self.dbconn.cursor()
         # -----------------------------------
         # do stuff on exit
         atexit.register(self._on_exit)
@@ -223,16 +261,18 @@ class Broker():
         for leg in legs:
             leg = self.ibConn.contractString(leg)
             legs_dict[leg] = self.get_instrument(leg)
+            self._combo_parents.setdefault(leg, parent)
         self.instrument_combos[parent] = legs_dict
+        self._combo_parents[parent] = parent
 
     def get_combo(self, symbol):
         """ get group by child symbol """
-        for parent, legs in self.instrument_combos.items():
-            if symbol == parent or symbol in legs.keys():
-                return {
-                    "parent": self.get_instrument(parent),
-                    "legs": legs,
-                }
+        parent = self._combo_parents.get(symbol)
+        if parent is not None:
+            return {
+                "parent": self.get_instrument(parent),
+                "legs": self.instrument_combos[parent],
+            }
         return {
             "parent": None,
             "legs": {},
@@ -242,6 +282,12 @@ class Broker():
     def _on_exit(self):
         self.log_broker.info("Algo stopped...")
 
+        # write queued trades
+        try:
+            self.journal.flush()
+        except Exception as e:
+            pass
+
         if self.ibConn is not None:
             self.log_broker.info("Disconnecting...")
             self.ibConn.disconnect()
@@ -288,8 +334,10 @@ class Broker():
 
             # order canceled? do some cleanup
             if hasattr(msg, 'status') and "CANCELLED" in msg.status.upper():
+                self.orders.history.update(msg.orderId, msg.status)
                 if msg.orderId in self.orders.recent.keys():
                     symbol = self.orders.recent[msg.orderId]['symbol']
+                    self._unschedule_pending_expiry(msg.orderId)
                     try:
                         del self.orders.pending_ttls[msg.orderId]
                     except Exception as e:
@@ -317,11 +365,17 @@ class Broker():
                 try:
                     quantity = self.orders.history[symbol][orderId]['quantity']
                 except Exception as e:
-                    quantity = self.orders.history[symbol][order['parentId']]['quantity']
+                    quantity = self.orders.history.get(
+                        order['parentId'])['quantity']
                     # ^^ for child orders auto-created by ezibpy
             except Exception as e:
                 quantity = 1
 
+            # index the order's status
+            self.orders.history.update(orderId, order["status"],
+                                       symbol=symbol,
+                                       parentId=order['parentId'])
+
             # update pending order to the time actually submitted
             if order["status"] in ["OPENED", "SUBMITTED"]:
                 if orderId in self.orders.pending_ttls:
@@ -337,7 +391,6 @@ class Broker():
                 self._register_trade(order)
 
                 # filled
-                time.sleep(0.005)
                 self.on_fill(self.get_instrument(order['symbol']), order)
 
     # ---------------------------------------
@@ -473,95 +526,56 @@ class Broker():
 
     # ---------------------------------------
     def log_trade(self, trade):
+        """ log the trade (to the trade log and database) in
+        the background """
 
         # first trade is an exit?
         if trade['entry_time'] is None:
             return
 
-        # connection established
-        if (self.dbconn is not None) & (self.dbcurr is not None):
-
-            sql = """INSERT INTO trades (
-                `algo`, `symbol`, `direction`,`quantity`,
-                `entry_time`, `exit_time`, `exit_reason`,
-                `order_type`, `market_price`, `target`, `stop`,
-                `entry_price`, `exit_price`, `realized_pnl`)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ON DUPLICATE KEY UPDATE
-                    `algo`=%s, `symbol`=%s, `direction`=%s, `quantity`=%s,
-                    `entry_time`=%s, `exit_time`=%s, `exit_reason`=%s,
-                    `order_type`=%s, `market_price`=%s, `target`=%s, `stop`=%s,
-                    `entry_price`=%s, `exit_price`=%s, `realized_pnl`=%s
-                """
+        self.journal.add(trade)
 
-            try:
-                trade['entry_time'] = trade['entry_time'].strftime(
-                    "%Y-%m-%d %H:%M:%S.%f")
-            except Exception as e:
-                pass
-
-            try:
-                trade['exit_time'] = trade['exit_time'].strftime(
-                    "%Y-%m-%d %H:%M:%S.%f")
-            except Exception as e:
-                pass
-
-            # all strings
-            for k, v in trade.items():
-                if v is not None:
-                    trade[k] = str(v)
-
-            self.dbcurr.execute(sql, (
-                trade['strategy'], trade['symbol'], trade['direction'], trade['quantity'],
-                trade['entry_time'], trade['exit_time'], trade['exit_reason'],
-                trade['order_type'], trade['market_price'], trade['target'], trade['stop'],
-                trade['entry_price'], trade['exit_price'], trade['realized_pnl'],
-                trade['strategy'], trade['symbol'], trade['direction'], trade['quantity'],
-                trade['entry_time'], trade['exit_time'], trade['exit_reason'],
-                trade['order_type'], trade['market_price'], trade['target'], trade['stop'],
-                trade['entry_price'], trade['exit_price'], trade['realized_pnl']
-            ))
-
-            # commit
-            try:
-                self.dbconn.commit()
-            except Exception as e:
-                pass
-
-        if self.trade_log_dir:
-            self.trade_log_dir = (self.trade_log_dir + '/').replace('//', '/')
-            trade_log_path = self.trade_log_dir + self.strategy.lower() + "_" + \
-                datetime.now().strftime('%Y%m%d') + ".csv"
-
-            # convert None to empty string !!
-            trade.update((k, '') for k, v in trade.items() if v is None)
-
-            # create df
-            trade_df = pd.DataFrame(index=[0], data=trade)[[
-                'strategy', 'symbol', 'direction', 'quantity', 'entry_time',
-                'exit_time', 'exit_reason', 'order_type', 'market_price', 'target',
-                'stop', 'entry_price', 'exit_price', 'realized_pnl'
-            ]]
-
-            if os.path.exists(trade_log_path):
-                trades = pd.read_csv(trade_log_path, header=0)
-                trades = trades.append(trade_df, ignore_index=True, sort=True)
-                trades.drop_duplicates(['entry_time', 'symbol', 'strategy'],
-                                       keep="last", inplace=True)
-                trades.to_csv(trade_log_path, header=True, index=False)
-                tools.chmod(trade_log_path)
-            else:
-                trade_df.to_csv(trade_log_path, header=True, index=False)
-                tools.chmod(trade_log_path)
+    # ---------------------------------------
+    def _store_trade(self, trade):
+        """ save a trade record in the database (called by the journal) """
+        sql = """INSERT INTO trades (
+            `algo`, `symbol`, `direction`,`quantity`,
+            `entry_time`, `exit_time`, `exit_reason`,
+            `order_type`, `market_price`, `target`, `stop`,
+            `entry_price`, `exit_price`, `realized_pnl`)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE
+                `algo`=%s, `symbol`=%s, `direction`=%s, `quantity`=%s,
+                `entry_time`=%s, `exit_time`=%s, `exit_reason`=%s,
+                `order_type`=%s, `market_price`=%s, `target`=%s, `stop`=%s,
+                `entry_price`=%s, `exit_price`=%s, `realized_pnl`=%s
+            """
+
+        # all strings
+        for k, v in trade.items():
+            if v is not None:
+                trade[k] = str(v)
+
+        self.dbcurr.execute(sql, (
+            trade['strategy'], trade['symbol'], trade['direction'], trade['quantity'],
+            trade['entry_time'], trade['exit_time'], trade['exit_reason'],
+            trade['order_type'], trade['market_price'], trade['target'], trade['stop'],
+            trade['entry_price'], trade['exit_price'], trade['realized_pnl'],
+            trade['strategy'], trade['symbol'], trade['direction'], trade['quantity'],
+            trade['entry_time'], trade['exit_time'], trade['exit_reason'],
+            trade['order_type'], trade['market_price'], trade['target'], trade['stop'],
+            trade['entry_price'], trade['exit_price'], trade['realized_pnl']
+        ))
+
+        # commit
+        try:
+            self.dbconn.commit()
+        except Exception as e:
+            pass
 
     # ---------------------------------------
     def active_order(self, symbol, order_type="STOP"):
-        if symbol in self.orders.history:
-            for orderId in self.orders.history[symbol]:
-                order = self.orders.history[symbol][orderId]
-                if order['order_type'].upper() == order_type.upper():
-                    return order
-        return None
+        return self.orders.history.find(symbol, order_type)
 
     # ---------------------------------------
     @staticmethod
@@ -570,13 +584,64 @@ class Broker():
         return local_params
 
     # ---------------------------------------
-    def _create_order(self, symbol, direction, quantity, order_type="",
+    def _create_order(self, **kwargs):
+        """ queue an order with the order gateway (returns immediately).
+        Invalid orders raise here; errors while submitting the order are
+        logged and set on the returned future.
+
+        :Returns:
+            future : concurrent.futures.Future
+                The order id (None if the order wasn't submitted)
+        """
+        self._validate_order(**kwargs)
+
+        # bracket orders send 3 orders (+1 for a trailing stop)
+        cost = 1
+        if any(kwargs.get(arg, 0) for arg in (
+                'target', 'initial_stop', 'stoploss',
+                'trail_stop_at', 'trail_stop_by')):
+            cost = 4 if kwargs.get('trail_stop_by', 0) else 3
+
+        return self._order_gateway.submit(
+            self._submit_order, kwargs=kwargs, cost=cost)
+
+    # ---------------------------------------
+    def _validate_order(self, symbol, direction, quantity, order_type="",
+                        orderId=0, **kwargs):
+        """ raises a ValueError for orders that can't be submitted
+        (also caches the contract's min. tick for submitting it) """
+        if str(direction).upper() not in ("BUY", "SELL", "LONG", "SHORT"):
+            raise ValueError("Invalid order direction: %s" % direction)
+
+        try:
+            quantity = float(quantity)
+            for arg in ('limit_price', 'target', 'initial_stop', 'stoploss',
+                        'trail_stop_at', 'trail_stop_by', 'expiry'):
+                float(kwargs.get(arg) or 0)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid order quantity/prices for %s: %s" % (
+                symbol, dict(kwargs, quantity=quantity)))
+
+        if quantity != quantity or quantity == 0:
+            raise ValueError("Invalid order quantity: %s" % quantity)
+
+        if str(order_type).upper() == "MODIFY" and not orderId:
+            raise ValueError("Modifying an order requires its orderId")
+
+        try:
+            self.get_ticksize(symbol)
+        except Exception as e:
+            raise ValueError("Can't get %s's contract details: %s" % (
+                symbol, e))
+
+    # ---------------------------------------
+    def _submit_order(self, symbol, direction, quantity, order_type="",
                       limit_price=0, expiry=0, orderId=0, target=0,
                       initial_stop=0, trail_stop_at=0, trail_stop_by=0,
                       stop_limit=False, trail_stop_type='percent', **kwargs):
 
         # fix prices to comply with contract's min-tick
-        ticksize = self.get_contract_details(symbol)['m_minTick']
+        ticksize = self.get_ticksize(symbol)
         limit_price = tools.round_to_fraction(limit_price, ticksize)
         target = tools.round_to_fraction(target, ticksize)
         initial_stop = tools.round_to_fraction(initial_stop, ticksize)
@@ -593,7 +658,7 @@ class Broker():
         # modify order?
         if order_type.upper() == "MODIFY":
             self.modify_order(symbol, orderId, quantity, limit_price)
-            return
+            return orderId
 
         # continue...
 
@@ -605,9 +670,6 @@ class Broker():
         iceberg = kwargs["iceberg"] if "iceberg" in kwargs else False
         tif = kwargs["tif"] if "tif" in kwargs else "DAY"
 
-        # clear expired pending orders
-        self._cancel_expired_pending_orders()
-
         # don't submit order if a pending one is waiting
         if symbol in self.orders.pending:
             self.log_broker.warning(
@@ -700,7 +762,7 @@ class Broker():
         # add orderId / ttl to (auto-adds to history)
         expiry = expiry * 1000 if expiry > 0 else 60000  # 1min
         self._update_pending_order(symbol, orderId, expiry, order_quantity)
-        time.sleep(0.1)
+        return orderId
 
     # ---------------------------------------
     def _cancel_order(self, orderId):
@@ -730,74 +792,66 @@ class Broker():
         if quantity is None and limit_price is None:
             return
 
-        if symbol in self.orders.history:
-            for historyOrderId in self.orders.history[symbol]:
-                if historyOrderId == orderId:
-                    order_quantity = self.orders.history[symbol][orderId]['quantity']
-                    if quantity is not None:
-                        order_quantity = quantity
-
-                    order = self.orders.history[symbol][orderId]
-                    if order['order_type'] == "STOP":
-                        new_order = self.ibConn.createStopOrder(
-                            quantity=order_quantity,
-                            parentId=order['parentId'],
-                            stop=limit_price,
-                            trail=None,
-                            transmit=True
-                        )
-                    else:
-                        new_order = self.ibConn.createOrder(
-                            order_quantity, limit_price)
-
-                        # child order?
-                        if "parentId" in order:
-                            new_order.parentId = order['parentId']
-
-                    #  send order
-                    contract = self.get_contract(symbol)
-                    self.ibConn.placeOrder(
-                        contract, new_order, orderId=orderId)
-                    break
+        order = self.orders.history.get(orderId)
+        if order is not None and order['symbol'] == symbol:
+            order_quantity = order['quantity']
+            if quantity is not None:
+                order_quantity = quantity
+
+            if order['order_type'] == "STOP":
+                new_order = self.ibConn.createStopOrder(
+                    quantity=order_quantity,
+                    parentId=order['parentId'],
+                    stop=limit_price,
+                    trail=None,
+                    transmit=True
+                )
+            else:
+                new_order = self.ibConn.createOrder(
+                    order_quantity, limit_price)
 
-    # ---------------------------------------
-    @staticmethod
-    def _milliseconds_delta(delta):
-        return delta.days * 86400000 + delta.seconds * 1000 + delta.microseconds / 1000
+                # child order?
+                if "parentId" in order:
+                    new_order.parentId = order['parentId']
+
+            #  send order
+            contract = self.get_contract(symbol)
+            self.ibConn.placeOrder(
+                contract, new_order, orderId=orderId)
 
     # ---------------------------------------
     def _cancel_orphan_orders(self, orderId):
         """ cancel child orders when parent is gone """
-        orders = self.ibConn.orders
-        for order in orders:
-            order = orders[order]
-            if order['parentId'] != orderId:
-                self.ibConn.cancelOrder(order['id'])
+        for order in self.orders.history.orphans(orderId):
+            self.ibConn.cancelOrder(order['orderId'])
 
     # ---------------------------------------
-    def _cancel_expired_pending_orders(self):
-        """ expires pending orders """
-        # use a copy to prevent errors
-        pending = self.orders.pending.copy()
-        for symbol in pending:
-            orderId = pending[symbol]["orderId"]
-            expiration = pending[symbol]["expires"]
-
-            delta = expiration - datetime.now()
-            delta = self._milliseconds_delta(delta)
-
-            # cancel order if expired
-            if delta < 0:
-                self.ibConn.cancelOrder(orderId)
-                if orderId in self.orders.pending_ttls:
-                    if orderId in self.orders.pending_ttls:
-                        del self.orders.pending_ttls[orderId]
-                    if symbol in self.orders.pending:
-                        if self.orders.pending[symbol]['orderId'] == orderId:
-                            del self.orders.pending[symbol]
+    def _schedule_pending_expiry(self, symbol, orderId, expires):
+        """ cancel the pending order when it expires """
+        if self._order_timer is None:
+            return
+        self._unschedule_pending_expiry(orderId)
+        self._pending_expiries[orderId] = self._order_timer.call_at(
+            expires, self._cancel_expired_pending_order, symbol, orderId)
+
+    def _unschedule_pending_expiry(self, orderId):
+        event = self._pending_expiries.pop(orderId, None)
+        if event is not None:
+            self._order_timer.cancel(event)
+
+    def _cancel_expired_pending_order(self, symbol, orderId):
+        """ expires a pending order (called by the order timer) """
+        self._pending_expiries.pop(orderId, None)
+        if orderId in self.orders.pending_ttls:
+            self.ibConn.cancelOrder(orderId)
+            del self.orders.pending_ttls[orderId]
+            if symbol in self.orders.pending:
+                if self.orders.pending[symbol]['orderId'] == orderId:
+                    del self.orders.pending[symbol]
 
     # ---------------------------------------------------------
     def _expire_pending_order(self, symbol, orderId):
+        self._unschedule_pending_expiry(orderId)
         self.ibConn.cancelOrder(orderId)
 
         if orderId in self.orders.pending_ttls:
@@ -815,6 +869,8 @@ class Broker():
             # "created": datetime.now(),
             "expires": datetime.now() + timedelta(milliseconds=expiry)
         }
+        self._schedule_pending_expiry(
+            symbol, orderId, self.orders.pending[symbol]["expires"])
 
         # ibCallback needs this to update with submittion time
         self.orders.pending_ttls[orderId] = expiry
@@ -824,16 +880,9 @@ class Broker():
     # ---------------------------------------------------------
     def _update_order_history(self, symbol, orderId, quantity,
                               order_type='entry', filled=False, parentId=0):
-        if symbol not in self.orders.history:
-            self.orders.history[symbol] = {}
-
-        self.orders.history[symbol][orderId] = {
-            "orderId": orderId,
-            "quantity": quantity,
-            "order_type": order_type.upper(),
-            "filled": filled,
-            "parentId": parentId
-        }
+        self.orders.history.add(symbol, orderId, quantity,
+                                order_type=order_type, filled=filled,
+                                parentId=parentId)
 
     # ---------------------------------------
     # UTILITY FUNCTIONS
@@ -882,6 +931,15 @@ class Broker():
     def get_contract_details(self, symbol):
         return self.ibConn.contractDetails(symbol)
 
+    # ---------------------------------------
+    def get_ticksize(self, symbol):
+        """ contract's min. tick (cached) """
+        symbol = self.get_symbol(symbol)
+        if symbol not in self._ticksizes:
+            self._ticksizes[symbol] = self.get_contract_details(
+                symbol)['m_minTick']
+        return self._ticksizes[symbol]
+
     # ---------------------------------------
     def get_tickerId(self, symbol):
         return self.ibConn.tickerId(symbol)
@@ -901,21 +959,11 @@ class Broker():
         symbol = self.get_symbol(symbol)
 
         if self.backtest:
-            position = 0
-            avgCost = 0.0
-
-            if self.datastore.recorded is not None:
-                data = self.datastore.recorded
-                col = symbol.upper() + '_POSITION'
-                position = data[col].values[-1]
-                if position != 0:
-                    pos = data[col].diff()
-                    avgCost = data[data.index.isin(pos[pos != 0][-1:].index)
-                                   ][symbol.upper() + '_OPEN'].values[-1]
+            position = self.ledger.get(symbol)
             return {
                     "symbol": symbol,
-                    "position": position,
-                    "avgCost":  avgCost,
+                    "position": position["position"],
+                    "avgCost":  position["avgCost"],
                     "account":  "Backtest"
                 }
 
@@ -931,6 +979,12 @@ class Broker():
 
     # ---------------------------------------
     def get_portfolio(self, symbol=None):
+        if self.backtest:
+            if symbol is not None:
+                return self._ledger_portfolio(self.get_symbol(symbol))
+            return {sym: self._ledger_portfolio(sym)
+                    for sym in self.ledger.positions}
+
         if symbol is not None:
             symbol = self.get_symbol(symbol)
 
@@ -953,6 +1007,22 @@ class Broker():
 
         return self.ibConn.portfolio
 
+    def _ledger_portfolio(self, symbol):
+        """ simulated (backtest) portfolio data """
+        position = self.ledger.get(symbol)
+        return {
+            "symbol":        symbol,
+            "position":      position["position"],
+            "marketPrice":   position["lastPrice"],
+            "marketValue":   position["position"] * position["lastPrice"],
+            "averageCost":   position["avgCost"],
+            "unrealizedPNL": position["unrealizedPNL"],
+            "realizedPNL":   position["realizedPNL"],
+            "totalPNL":      position["unrealizedPNL"] +
+                             position["realizedPNL"],
+            "account":       "Backtest"
+        }
+
     # ---------------------------------------
     def get_pending_orders(self, symbol=None):
         if symbol is not None:
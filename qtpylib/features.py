@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import inspect
+import logging
+import os
+import sys
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from qtpylib import indicators
+
+# parquet requires pyarrow or fastparquet
+try:
+    pd.io.parquet.get_engine("auto")
+    PARQUET = True
+except Exception as e:
+    PARQUET = False
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+# the bars node (the graph's root)
+BARS = ("bars",)
+
+# indicators that are built from shared intermediates:
+# {name: (inputs(params) -> [(indicator, params)], compute(*inputs, **params))}
+RECIPES = {
+    "atr": (
+        lambda params: [("true_range", {})],
+        indicators._atr),
+    "cci": (
+        lambda params: [("typical_price", {})],
+        indicators._cci),
+    "keltner_channel": (
+        lambda params: [("typical_price", {}),
+                        ("atr", {"window": params["window"]})],
+        indicators._keltner_channel),
+    "vwap": (
+        lambda params: [BARS, ("typical_price", {})],
+        indicators._vwap),
+    "rolling_vwap": (
+        lambda params: [BARS, ("typical_price", {})],
+        indicators._rolling_vwap),
+    "chopiness": (
+        lambda params: [BARS, ("true_range", {})],
+        indicators._chopiness),
+    "tdi": (
+        lambda params: [("rsi", {"window": params["rsi_lookback"]})],
+        lambda rsi_data, rsi_lookback, **params: indicators._tdi(
+            rsi_data, **params)),
+}
+
+# ---------------------------------------------
+
+
+def _indicator_func(indicator):
+    if callable(indicator):
+        return indicator
+    func = getattr(indicators, indicator, None)
+    if func is None or indicator.startswith("_"):
+        raise ValueError("Unknown indicator: %s" % indicator)
+    return func
+
+
+def _bind(func, params):
+    """ params with the function's defaults filled in
+    (so rsi() and rsi(window=14) are the same node) """
+    try:
+        signature = inspect.signature(func)
+        bound = signature.bind_partial(None, **params)
+        bound.apply_defaults()
+    except (TypeError, ValueError):
+        return dict(params)
+
+    source = list(signature.parameters)[0]
+    params = {}
+    for name, value in bound.arguments.items():
+        kind = signature.parameters[name].kind
+        if kind == inspect.Parameter.VAR_KEYWORD:
+            params.update(value)
+        elif name != source and kind != inspect.Parameter.VAR_POSITIONAL:
+            params[name] = value
+    return params
+
+
+def _takes_series(func):
+    """ indicators taking a series default to the close price """
+    try:
+        return list(inspect.signature(func).parameters)[0] == "series"
+    except (TypeError, ValueError, IndexError):
+        return False
+
+
+# =============================================
+class FeatureSet():
+    """Declares the indicators a strategy needs, once.
+
+    Indicators are nodes in a dependency graph: shared intermediates
+    (typical price, true range, rsi, ...) become a single node, and nodes
+    are evaluated lazily, at most once per ``cache`` (ie. per bar).
+
+    Usage::
+
+        features = FeatureSet()
+        features.add("rsi", "rsi", window=14)
+        features.add("tdi", "tdi", rsi_lookback=14)  # re-uses "rsi"
+        features.add("rsi_sma", "sma", on="rsi", window=5)
+        features.add("kc", "keltner_channel", window=20)
+
+        values = features.evaluate(bars)  # {"rsi": pd.Series, ...}
+    """
+
+    def __init__(self):
+        self.features = OrderedDict()  # {name: node key}
+        self.nodes = {}  # {node key: (func, input keys, params)}
+
+    # ---------------------------------------
+    def add(self, name, indicator, on=None, **params):
+        """Declare a feature
+
+        :Parameters:
+            name : str
+                Feature name (used with ``evaluate()`` and as ``on``)
+            indicator : str / callable
+                Name of a function in ``qtpylib.indicators`` (eg. "rsi")
+                or a custom function
+
+        :Optional:
+            on : str
+                Input: a previously declared feature or a bars column
+                (default: the bars, or their "close" for series indicators)
+            params : mixed
+                Indicator parameters (eg. window=14)
+
+        :Returns:
+            self : FeatureSet
+                (so calls can be chained)
+        """
+        if name in self.features:
+            raise ValueError("Feature %s already exists" % name)
+
+        if on is not None and on in self.features:
+            source = self.features[on]
+        elif on is not None:
+            source = self._column(on)
+        else:
+            source = None
+
+        self.features[name] = self._add_node(indicator, params, source)
+        return self
+
+    # ---------------------------------------
+    def _node(self, key, func, inputs, params=None):
+        if key not in self.nodes:
+            self.nodes[key] = (func, inputs, params or {})
+        return key
+
+    def _column(self, column):
+        return self._node(("column", column),
+                          lambda bars: bars[column], [BARS])
+
+    def _add_node(self, indicator, params, source=None):
+        func = _indicator_func(indicator)
+        params = _bind(func, params)
+
+        # shared intermediates
+        if source is None and indicator in RECIPES:
+            inputs, compute = RECIPES[indicator]
+            inputs = [BARS if dep == BARS else self._add_node(*dep)
+                      for dep in inputs(params)]
+            key = (indicator, None, tuple(sorted(params.items())))
+            return self._node(key, compute, inputs, params)
+
+        if source is None:
+            source = self._column("close") if _takes_series(func) else BARS
+
+        key = (indicator if isinstance(indicator, str) else func,
+               source, tuple(sorted(params.items())))
+        return self._node(key, func, [source], params)
+
+    # ---------------------------------------
+    def evaluate(self, bars, names=None, cache=None):
+        """Evaluate (only) the requested features and their dependencies
+
+        :Parameters:
+            bars : pd.DataFrame / callable
+                The bars (or a function returning them, called only
+                if something needs to be computed)
+
+        :Optional:
+            names : str / list
+                Feature(s) to evaluate (default: all)
+            cache : dict
+                Node values of previous calls for the same bars
+                (clear it when a new bar arrives)
+
+        :Returns:
+            features : dict / mixed
+                {name: value} (a single value if names is a str)
+        """
+        cache = {} if cache is None else cache
+
+        single = isinstance(names, str)
+        names = [names] if single else \
+            list(self.features) if names is None else names
+
+        values = {name: self._evaluate(self.features[name], bars, cache)
+                  for name in names}
+        return values[names[0]] if single else values
+
+    def _evaluate(self, key, bars, cache):
+        if key in cache:
+            return cache[key]
+
+        if key == BARS:
+            value = bars() if callable(bars) else bars
+        else:
+            func, inputs, params = self.nodes[key]
+            value = func(*[self._evaluate(dep, bars, cache)
+                           for dep in inputs], **params)
+
+        cache[key] = value
+        return value
+
+    # ---------------------------------------
+    def describe(self, name):
+        """ a stable (process independent) description of the
+        feature's node and everything it depends on """
+        return self._describe(self.features[name])
+
+    def _describe(self, key):
+        if key == BARS or key[0] == "column":
+            return repr(key)
+
+        func, inputs, params = self.nodes[key]
+        indicator = key[0] if isinstance(key[0], str) else \
+            "%s.%s" % (func.__module__, func.__qualname__)
+        return "%s(%s; %s)" % (indicator, ", ".join(
+            self._describe(dep) for dep in inputs), repr(key[2]))
+
+
+# =============================================
+class FeatureStore():
+    """Persists computed features on disk, so backtests (and parameter
+    sweeps) over unchanged history don't re-compute them.
+
+    Every feature is stored in its own file, keyed by (symbol, resolution,
+    feature definition and parameters, fingerprint of the bars).
+    Only point-in-time correct features are stored: features whose values
+    change when later bars are added (ie. they look ahead) are reported
+    and left out.
+
+    :Parameters:
+        path : str
+            Directory to store the features in
+
+    :Optional:
+        fmt : str
+            "parquet" (default when pyarrow/fastparquet is installed)
+            or "pickle"
+    """
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt if fmt is not None else \
+            "parquet" if PARQUET else "pickle"
+        self.log = logging.getLogger(__name__)
+        os.makedirs(path, exist_ok=True)
+
+    # ---------------------------------------
+    @staticmethod
+    def fingerprint(bars):
+        """ sha1 of the bars' timestamps and OHLCV data """
+        columns = [col for col in ("open", "high", "low", "close", "volume")
+                   if col in bars.columns]
+        hashed = pd.util.hash_pandas_object(bars[columns], index=True)
+        return hashlib.sha1(hashed.values.tobytes()).hexdigest()
+
+    def key(self, symbol, resolution, description, fingerprint):
+        return hashlib.sha1(("%s|%s|%s|%s" % (
+            symbol, resolution, description, fingerprint)).encode()
+        ).hexdigest()
+
+    def filename(self, symbol, resolution, name, key):
+        name = "%s.%s.%s.%s.%s" % (symbol, resolution, name, key[:16],
+                                    "parquet" if self.fmt == "parquet"
+                                    else "pkl")
+        return os.path.join(self.path, name.replace("/", "_"))
+
+    # ---------------------------------------
+    def _load(self, filename):
+        try:
+            if self.fmt == "parquet":
+                return pd.read_parquet(filename)
+            return pd.read_pickle(filename)
+        except Exception as e:
+            return None
+
+    def _save(self, filename, data):
+        try:
+            if self.fmt == "parquet":
+                data.to_parquet(filename)
+            else:
+                data.to_pickle(filename)
+        except Exception as e:
+            self.log.warning("Can't store feature (%s): %s", filename, e)
+
+    # ---------------------------------------
+    def get(self, features, bars, symbol, resolution, names=None):
+        """Loads (or computes and stores) features for a symbol's bars
+
+        :Parameters:
+            features : FeatureSet
+                The feature declarations
+            bars : pd.DataFrame
+                The symbol's bars (full history)
+            symbol : str
+                Symbol name
+            resolution : str
+                Bar resolution (eg. "1T")
+
+        :Optional:
+            names : list
+                Features to get (default: all)
+
+        :Returns:
+            features : pd.DataFrame
+                Features columns (multi-column features become
+                "<name>_<column>"), indexed as the bars
+        """
+        names = list(features.features) if names is None else names
+        fingerprint = self.fingerprint(bars)
+
+        loaded = {}
+        missing = {}
+        for name in names:
+            key = self.key(symbol, resolution,
+                           features.describe(name), fingerprint)
+            filename = self.filename(symbol, resolution, name, key)
+            data = self._load(filename) if os.path.exists(filename) else None
+            if data is None:
+                missing[name] = filename
+            else:
+                loaded[name] = data
+
+        if missing:
+            values = features.evaluate(bars, list(missing))
+
+            # values must not change when later bars are added
+            prefix = features.evaluate(
+                bars[:max(len(bars) // 2, 1)], list(missing))
+
+            for name, filename in missing.items():
+                data = _to_frame(name, values[name], bars.index)
+                if not _same(data, _to_frame(name, prefix[name],
+                                             bars.index[:len(prefix[name])])):
+                    self.log.warning(
+                        "Feature %s isn't point-in-time correct "
+                        "(it uses future bars) and won't be stored", name)
+                    continue
+                self._save(filename, data)
+                loaded[name] = data
+
+        if not loaded:
+            return pd.DataFrame(index=bars.index)
+        return pd.concat([loaded[name] for name in names if name in loaded],
+                         axis=1)
+
+
+# ---------------------------------------------
+
+def _to_frame(name, value, index):
+    """ feature value as a DataFrame with "<name>[_<column>]" columns """
+    if isinstance(value, pd.DataFrame):
+        frame = value.copy()
+        frame.columns = ["%s_%s" % (name, col) for col in frame.columns]
+    else:
+        frame = pd.DataFrame({name: np.asarray(value)}, index=index)
+    frame.index = index
+    return frame
+
+
+def _same(full, prefix):
+    """ prefix's values equal the full history's over the same bars """
+    full = full[:len(prefix)].values.astype(float)
+    prefix = prefix.values.astype(float)
+    return np.allclose(full, prefix, rtol=1e-9, atol=1e-12, equal_nan=True)
@@ -26,14 +26,15 @@ import numpy as np
 import re
 import time
 import tempfile
+import threading
 import sys
 
+from collections import deque
+
 import requests
 from bs4 import BeautifulSoup as bs
 from dateutil.parser import parse as parse_date
 
-from qtpylib import tools
-
 # =============================================
 # check min, python version
 if sys.version_info < (3, 4):
@@ -46,115 +47,366 @@ logging.getLogger("urllib3").setLevel(logging.WARNING)
 # =============================================
 
 
-def create_continuous_contract(df, resolution="1T"):
+def _roll_schedule(expiry, days, prices):
+    """Roll schedule of a futures group, one row per expiry: the day the
+    contract is rolled over (its expiry date) and the back-adjustment
+    offset added to its prices (the sum of the price gaps between the
+    next and the expiring contract at all the later rolls)
 
-    def _merge_contracts(m1, m2):
+    ``expiry``, ``days`` and ``prices`` are the data's per-row
+    (UTC) expiries, days and close/last prices
+    """
+    expiries = pd.DatetimeIndex(
+        expiry[~pd.isnull(expiry)]).unique().sort_values()
+    rolls = expiries.floor('D')
 
-        if m1 is None:
-            return m2
+    # contracts' last price on roll days
+    on_rolls = np.isin(days, rolls.values[:-1])
+    closes = pd.Series(prices[on_rolls]).groupby(
+        [expiry[on_rolls], days[on_rolls]]).last()
 
-        try:
-            # rollver by date
-            roll_date = m1['expiry'].unique()[-1]
-        except Exception as e:
-            # rollover by volume
-            combined = m1.merge(m2, left_index=True, right_index=True)
-            m_highest = combined['volume_y'] > combined['volume_x']
-            if len(m_highest.index) == 0:
-                return m1  # didn't rolled over yet
-            roll_date = m_highest[m_highest].index[-1]
-
-        return pd.concat([m1[m1.index <= roll_date], m2[m2.index > roll_date]
-                          ], sort=True)
-
-    def _continuous_contract_flags(daily_df):
-        # grab expirations
-        expirations = list(daily_df['expiry'].dropna().unique())
-        expirations.sort()
-
-        # set continuous contract markets
-        flags = None
-        for expiration in expirations:
-            new_contract = daily_df[daily_df['expiry'] == expiration].copy()
-            flags = _merge_contracts(flags, new_contract)
-
-        # add gap
-        flags['gap'] = 0
-        for expiration in expirations:
-            try:
-                minidf = daily_df[daily_df.index ==
-                                  expiration][['symbol', 'expiry', 'diff']]
-                expiry = flags[
-                    (flags.index > expiration) & (
-                        flags['expiry'] >= expiration)
-                ]['expiry'][0]
-                gap = minidf[minidf['expiry'] == expiry]['diff'][0]
-                flags.loc[flags.index <= expiration, 'gap'] = gap
-            except Exception as e:
-                pass
+    # price gap at each roll (0 when either contract has no price that day)
+    new = closes.reindex(pd.MultiIndex.from_arrays(
+        [expiries[1:].values, rolls[:-1].values])).values
+    old = closes.reindex(pd.MultiIndex.from_arrays(
+        [expiries[:-1].values, rolls[:-1].values])).values
+    gaps = np.nan_to_num(new - old)
 
-        flags = flags[flags['symbol'].isin(flags['symbol'].unique())]
+    offsets = np.append(gaps[::-1].cumsum()[::-1], 0.)
+    return pd.DataFrame(index=expiries, data={
+        "roll": rolls, "offset": offsets})
 
-        # single row df won't resample
-        if len(flags.index) <= 1:
-            flags = pd.DataFrame(
-                index=pd.date_range(start=flags[0:1].index[0],
-                                    periods=24, freq="1H"), data=flags[
-                                        ['symbol', 'expiry', 'gap']]).ffill()
 
-        flags['expiry'] = pd.to_datetime(flags['expiry'], utc=True)
-        return flags[['symbol', 'expiry', 'gap']]
+def create_continuous_contract(df, resolution="1T"):
+    """Stitches a futures group's contracts into a back-adjusted
+    continuous contract
+
+    Each contract is used until (and including) its expiry date, and the
+    prices of expired contracts are shifted by the gaps at the later rolls.
+    The roll schedule is computed per expiry and applied to the data's
+    timestamps with ``searchsorted``.
+
+    :Parameters:
+        df : pd.DataFrame
+            The group's data (with ``symbol``, ``expiry`` and
+            OHLC or ``last`` columns)
+
+    :Optional:
+        resolution : str
+            The data's resolution (kept for compatibility)
+
+    :Returns:
+        contract : pd.DataFrame
+            The continuous contract's data
+    """
+    price = "close" if "close" in df.columns else "last"
+
+    expiry = pd.to_datetime(df['expiry'], utc=True).values
+    days = pd.DatetimeIndex(pd.to_datetime(df.index, utc=True)
+                            ).floor('D').values
+
+    schedule = _roll_schedule(expiry, days, df[price].values)
+    if schedule.empty:
+        return df[0:0].copy()
+
+    # active contract (and its offset) per row
+    active = np.minimum(
+        schedule['roll'].values.searchsorted(days, side='left'),
+        len(schedule.index) - 1)
+    rows = expiry == schedule.index.values[active]
+
+    contract = df[rows].copy()
+    offset = schedule['offset'].values[active[rows]]
+
+    columns = ["open", "high", "low", "close"] if price == "close" \
+        else ["last"]
+    for col in columns:
+        if col in contract.columns:
+            contract[col] = contract[col] + offset
+
+    contract['expiry'] = pd.to_datetime(contract.pop('expiry'), utc=True)
+    contract.index.name = 'dt'
 
-    # gonna need this later
-    df = df.copy()
-    df['dt'] = df.index
+    return contract
 
-    # work with daily data
-    daily_df = df.groupby('symbol').resample("D").last().dropna(how='all')
-    daily_df.index = daily_df.index.droplevel()
-    daily_df.sort_index(inplace=True)
-    try:
-        daily_df['diff'] = daily_df['close'].diff()
-    except Exception as e:
-        daily_df['diff'] = daily_df['last'].diff()
 
-    # build flags
-    flags = _continuous_contract_flags(daily_df)
+def _utc_day(date):
+    date = pd.Timestamp(date)
+    if date.tzinfo is None:
+        date = date.tz_localize("UTC")
+    return date.tz_convert("UTC").floor('D')
 
-    # resample back to original
-    if "K" in resolution or "V" in resolution or "S" in resolution:
-        flags = flags.resample('S').last().ffill(
-        ).reindex(df.index.unique()).ffill()
-    else:
-        flags = flags.resample('T').last().ffill(
-        ).reindex(df.index.unique()).ffill()
-    flags['dt'] = flags.index
 
-    # build contract
-    contract = pd.merge(df, flags, how='left', on=[
-                        'dt', 'symbol']).ffill()
-    contract.set_index('dt', inplace=True)
+# =============================================
+class ContinuousContract():
+    """Stitches a futures group's streamed bars into a back-adjusted
+    continuous contract, incrementally (O(1) per bar).
+
+    The active contract is the unexpired one with the highest volume over
+    its last ``window`` bars. Once the series rolls forward to a later
+    expiry it never returns to the contracts it rolled from (a nearer
+    contract can only take over before that, eg. when the first bars seen
+    are of a back month), and an expired contract is replaced regardless
+    of volume. At each roll, the gap between the new and the old contract's
+    last prices is added to the offset of the bars already stitched, so
+    ``get_bars()`` is back-adjusted the same way
+    ``create_continuous_contract()`` is.
+
+    Bars are stored net of the offset at the time they're added, so a roll
+    doesn't re-write them (they're adjusted when read). A bar that's
+    re-sent with revised values (same symbol and time) replaces the one
+    that was added, using ``revise()``.
+
+    :Parameters:
+        symbol_group : str
+            The futures group (eg. "ES_F")
+
+    :Optional:
+        window : int
+            Rolling volume window, in bars (default: 20)
+        maxlen : int
+            Continuous bars to keep (default: 1000)
+        resolution : str
+            Aggregate the added bars into bars of this (fixed, pandas)
+            resolution, eg. "5T" (default: keep the added bars as they are)
+    """
+
+    PRICES = ("open", "high", "low", "close", "last")
+
+    def __init__(self, symbol_group, window=20, maxlen=1000,
+                 resolution=None):
+        self.symbol_group = symbol_group
+        self.window = window
+        self.active = None
+        self.offset = 0.
+
+        self.resolution = None
+        try:
+            if resolution is not None and pd.Timedelta(resolution):
+                self.resolution = resolution
+        except Exception as e:
+            pass
 
-    contract = contract[contract.expiry_y == contract.expiry_x]
-    contract['expiry'] = contract['expiry_y']
-    contract.drop(['expiry_y', 'expiry_x'], axis=1, inplace=True)
+        self._volumes = {}  # {symbol: [deque, rolling sum]}
+        self._prices = {}  # {symbol: last price}
+        self._expiries = {}  # {symbol: expiry}
+        self._rolled = set()  # contracts rolled forward from
+        self._bars = deque(maxlen=maxlen)  # [(timestamp, bar - offset)]
+        self._added = {}  # {symbol: time of its last added bar}
+
+        # the active contract's last added bar, to be revised:
+        # (symbol, time, continuous bar's timestamp, bar before merging)
+        self._last = None
+        self._lock = threading.Lock()
+
+    # ---------------------------------------
+    def _expiry(self, symbol, bar):
+        if not pd.isnull(bar.get('expiry')):
+            self._expiries[symbol] = _utc_day(bar['expiry'])
+        elif symbol not in self._expiries:
+            try:
+                from qtpylib import tools
+                self._expiries[symbol] = _utc_day(
+                    tools.contract_expiry_from_symbol(symbol))
+            except Exception as e:
+                self._expiries[symbol] = None
+        return self._expiries[symbol]
+
+    def _add_volume(self, symbol, volume):
+        volumes = self._volumes.setdefault(
+            symbol, [deque(maxlen=self.window), 0.])
+        if len(volumes[0]) == self.window:
+            volumes[1] -= volumes[0][0]
+        volume = 0. if pd.isnull(volume) else float(volume)
+        volumes[0].append(volume)
+        volumes[1] += volume
+
+    def _takes_over(self, symbol, day):
+        """ should the (unexpired) symbol replace the active contract? """
+        if symbol in self._rolled:
+            return False
+
+        # the active contract expired
+        active_expiry = self._expiries.get(self.active)
+        if not pd.isnull(active_expiry) and day > active_expiry:
+            return True
+
+        return self._volumes[symbol][1] > self._volumes[self.active][1]
+
+    def _roll(self, symbol, price):
+        expiry = self._expiries.get(symbol)
+        active_expiry = self._expiries.get(self.active)
+        if pd.isnull(expiry) or pd.isnull(active_expiry) or \
+                expiry > active_expiry:
+            self._rolled.add(self.active)
+
+        gap = price - self._prices.get(self.active, price)
+        if not pd.isnull(gap):
+            self.offset += gap
+        self.active = symbol
+
+    # ---------------------------------------
+    def add(self, timestamp, bar):
+        """Adds an expiry's bar
+
+        :Parameters:
+            timestamp : datetime
+                The bar's time
+            bar : dict
+                The bar (with ``symbol``, ``volume``, OHLC or ``last``
+                values and, optionally, ``expiry``)
+
+        :Returns:
+            bar : dict
+                The continuous contract's new bar (``None`` if the bar
+                isn't the active contract's, or only updated the current
+                ``resolution`` bar)
+        """
+        symbol = bar['symbol']
+        price = bar['close'] if 'close' in bar else bar.get('last')
+        day = _utc_day(timestamp)
+        added = timestamp
+        if self.resolution is not None:
+            timestamp = pd.Timestamp(timestamp).floor(self.resolution)
+
+        with self._lock:
+            expiry = self._expiry(symbol, bar)
+            self._add_volume(symbol, bar.get('volume'))
+            self._added[symbol] = added
+            expired = not pd.isnull(expiry) and day > expiry
+
+            if self.active is None:
+                if not expired:
+                    self.active = symbol
+            elif symbol != self.active and not expired and \
+                    self._takes_over(symbol, day):
+                self._roll(symbol, price)
+
+            if not pd.isnull(price):
+                self._prices[symbol] = price
+
+            if symbol != self.active:
+                return None
+
+            stored = self._stored(bar)
+
+            # same (resolution) bar
+            if self._bars and self._bars[-1][0] == timestamp:
+                current = self._bars[-1][1]
+                if current['symbol'] == symbol:
+                    self._last = (symbol, added, timestamp, dict(current))
+                    self._merge(current, stored)
+                    return None
+                self._bars.pop()  # rolled: the new contract's bar
+
+            self._last = (symbol, added, timestamp, None)
+            self._bars.append((timestamp, stored))
+
+        return dict(bar)
+
+    def revise(self, timestamp, bar):
+        """Replaces the last added bar of an expiry with a revised version
+        of it (eg. a streamed bar that was updated after it was added)
+
+        :Parameters:
+            timestamp : datetime
+                The bar's time (same as the added bar's)
+            bar : dict
+                The revised bar
+
+        :Returns:
+            bar : dict
+                The continuous contract's revised bar (``None`` if the
+                bar isn't the active contract's last added bar)
+        """
+        symbol = bar['symbol']
+        price = bar['close'] if 'close' in bar else bar.get('last')
+
+        with self._lock:
+            if symbol not in self._added or self._added[symbol] != timestamp:
+                return None
+
+            # replace the bar's volume in the rolling window
+            volumes = self._volumes[symbol]
+            volume = bar.get('volume')
+            volume = 0. if pd.isnull(volume) else float(volume)
+            volumes[1] += volume - volumes[0][-1]
+            volumes[0][-1] = volume
+
+            if not pd.isnull(price):
+                self._prices[symbol] = price
+
+            last = self._last
+            if last is None or last[:2] != (symbol, timestamp) or \
+                    not self._bars or self._bars[-1][0] != last[2]:
+                return None
+
+            stored = self._stored(bar)
+            if last[3] is not None:
+                # re-merge into the (resolution) bar as it was before
+                current = dict(last[3])
+                self._merge(current, stored)
+                stored = current
+            self._bars[-1] = (last[2], stored)
+
+        return dict(bar)
+
+    def _stored(self, bar):
+        """ the bar, net of the current offset """
+        stored = dict(bar)
+        for col in self.PRICES:
+            if col in stored:
+                stored[col] = stored[col] - self.offset
+        return stored
+
+    @staticmethod
+    def _merge(current, bar):
+        """ merges a bar into the current (resolution) bar """
+        for col, value in bar.items():
+            if col == "open" or pd.isnull(value):
+                continue
+            if col == "high":
+                current[col] = max(current[col], value)
+            elif col == "low":
+                current[col] = min(current[col], value)
+            elif col == "volume":
+                current[col] = current.get(col, 0) + value
+            else:
+                current[col] = value
 
-    try:
-        contract['open'] = contract['open'] + contract['gap']
-        contract['high'] = contract['high'] + contract['gap']
-        contract['low'] = contract['low'] + contract['gap']
-        contract['close'] = contract['close'] + contract['gap']
-        # contract['volume'] = df['volume'].resample("D").sum()
-    except Exception as e:
-        contract['last'] = contract['last'] + contract['gap']
+    # ---------------------------------------
+    def get_bars(self, lookback=None):
+        """Returns the (back-adjusted) continuous contract's bars
 
-    contract.drop(['gap'], axis=1, inplace=True)
+        :Optional:
+            lookback : int
+                Number of bars to return (default: all kept)
 
-    return contract
+        :Returns:
+            bars : pd.DataFrame
+                The continuous contract's bars
+        """
+        with self._lock:
+            bars = list(self._bars)
+            offset = self.offset
+
+        if lookback is not None:
+            bars = bars[-lookback:]
+        if not bars:
+            return pd.DataFrame()
+
+        df = pd.DataFrame([bar for _, bar in bars],
+                          index=[timestamp for timestamp, _ in bars])
+        for col in self.PRICES:
+            if col in df.columns:
+                df[col] = df[col] + offset
+        return df
 
 
 # -------------------------------------------
-def get_active_contract(symbol, url=None, n=1):
+def _scrape_active_contract(symbol, url=None, n=1):
+    """ most active expiry on CME (raises if it can't be scraped) """
+    from qtpylib import tools
 
     # cell content reader
     def read_cells(row):
@@ -199,80 +451,171 @@ def get_active_contract(symbol, url=None, n=1):
         except Exception as e:
             pass
 
+    c = get_contracts(url)
+    if tools.after_third_friday():
+        c = c[c.expiry != datetime.datetime.now().strftime('%Y%m')]
+
+    # based on volume
+    if len(c[c.volume > 100].index):
+        return c.sort_values(by=['volume', 'expiry'], ascending=False)[:n][
+            'expiry'].values[0]
+    else:
+        # based on date
+        return c[:1]['expiry'].values[0]
+
+
+def _guess_active_contract():
+    """ next month's expiry (or the one after, past the 3rd friday) """
+    from qtpylib import tools
+
+    if tools.after_third_friday():
+        return (datetime.datetime.now() + (datetime.timedelta(365 / 12) * 2)
+                ).strftime('%Y%m')
+    else:
+        return (datetime.datetime.now() + datetime.timedelta(365 / 12)
+                ).strftime('%Y%m')
+
+
+def get_active_contract(symbol, url=None, n=1):
     try:
-        c = get_contracts(url)
-        if tools.after_third_friday():
-            c = c[c.expiry != datetime.datetime.now().strftime('%Y%m')]
-
-        # based on volume
-        if len(c[c.volume > 100].index):
-            return c.sort_values(by=['volume', 'expiry'], ascending=False)[:n][
-                'expiry'].values[0]
-        else:
-            # based on date
-            return c[:1]['expiry'].values[0]
+        return _scrape_active_contract(symbol, url, n)
     except Exception as e:
-        if tools.after_third_friday():
-            return (datetime.datetime.now() + (datetime.timedelta(365 / 12) * 2)
-                    ).strftime('%Y%m')
-        else:
-            return (datetime.datetime.now() + datetime.timedelta(365 / 12)
-                    ).strftime('%Y%m')
+        return _guess_active_contract()
 
 
 # -------------------------------------------
-def make_tuple(symbol, expiry=None, exchange=None):
-    if expiry == None:
-        expiry = get_active_contract(symbol)
+# roll calendar: {symbol: (expiry, resolved at)}
+_roll_calendar = None
 
-    contract = get_ib_futures(symbol, exchange)
-    if contract is not None:
-        return (contract['symbol'], "FUT", contract['exchange'], contract[
-            'currency'], expiry, 0.0, "")
-    return None
 
-# -------------------------------------------
+def _roll_calendar_file():
+    return os.path.join(tempfile.gettempdir(), "futures_roll_calendar.pkl")
 
 
-def get_ib_futures(symbol=None, exchange=None, ttl=86400):
+def _load_roll_calendar():
+    global _roll_calendar
+    if _roll_calendar is None:
+        _roll_calendar = {}
+        try:
+            _roll_calendar.update(pd.read_pickle(_roll_calendar_file()))
+        except Exception as e:
+            pass
+    return _roll_calendar
 
-    cache_file = tempfile.gettempdir() + "/futures_spec.pkl"
 
-    if symbol is not None:
-        symbol = symbol.upper()
+def _save_roll_calendar():
+    try:
+        pd.to_pickle(_roll_calendar, _roll_calendar_file())
+        from qtpylib import tools
+        tools.chmod(_roll_calendar_file())
+    except Exception as e:
+        pass
 
-    def _get(df, symbol=None, exchange=None):
-        if symbol == "*" or symbol is None:
-            return df
 
-        if exchange is None:
-            symdf = df[df['symbol'] == symbol]
-            if len(symdf) > 0:
-                return symdf.to_dict(orient='records')[0]
-            else:
-                symdf = df[df['class'] == symbol]
-                if len(symdf) > 0:
-                    return symdf.to_dict(orient='records')[0]
+def _active_contracts_from_db(symbols, dbconn, lookback=5):
+    """ most active (unexpired) expiry per symbol, based on the
+    volume of the last ``lookback`` days in the local bars table """
+    groups = [symbol + "_F" for symbol in symbols]
+    now = datetime.datetime.utcnow()
 
-        symdf = df[(df['exchange'] == exchange) & (df['symbol'] == symbol)]
-        if len(symdf) == 1:
-            return symdf.to_dict(orient='records')[0]
-        else:
-            symdf = df[(df['exchange'] == exchange) & (df['class'] == symbol)]
-            if len(symdf) == 1:
-                return symdf.to_dict(orient='records')[0]
+    sql = """SELECT s.symbol_group, s.expiry, SUM(b.volume) AS volume
+        FROM `bars` b INNER JOIN `symbols` s ON b.symbol_id = s.id
+        WHERE s.asset_class='FUT' AND s.symbol_group IN (%s)
+        AND s.expiry > %%s AND b.datetime >= %%s
+        GROUP BY s.symbol_group, s.expiry""" % ", ".join(["%s"] * len(groups))
 
-        return None
+    try:
+        data = pd.read_sql(sql, dbconn, params=groups + [
+            now.strftime("%Y-%m-%d"),
+            (now - datetime.timedelta(days=lookback)).strftime("%Y-%m-%d")])
+    except Exception as e:
+        logging.getLogger(__name__).warning(
+            "Can't read futures volumes from the database: %s", e)
+        return {}
+
+    data = data[data['volume'] > 0].sort_values(
+        by=['volume', 'expiry'], ascending=[False, True]
+    ).drop_duplicates(subset=['symbol_group'], keep='first')
+
+    return {group[:-2]: pd.to_datetime(expiry).strftime('%Y%m')
+            for group, expiry in zip(data['symbol_group'], data['expiry'])}
+
+
+def get_active_contracts(symbols, dbconn=None, lookback=5, ttl=86400):
+    """Most active contract expiries for a futures universe
+
+    Expiries come from the roll calendar (cached resolutions), then from
+    the volumes in the blotter's ``bars``/``symbols`` tables (a single
+    query for all the symbols), and only symbols without local data are
+    looked up on CME (``get_active_contract()``). Expiries that can't be
+    resolved are guessed and aren't cached.
+
+    :Parameters:
+        symbols : list
+            Futures symbols (eg. ``["ES", "CL"]``)
+
+    :Optional:
+        dbconn : object
+            Blotter's database connection (default: no local data)
+        lookback : int
+            Sum volumes over this many days of bars (default: 5)
+        ttl : int
+            Use the roll calendar's expiries for this many seconds
+            (default: 86400)
+
+    :Returns:
+        expiries : dict
+            {symbol: expiry (YYYYMM)}
+    """
+    symbols = [symbol.upper() for symbol in symbols]
+    calendar = _load_roll_calendar()
+    now = time.time()
+
+    expiries = {symbol: calendar[symbol][0] for symbol in symbols
+                if symbol in calendar and now - calendar[symbol][1] < ttl}
+
+    missing = [symbol for symbol in symbols if symbol not in expiries]
+    if not missing:
+        return expiries
+
+    if dbconn is not None:
+        resolved = _active_contracts_from_db(missing, dbconn, lookback)
+    else:
+        resolved = {}
+
+    for symbol in missing:
+        if symbol not in resolved:
+            try:
+                resolved[symbol] = _scrape_active_contract(symbol)
+            except Exception as e:
+                # a guess: used, but not cached
+                expiries[symbol] = _guess_active_contract()
+
+    for symbol, expiry in resolved.items():
+        calendar[symbol] = (expiry, now)
+    if resolved:
+        _save_roll_calendar()
+
+    expiries.update(resolved)
+    return expiries
 
-    if os.path.exists(cache_file):
-        if (int(time.time()) - int(os.path.getmtime(cache_file))) < ttl:
-            df = pd.read_pickle(cache_file)
 
-            symdf = _get(df, symbol, exchange)
-            if symdf is not None:
-                return symdf
+# -------------------------------------------
+def make_tuple(symbol, expiry=None, exchange=None):
+    if expiry == None:
+        expiry = get_active_contracts([symbol])[symbol.upper()]
 
-    # else...
+    contract = get_ib_futures(symbol, exchange)
+    if contract is not None:
+        return (contract['symbol'], "FUT", contract['exchange'], contract[
+            'currency'], expiry, 0.0, "")
+    return None
+
+
+# -------------------------------------------
+def _download_ib_futures():
+    """ downloads the futures specs (and margin requirements) from IB
+    (or from qtpylib.io if IB's page can't be parsed) """
     try:
         dfs = pd.read_html(
             'https://www.interactivebrokers.ca/en/index.php?f=marginCA&p=fut')
@@ -306,15 +649,188 @@ def get_ib_futures(symbol=None, exchange=None, ttl=86400):
         # fallback - download specs from qtpylib.io
         df = pd.read_csv('https://qtpylib.io/resources/futures_spec.csv.gz')
 
-    # output
-    df.to_pickle(cache_file)
-    tools.chmod(cache_file)
+    return df
 
-    symdf = _get(df, symbol, exchange)
-    if symdf is not None:
-        return symdf
 
-    return None
+# =============================================
+class FuturesSpecs():
+    """Process-wide, in-memory futures specs (and margin requirements),
+    indexed by symbol, class, (exchange, symbol) and (exchange, class)
+    so lookups are dict reads.
+
+    Specs are loaded once per process from the cache file (however old
+    it is) and refreshed from IB in a background thread once they're
+    older than ``ttl`` seconds; until the refresh completes (or if there's
+    no network) the last known specs are used. Specs are only downloaded
+    in the foreground when there's no cache file at all, and a failed
+    download isn't retried for ``RETRY_SEC`` seconds. Until specs were
+    downloaded once, the snapshot bundled with QTPyLib (``SNAPSHOT``: the
+    most traded contracts' symbols, classes, exchanges and currencies,
+    without margins) is used.
+
+    :Optional:
+        cache_file : str
+            Path of the specs' cache file
+            (default: <tempdir>/futures_spec.pkl)
+        ttl : int
+            Refresh specs older than this many seconds (default: 86400)
+    """
+
+    # don't retry a failed download (or refresh) before this many seconds
+    RETRY_SEC = 300
+
+    # offline specs (used until specs were downloaded)
+    SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "futures_spec.csv")
+
+    def __init__(self, cache_file=None, ttl=86400):
+        self.cache_file = cache_file if cache_file is not None else \
+            os.path.join(tempfile.gettempdir(), "futures_spec.pkl")
+        self.ttl = ttl
+
+        # (df, indexes, loaded at) - replaced as a whole on refresh
+        self._data = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._failed = 0
+
+    # ---------------------------------------
+    @staticmethod
+    def _build(df):
+        """ builds the lookup indexes ((exchange, ...) keys that
+        aren't unique map to None, same as the old masks' len==1) """
+        by_symbol, by_class, by_exchange = {}, {}, {}
+
+        for record in df.to_dict(orient='records'):
+            by_symbol.setdefault(record['symbol'], record)
+            by_class.setdefault(record['class'], record)
+
+            for key in [("symbol", record['exchange'], record['symbol']),
+                        ("class", record['exchange'], record['class'])]:
+                by_exchange[key] = None if key in by_exchange else record
+
+        return by_symbol, by_class, by_exchange
+
+    def _set(self, df, loaded):
+        self._data = (df, self._build(df), loaded)
+
+    # ---------------------------------------
+    def _load(self):
+        """ loads specs from the cache file (or downloads them, falling
+        back to the bundled snapshot) """
+        if os.path.exists(self.cache_file):
+            try:
+                self._set(pd.read_pickle(self.cache_file),
+                          os.path.getmtime(self.cache_file))
+                return
+            except Exception as e:
+                pass
+
+        if time.time() - self._failed >= self.RETRY_SEC:
+            try:
+                self._save(_download_ib_futures())
+                return
+            except Exception as e:
+                self._failed = time.time()
+                logging.getLogger(__name__).warning(
+                    "Can't download futures specs (using the bundled "
+                    "snapshot): %s", e)
+
+        # always stale, so it's replaced once a refresh succeeds
+        try:
+            self._set(pd.read_csv(self.SNAPSHOT), 0)
+        except Exception as e:
+            pass
+
+    def _save(self, df):
+        self._set(df, time.time())
+        try:
+            df.to_pickle(self.cache_file)
+            from qtpylib import tools
+            tools.chmod(self.cache_file)
+        except Exception as e:
+            pass
+
+    # ---------------------------------------
+    def refresh(self, wait=False):
+        """ re-downloads the specs in a background thread
+        (use ``wait=True`` to block until it's done) """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        thread = threading.Thread(target=self._refresh,
+                                  name="futures_specs", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _refresh(self):
+        try:
+            self._save(_download_ib_futures())
+        except Exception as e:
+            self._failed = time.time()
+            logging.getLogger(__name__).warning(
+                "Can't refresh futures specs (using cached specs): %s", e)
+        finally:
+            self._refreshing = False
+
+    # ---------------------------------------
+    def get(self, symbol=None, exchange=None, ttl=None):
+        """Get a contract's specs
+
+        :Optional:
+            symbol : str
+                IB symbol or class (``None`` or "*" for all contracts)
+            exchange : str
+                Contract's exchange
+            ttl : int
+                Refresh specs older than this many seconds
+                (default: ``self.ttl``)
+
+        :Returns:
+            specs : dict / pd.DataFrame
+                The contract's specs (``None`` if not found),
+                or all the specs for symbol ``None``/"*"
+        """
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._load()
+
+        data = self._data
+        if data is None:
+            return None
+
+        df, (by_symbol, by_class, by_exchange), loaded = data
+        now = time.time()
+        if now - loaded >= (self.ttl if ttl is None else ttl) and \
+                now - self._failed >= self.RETRY_SEC:
+            self.refresh()
+
+        if symbol == "*" or symbol is None:
+            return df.copy()
+
+        symbol = symbol.upper()
+        if exchange is None:
+            record = by_symbol.get(symbol, by_class.get(symbol))
+        else:
+            record = by_exchange.get(("symbol", exchange, symbol)) or \
+                by_exchange.get(("class", exchange, symbol))
+
+        return dict(record) if record is not None else None
+
+
+# process-wide specs
+specs = FuturesSpecs()
+
+
+# -------------------------------------------
+def get_ib_futures(symbol=None, exchange=None, ttl=86400):
+    """ get a futures contract's specs and margin requirements
+    (see ``FuturesSpecs.get()``) """
+    return specs.get(symbol, exchange, ttl)
 
 
 # -------------------------------------------
@@ -21,6 +21,7 @@
 
 import warnings
 import sys
+from collections import deque
 from datetime import datetime, timedelta
 
 import numpy as np
@@ -50,7 +51,8 @@ def numpy_rolling_series(func):
 
         new_series = np.empty(len(series)) * np.nan
         calculated = func(series, window)
-        new_series[-len(calculated):] = calculated
+        if len(calculated):
+            new_series[-len(calculated):] = calculated
 
         if as_source and isinstance(data, pd.Series):
             return pd.Series(index=data.index, data=new_series)
@@ -60,14 +62,95 @@ def numpy_rolling_series(func):
     return func_wrapper
 
 
+def numpy_rolling_moments(data, window):
+    """
+    rolling mean and sample variance (ddof=1) in O(n).
+
+    sums are accumulated within blocks of ``window`` items, relative
+    to each block's mean, so rounding errors depend on the window size
+    rather than on the length of the series (or the price level).
+    windows containing NaN/inf are returned as NaN.
+
+    returns two arrays of len(data) - window + 1 items
+    """
+    x = np.asarray(data, dtype=float)
+    size = len(x)
+    if window < 1 or size < window:
+        return np.array([]), np.array([])
+
+    valid = np.isfinite(x)
+    blocks = -(-size // window)
+
+    values = np.zeros(blocks * window)
+    values[:size] = np.where(valid, x, 0)
+    values = values.reshape(blocks, window)
+    counts = np.zeros(blocks * window)
+    counts[:size] = valid
+    counts = counts.reshape(blocks, window)
+
+    # block-local reference (the mean of its valid values)
+    ref = values.sum(axis=1) / np.maximum(counts.sum(axis=1), 1)
+    dev = (values - ref[:, None]) * counts
+    sum1 = np.cumsum(dev, axis=1)
+    sum2 = np.cumsum(dev * dev, axis=1)
+
+    # window ending at i = head of block k + tail of block k-1
+    ends = np.arange(window - 1, size)
+    block, pos = ends // window, ends % window
+    prev = np.maximum(block - 1, 0)
+    tail = np.where(pos < window - 1, window - 1 - pos, 0)
+    has_tail = tail > 0
+
+    tail1 = np.where(has_tail, sum1[prev, -1] - sum1[prev, pos], 0)
+    tail2 = np.where(has_tail, sum2[prev, -1] - sum2[prev, pos], 0)
+
+    # shift the tail's sums to the head block's reference
+    shift = np.where(has_tail, ref[prev] - ref[block], 0)
+    tail2 = tail2 + 2 * shift * tail1 + tail * shift * shift
+    tail1 = tail1 + tail * shift
+
+    total1 = sum1[block, pos] + tail1
+    total2 = sum2[block, pos] + tail2
+
+    mean = ref[block] + total1 / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = np.maximum(total2 - total1 * total1 / window, 0) / (window - 1)
+
+    # invalidate windows with missing values
+    invalid = np.concatenate(([0], np.cumsum(~valid)))
+    invalid = (invalid[window:] - invalid[:-window]) > 0
+    mean[invalid] = np.nan
+    var[invalid] = np.nan
+
+    return mean, var
+
+
 @numpy_rolling_series
 def numpy_rolling_mean(data, window, as_source=False):
-    return np.mean(numpy_rolling_window(data, window), axis=-1)
+    return numpy_rolling_moments(data, window)[0]
 
 
 @numpy_rolling_series
 def numpy_rolling_std(data, window, as_source=False):
-    return np.std(numpy_rolling_window(data, window), axis=-1, ddof=1)
+    return np.sqrt(numpy_rolling_moments(data, window)[1])
+
+
+def numpy_linear_filter(data, alpha, initial):
+    """
+    evaluates y[i] = (1 - alpha) * y[i-1] + alpha * data[i]
+    with y[0] = initial (first order IIR filter), without a python loop.
+    2-D data is filtered column-wise (initial is then one value per column).
+    returns an array one item longer than data (starting with initial).
+    as with the recursion, a NaN makes all the later values NaN
+    """
+    values = np.concatenate((np.asarray(initial, dtype=float)[None],
+                             np.asarray(data, dtype=float)))
+    filtered = pd.DataFrame(values).ewm(alpha=alpha, adjust=False).mean(
+    ).values.reshape(values.shape)
+
+    # ewm skips NaNs, the recursion propagates them
+    filtered[np.cumsum(np.isnan(values), axis=0) > 0] = np.nan
+    return filtered
 
 
 # ---------------------------------------------
@@ -112,10 +195,13 @@ def heikinashi(bars):
     bars['ha_close'] = (bars['open'] + bars['high'] +
                         bars['low'] + bars['close']) / 4
 
-    # ha open
-    bars.at[0, 'ha_open'] = (bars.at[0, 'open'] + bars.at[0, 'close']) / 2
-    for i in range(1, len(bars)):
-        bars.at[i, 'ha_open'] = (bars.at[i - 1, 'ha_open'] + bars.at[i - 1, 'ha_close']) / 2
+    # ha open (ha_open[i] = (ha_open[i-1] + ha_close[i-1]) / 2)
+    if len(bars) > 0:
+        bars['ha_open'] = numpy_linear_filter(
+            bars['ha_close'].values[:-1], 0.5,
+            (bars['open'].values[0] + bars['close'].values[0]) / 2)
+    else:
+        bars['ha_open'] = bars['ha_close']
 
     bars['ha_high'] = bars.loc[:, ['high', 'ha_open', 'ha_close']].max(axis=1)
     bars['ha_low'] = bars.loc[:, ['low', 'ha_open', 'ha_close']].min(axis=1)
@@ -131,14 +217,19 @@ def heikinashi(bars):
 
 def tdi(series, rsi_lookback=13, rsi_smooth_len=2,
         rsi_signal_len=7, bb_lookback=34, bb_std=1.6185):
+    return _tdi(rsi(series, rsi_lookback), rsi_smooth_len,
+                rsi_signal_len, bb_lookback, bb_std)
+
 
-    rsi_data = rsi(series, rsi_lookback)
+def _tdi(rsi_data, rsi_smooth_len=2, rsi_signal_len=7,
+         bb_lookback=34, bb_std=1.6185):
+    """ tdi from a precomputed rsi """
     rsi_smooth = sma(rsi_data, rsi_smooth_len)
     rsi_signal = sma(rsi_data, rsi_signal_len)
 
     bb_series = bollinger_bands(rsi_data, bb_lookback, bb_std)
 
-    return pd.DataFrame(index=series.index, data={
+    return pd.DataFrame(index=rsi_data.index, data={
         "rsi": rsi_data,
         "rsi_signal": rsi_signal,
         "rsi_smooth": rsi_smooth,
@@ -206,8 +297,11 @@ def true_range(bars):
 # ---------------------------------------------
 
 def atr(bars, window=14, exp=False):
-    tr = true_range(bars)
+    return _atr(true_range(bars), window, exp)
+
 
+def _atr(tr, window=14, exp=False):
+    """ atr from a precomputed true range """
     if exp:
         res = rolling_weighted_mean(tr, window)
     else:
@@ -288,9 +382,9 @@ def rolling_min(series, window=14, min_periods=None):
 def rolling_max(series, window=14, min_periods=None):
     min_periods = window if min_periods is None else min_periods
     try:
-        return series.rolling(window=window, min_periods=min_periods).min()
+        return series.rolling(window=window, min_periods=min_periods).max()
     except Exception as e:
-        return pd.Series(series).rolling(window=window, min_periods=min_periods).min()
+        return pd.Series(series).rolling(window=window, min_periods=min_periods).max()
 
 
 # ---------------------------------------------
@@ -338,7 +432,12 @@ def vwap(bars):
     (input can be pandas series or numpy array)
     bars are usually mid [ (h+l)/2 ] or typical [ (h+l+c)/3 ]
     """
-    typical = ((bars['high'] + bars['low'] + bars['close']) / 3).values
+    return _vwap(bars, typical_price(bars))
+
+
+def _vwap(bars, typical):
+    """ vwap from a precomputed typical price """
+    typical = typical.values
     volume = bars['volume'].values
 
     return pd.Series(index=bars.index,
@@ -353,9 +452,12 @@ def rolling_vwap(bars, window=200, min_periods=None):
     (input can be pandas series or numpy array)
     bars are usually mid [ (h+l)/2 ] or typical [ (h+l+c)/3 ]
     """
-    min_periods = window if min_periods is None else min_periods
+    return _rolling_vwap(bars, typical_price(bars), window, min_periods)
+
 
-    typical = ((bars['high'] + bars['low'] + bars['close']) / 3)
+def _rolling_vwap(bars, typical, window=200, min_periods=None):
+    """ rolling vwap from a precomputed typical price """
+    min_periods = window if min_periods is None else min_periods
     volume = bars['volume']
 
     left = (volume * typical).rolling(window=window,
@@ -367,34 +469,36 @@ def rolling_vwap(bars, window=200, min_periods=None):
 
 # ---------------------------------------------
 
-def rsi(series, window=14):
-    """
-    compute the n period relative strength indicator
-    """
+def _rsi_values(values, window):
+    """ rsi of a 1-D array (or column-wise of a 2-D array) """
 
     # 100-(100/relative_strength)
-    deltas = np.diff(series)
+    deltas = np.diff(values, axis=0)
     seed = deltas[:window + 1]
 
     # default values
-    ups = seed[seed > 0].sum() / window
-    downs = -seed[seed < 0].sum() / window
-    rsival = np.zeros_like(series)
+    ups = np.where(seed > 0, seed, 0).sum(axis=0) / window
+    downs = -np.where(seed < 0, seed, 0).sum(axis=0) / window
+    rsival = np.zeros(values.shape)
     rsival[:window] = 100. - 100. / (1. + ups / downs)
 
-    # period values
-    for i in range(window, len(series)):
-        delta = deltas[i - 1]
-        if delta > 0:
-            upval = delta
-            downval = 0
-        else:
-            upval = 0
-            downval = -delta
+    # period values: wilder's smoothing, seeded with the default values
+    if len(values) > window:
+        deltas = deltas[window - 1:]
+        ups = numpy_linear_filter(np.where(deltas > 0, deltas, 0),
+                                  1. / window, ups)
+        downs = numpy_linear_filter(np.where(deltas > 0, 0, -deltas),
+                                    1. / window, downs)
+        rsival[window:] = (100. - 100. / (1. + ups / downs))[1:]
 
-        ups = (ups * (window - 1) + upval) / window
-        downs = (downs * (window - 1.) + downval) / window
-        rsival[i] = 100. - 100. / (1. + ups / downs)
+    return rsival
+
+
+def rsi(series, window=14):
+    """
+    compute the n period relative strength indicator
+    """
+    rsival = _rsi_values(np.asarray(series, dtype=float), window)
 
     # return rsival
     return pd.Series(index=series.index, data=rsival)
@@ -490,13 +594,19 @@ def implied_volatility(series, window=252):
 # ---------------------------------------------
 
 def keltner_channel(bars, window=14, atrs=2):
-    typical_mean = rolling_mean(typical_price(bars), window)
-    atrval = atr(bars, window) * atrs
+    return _keltner_channel(typical_price(bars), atr(bars, window),
+                            window, atrs)
+
+
+def _keltner_channel(typical, atrval, window=14, atrs=2):
+    """ keltner channel from a precomputed typical price and atr """
+    typical_mean = rolling_mean(typical, window)
+    atrval = atrval * atrs
 
     upper = typical_mean + atrval
     lower = typical_mean - atrval
 
-    return pd.DataFrame(index=bars.index, data={
+    return pd.DataFrame(index=typical.index, data={
         'upper': upper.values,
         'mid': typical_mean.values,
         'lower': lower.values
@@ -519,10 +629,14 @@ def cci(series, window=14):
     """
     compute commodity channel index
     """
-    price = typical_price(series)
+    return _cci(typical_price(series), window)
+
+
+def _cci(price, window=14):
+    """ cci from a precomputed typical price """
     typical_mean = rolling_mean(price, window)
     res = (price - typical_mean) / (.015 * np.std(typical_mean))
-    return pd.Series(index=series.index, data=res)
+    return pd.Series(index=price.index, data=res)
 
 
 # ---------------------------------------------
@@ -599,12 +713,748 @@ def pvt(bars):
 
 
 def chopiness(bars, window=14):
-    atrsum = true_range(bars).rolling(window).sum()
+    return _chopiness(bars, true_range(bars), window)
+
+
+def _chopiness(bars, tr, window=14):
+    """ chopiness from a precomputed true range """
+    atrsum = tr.rolling(window).sum()
     highs = bars['high'].rolling(window).max()
     lows = bars['low'].rolling(window).min()
     return 100 * np.log10(atrsum / (highs - lows)) / np.log10(window)
 
 
+# =============================================
+# panel (multi-symbol) indicators
+# =============================================
+
+def panel(bars, columns='close', symbol_column='symbol'):
+    """Pivots long-format bars (one row per timestamp/symbol, as in
+    ``Algo.bars``) into a wide, time x symbol, DataFrame
+
+    :Parameters:
+        bars : pd.DataFrame
+            Bars of multiple symbols
+
+    :Optional:
+        columns : str / list
+            Column(s) to pivot. A list returns (column, symbol) columns
+        symbol_column : str
+            Column holding the symbol (default: 'symbol')
+
+    :Returns:
+        wide : pd.DataFrame
+            Rows are timestamps, columns are symbols (missing bars are NaN)
+    """
+    wide = bars.groupby([bars.index, bars[symbol_column]],
+                        sort=True)[columns].last().unstack(symbol_column)
+    wide.index.name = bars.index.name
+    return wide
+
+
+def _panel_frame(data, column='close', symbol_column='symbol'):
+    """ data as a wide DataFrame (2-D array, wide or long-format frame) """
+    if isinstance(data, pd.DataFrame):
+        if symbol_column in data.columns:
+            return panel(data, column, symbol_column)
+        return data.astype(float)
+    return pd.DataFrame(np.asarray(data, dtype=float))
+
+
+def _panel_fields(bars, fields, symbol_column='symbol'):
+    """ wide frames of multiple fields (long-format frame,
+    (field, symbol) columns or dict of wide frames/2-D arrays) """
+    if isinstance(bars, pd.DataFrame) and symbol_column in bars.columns:
+        bars = panel(bars, list(fields), symbol_column)
+    return [_panel_frame(bars[field]) for field in fields]
+
+
+def _pack(frame, valid=None):
+    """ moves each column's bars (non-NaN rows, or ``valid`` rows) to the
+    top rows, in order, so windows and shifts count the symbol's own bars
+    (as the per-symbol indicators do) rather than the panel's rows.
+    returns the packed frame and a function that puts results back
+    (NaN where the symbol has no bar) """
+    values = frame.values
+    valid = ~np.isnan(values) if valid is None else valid
+    order = np.argsort(~valid, axis=0, kind='stable')
+
+    packed = np.take_along_axis(values, order, axis=0)
+    packed[~np.take_along_axis(valid, order, axis=0)] = np.nan
+
+    def unpack(result):
+        values = np.full(frame.shape, np.nan)
+        np.put_along_axis(values, order, np.asarray(result, dtype=float),
+                          axis=0)
+        values[~valid] = np.nan
+        return pd.DataFrame(values, index=frame.index, columns=frame.columns)
+
+    return pd.DataFrame(packed, columns=frame.columns), unpack
+
+
+def _pack_fields(bars, fields):
+    """ packed wide frames of multiple fields (bars are where the
+    last field, eg. close, isn't NaN) and their unpack function """
+    frames = _panel_fields(bars, fields)
+    valid = frames[-1].notnull().values
+    packed = [_pack(frame, valid) for frame in frames]
+    return [frame for frame, _ in packed], packed[0][1]
+
+
+# ---------------------------------------------
+# panel indicators are computed over each symbol's own bars (rows where
+# the symbol's value is NaN are skipped), so they match the per-symbol
+# indicators when symbols have gaps or start at different times
+
+def panel_sma(data, window=200, min_periods=None):
+    """ ``sma()`` of every symbol (column) in one pass """
+    min_periods = window if min_periods is None else min_periods
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(data.rolling(window=window, min_periods=min_periods).mean())
+
+
+def panel_wma(data, window=200, min_periods=None):
+    """ ``wma()`` of every symbol (column) in one pass """
+    min_periods = window if min_periods is None else min_periods
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(data.ewm(span=window, min_periods=min_periods).mean())
+
+
+def panel_rolling_std(data, window=200, min_periods=None):
+    """ ``rolling_std()`` of every symbol (column) in one pass """
+    min_periods = window if min_periods is None else min_periods
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(data.rolling(window=window, min_periods=min_periods).std())
+
+
+def panel_rolling_min(data, window=14, min_periods=None):
+    """ ``rolling_min()`` of every symbol (column) in one pass """
+    min_periods = window if min_periods is None else min_periods
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(data.rolling(window=window, min_periods=min_periods).min())
+
+
+def panel_rolling_max(data, window=14, min_periods=None):
+    """ ``rolling_max()`` of every symbol (column) in one pass """
+    min_periods = window if min_periods is None else min_periods
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(data.rolling(window=window, min_periods=min_periods).max())
+
+
+# ---------------------------------------------
+
+def panel_returns(data):
+    """ ``returns()`` of every symbol (column) in one pass """
+    data, unpack = _pack(_panel_frame(data))
+    return unpack((data / data.shift(1) - 1).replace(
+        [np.inf, -np.inf], np.nan))
+
+
+def panel_log_returns(data):
+    """ ``log_returns()`` of every symbol (column) in one pass """
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(np.log(data / data.shift(1)).replace(
+        [np.inf, -np.inf], np.nan))
+
+
+def panel_roc(data, window=14):
+    """ ``roc()`` of every symbol (column) in one pass """
+    data, unpack = _pack(_panel_frame(data))
+    return unpack((data - data.shift(window)) / data.shift(window))
+
+
+# ---------------------------------------------
+
+def panel_rsi(data, window=14):
+    """ ``rsi()`` of every symbol (column) in one pass.
+    each symbol's rsi is seeded from its own first bars """
+    data, unpack = _pack(_panel_frame(data))
+    return unpack(_rsi_values(data.values, window))
+
+
+def panel_macd(data, fast=3, slow=10, smooth=16):
+    """ ``macd()`` of every symbol (column) in one pass.
+    returns (macd/signal/histogram, symbol) columns """
+    data, unpack = _pack(_panel_frame(data))
+    macd_line = data.ewm(span=fast, min_periods=fast).mean() - \
+        data.ewm(span=slow, min_periods=slow).mean()
+    signal = macd_line.ewm(span=smooth, min_periods=smooth).mean()
+    return pd.concat({'macd': unpack(macd_line),
+                      'signal': unpack(signal),
+                      'histogram': unpack(macd_line - signal)}, axis=1)
+
+
+def panel_bollinger_bands(data, window=20, stds=2):
+    """ ``bollinger_bands()`` of every symbol (column) in one pass.
+    returns (upper/mid/lower, symbol) columns """
+    data, unpack = _pack(_panel_frame(data))
+    ma = data.rolling(window=window, min_periods=1).mean()
+    std = data.rolling(window=window, min_periods=1).std()
+    return pd.concat({'upper': unpack(ma + std * stds),
+                      'mid': unpack(ma),
+                      'lower': unpack(ma - std * stds)}, axis=1)
+
+
+def panel_zscore(data, window=20, stds=1):
+    """ ``zscore()`` of every symbol (column) in one pass """
+    data, unpack = _pack(_panel_frame(data))
+    std = data.rolling(window=window).std()
+    mean = data.rolling(window=window).mean()
+    return unpack((data - mean) / (std * stds))
+
+
+# ---------------------------------------------
+
+def _true_range(high, low, close):
+    prev = close.shift(1)
+    return np.fmax(high - low, np.fmax(abs(high - prev), abs(low - prev)))
+
+
+def panel_true_range(bars):
+    """ ``true_range()`` of every symbol in one pass.
+    ``bars`` is a long-format frame, a frame with (field, symbol)
+    columns or a dict of wide high/low/close frames """
+    (high, low, close), unpack = _pack_fields(bars, ('high', 'low', 'close'))
+    return unpack(_true_range(high, low, close))
+
+
+def panel_atr(bars, window=14, exp=False):
+    """ ``atr()`` of every symbol in one pass (see ``panel_true_range()``) """
+    (high, low, close), unpack = _pack_fields(bars, ('high', 'low', 'close'))
+    tr = _true_range(high, low, close)
+    if exp:
+        return unpack(tr.ewm(span=window, min_periods=window).mean())
+    return unpack(tr.rolling(window=window, min_periods=window).mean())
+
+
+def panel_stoch(bars, window=14, d=3, k=3, fast=False):
+    """ ``stoch()`` of every symbol in one pass (see ``panel_true_range()``).
+    returns (fast_k/fast_d or slow_k/slow_d, symbol) columns """
+    (high, low, close), unpack = _pack_fields(bars, ('high', 'low', 'close'))
+    lowest = low.rolling(window).min()
+    fast_k = 100 * (close - lowest) / (high.rolling(window).max() - lowest)
+
+    if fast:
+        return pd.concat({'fast_k': unpack(fast_k),
+                          'fast_d': unpack(fast_k.rolling(d).mean())}, axis=1)
+
+    slow_k = fast_k.rolling(k).mean()
+    return pd.concat({'slow_k': unpack(slow_k),
+                      'slow_d': unpack(slow_k.rolling(d).mean())}, axis=1)
+
+
+# =============================================
+# streaming (incremental) indicators
+# =============================================
+
+def _is_nan(value):
+    return value != value
+
+
+class StreamingIndicator():
+    """Base class for stateful indicators that update in O(1)
+    per new value (bar/tick) instead of recomputing the whole window.
+
+    ``update()`` accepts either a scalar or a bar/tick (dict-like), from
+    which the ``source`` column is read. Calling ``update()`` again with
+    the same ``timestamp`` revises the last value (for bars that are
+    still being built) by undoing the previous update first.
+
+    Values match the batch functions of this module run over the same
+    series (up to floating point rounding of running sums).
+
+    :Optional:
+        source : str
+            Column to read from bars/ticks (default: close)
+        history : int
+            Number of past values kept in ``values`` (default: 2)
+    """
+
+    source = "close"
+
+    def __init__(self, source=None, history=2):
+        if source is not None:
+            self.source = source
+        self.timestamp = None
+        self.value = np.nan
+        self.values = deque(maxlen=max(int(history), 1))
+
+    def _input(self, data):
+        try:
+            return float(data[self.source])
+        except (TypeError, IndexError, KeyError):
+            return float(data)
+
+    def _push(self, data):
+        """ apply a new input, save undo state and return the new value """
+        raise NotImplementedError
+
+    def _revert(self):
+        """ undo the last _push """
+        raise NotImplementedError
+
+    def update(self, data, timestamp=None):
+        """ feed a new value (or revise the last one if timestamp
+        equals the previous update's timestamp) and return the result """
+        revise = timestamp is not None and timestamp == self.timestamp \
+            and self.values
+        if revise:
+            self._revert()
+            self.values.pop()
+
+        self.timestamp = timestamp
+        self.value = self._push(data)
+        self.values.append(self.value)
+        return self.value
+
+
+# ---------------------------------------------
+
+class StreamingEMA(StreamingIndicator):
+    """ Incremental ``wma()``/``rolling_weighted_mean()``
+    (``series.ewm(span=window, min_periods=window).mean()``) """
+
+    def __init__(self, window=200, min_periods=None, adjust=True, **kwargs):
+        super().__init__(**kwargs)
+        self.min_periods = window if min_periods is None else min_periods
+        self.adjust = adjust
+
+        # same arithmetic as pandas' ewm
+        alpha = 1. / (1. + ((window - 1) / 2.))
+        self._old_wt_factor = 1. - alpha
+        self._new_wt = 1. if adjust else alpha
+
+        self._state = (0, np.nan, 1., 0)  # count, weighted, old_wt, nobs
+        self._undo = None
+
+    def _push(self, data):
+        cur = self._input(data)
+        self._undo = self._state
+        count, weighted, old_wt, nobs = self._state
+
+        is_observation = not _is_nan(cur)
+        nobs += is_observation
+
+        if count == 0:
+            weighted = cur
+        elif not _is_nan(weighted):
+            old_wt *= self._old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = old_wt * weighted + self._new_wt * cur
+                    weighted /= (old_wt + self._new_wt)
+                old_wt = old_wt + self._new_wt if self.adjust else 1.
+        elif is_observation:
+            weighted = cur
+
+        self._state = (count + 1, weighted, old_wt, nobs)
+        return weighted if nobs >= self.min_periods else np.nan
+
+    def _revert(self):
+        self._state = self._undo
+
+
+StreamingWMA = StreamingEMA
+
+
+# ---------------------------------------------
+
+class StreamingSMA(StreamingIndicator):
+    """ Incremental ``sma()``/``rolling_mean()``
+    (Kahan-compensated running sum, same as pandas' rolling mean) """
+
+    def __init__(self, window=200, min_periods=None, **kwargs):
+        super().__init__(**kwargs)
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self._window = deque()
+        # nobs, sum, compensation add/remove, negatives, same value run, prev
+        self._state = (0, 0., 0., 0., 0, 0, np.nan)
+        self._undo = None
+
+    def _push(self, data):
+        val = self._input(data)
+        self._undo = (self._state, None)
+        nobs, sum_x, comp_add, comp_remove, neg_ct, same, prev = self._state
+
+        self._window.append(val)
+        if len(self._window) > self.window:
+            old = self._window.popleft()
+            self._undo = (self._state, old)
+            if not _is_nan(old):
+                nobs -= 1
+                y = - old - comp_remove
+                t = sum_x + y
+                comp_remove = t - sum_x - y
+                sum_x = t
+                neg_ct -= old < 0
+
+        if not _is_nan(val):
+            nobs += 1
+            y = val - comp_add
+            t = sum_x + y
+            comp_add = t - sum_x - y
+            sum_x = t
+            neg_ct += val < 0
+            same = same + 1 if val == prev else 1
+            prev = val
+
+        self._state = (nobs, sum_x, comp_add, comp_remove, neg_ct, same, prev)
+
+        if nobs < self.min_periods or nobs == 0:
+            return np.nan
+        if same >= nobs:
+            return prev
+        result = sum_x / nobs
+        if (neg_ct == 0 and result < 0) or (neg_ct == nobs and result > 0):
+            return 0.
+        return result
+
+    def _revert(self):
+        self._state, old = self._undo
+        self._window.pop()
+        if old is not None:
+            self._window.appendleft(old)
+
+
+# ---------------------------------------------
+
+class StreamingStd(StreamingIndicator):
+    """ Incremental ``rolling_std()`` (Welford's method, ddof=1) """
+
+    def __init__(self, window=200, min_periods=None, ddof=1, **kwargs):
+        super().__init__(**kwargs)
+        self.window = window
+        self.min_periods = max(window if min_periods is None else min_periods, 1)
+        self.ddof = ddof
+        self._window = deque()
+        # nobs, mean, ssqdm, compensation add/remove, same value run, prev
+        self._state = (0, 0., 0., 0., 0., 0, np.nan)
+        self._undo = None
+
+    def _push(self, data):
+        val = self._input(data)
+        self._undo = (self._state, None)
+        nobs, mean_x, ssqdm_x, comp_add, comp_remove, same, prev = self._state
+
+        self._window.append(val)
+        if len(self._window) > self.window:
+            old = self._window.popleft()
+            self._undo = (self._state, old)
+            if not _is_nan(old):
+                nobs -= 1
+                if nobs:
+                    prev_mean = mean_x - comp_remove
+                    y = old - comp_remove
+                    t = y - mean_x
+                    comp_remove = t + mean_x - y
+                    mean_x = mean_x - t / nobs
+                    ssqdm_x = ssqdm_x - (old - prev_mean) * (old - mean_x)
+                else:
+                    mean_x = ssqdm_x = 0.
+
+        if not _is_nan(val):
+            nobs += 1
+            same = same + 1 if val == prev else 1
+            prev = val
+            prev_mean = mean_x - comp_add
+            y = val - comp_add
+            t = y - mean_x
+            comp_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+
+        self._state = (nobs, mean_x, ssqdm_x, comp_add, comp_remove, same, prev)
+
+        if nobs < self.min_periods or nobs <= self.ddof:
+            return np.nan
+        if nobs == 1 or same >= nobs:
+            return 0.
+        return np.sqrt(max(ssqdm_x / (nobs - self.ddof), 0))
+
+    def _revert(self):
+        self._state, old = self._undo
+        self._window.pop()
+        if old is not None:
+            self._window.appendleft(old)
+
+
+# ---------------------------------------------
+
+class StreamingRollingMax(StreamingIndicator):
+    """ Incremental rolling max (monotonic deque, amortized O(1)) """
+
+    def __init__(self, window=14, min_periods=None, **kwargs):
+        super().__init__(**kwargs)
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self._count = 0
+        self._nobs = 0
+        self._observed = deque()
+        self._candidates = deque()  # (position, value), decreasing
+        self._undo = None
+
+    def _better(self, new, old):
+        return new >= old
+
+    def _push(self, data):
+        val = self._input(data)
+        position = self._count
+        dropped_obs = dropped_front = None
+        dropped_back = []
+
+        # slide the window
+        self._observed.append(not _is_nan(val))
+        self._nobs += self._observed[-1]
+        if len(self._observed) > self.window:
+            dropped_obs = self._observed.popleft()
+            self._nobs -= dropped_obs
+        if self._candidates and \
+                self._candidates[0][0] <= position - self.window:
+            dropped_front = self._candidates.popleft()
+
+        if not _is_nan(val):
+            while self._candidates and \
+                    self._better(val, self._candidates[-1][1]):
+                dropped_back.append(self._candidates.pop())
+            self._candidates.append((position, val))
+
+        self._undo = (dropped_obs, dropped_front, dropped_back,
+                      not _is_nan(val))
+        self._count += 1
+
+        if self._nobs < max(self.min_periods, 1):
+            return np.nan
+        return self._candidates[0][1]
+
+    def _revert(self):
+        dropped_obs, dropped_front, dropped_back, pushed = self._undo
+        self._count -= 1
+        self._nobs -= self._observed.pop()
+        if dropped_obs is not None:
+            self._observed.appendleft(dropped_obs)
+            self._nobs += dropped_obs
+        if pushed:
+            self._candidates.pop()
+        self._candidates.extend(reversed(dropped_back))
+        if dropped_front is not None:
+            self._candidates.appendleft(dropped_front)
+
+
+class StreamingRollingMin(StreamingRollingMax):
+    """ Incremental rolling min (monotonic deque, amortized O(1)) """
+
+    def _better(self, new, old):
+        return new <= old
+
+
+# ---------------------------------------------
+
+class StreamingRSI(StreamingIndicator):
+    """Incremental ``rsi()``
+
+    ``rsi()`` seeds its averages from the first ``window + 1`` price
+    changes and back-fills the first values with that seed. Since those
+    aren't known until ``window + 2`` prices arrived, the first
+    ``window + 1`` streaming values are NaN; all later values match.
+
+    A missing (NaN) price is skipped: its value is NaN and the next
+    price's change is taken from the last known price (as ``rsi()`` of
+    the series without its NaNs; ``rsi()`` itself is NaN from there on).
+    """
+
+    def __init__(self, window=14, **kwargs):
+        super().__init__(**kwargs)
+        self.window = window
+        self._seed = []
+        self._state = None  # prev price, ups, downs
+        self._undo = None
+
+    def _step(self, state, price):
+        prev, ups, downs = state
+        if _is_nan(price):
+            return state
+        if _is_nan(prev):
+            return (price, ups, downs)
+
+        delta = price - prev
+        upval, downval = (delta, 0) if delta > 0 else (0, -delta)
+        ups = (ups * (self.window - 1) + upval) / self.window
+        downs = (downs * (self.window - 1.) + downval) / self.window
+        return (price, ups, downs)
+
+    @staticmethod
+    def _rsi(state):
+        return float(100. - 100. / (1. + state[1] / state[2]))
+
+    def _push(self, data):
+        price = self._input(data)
+        self._undo = self._state
+
+        if self._state is None:
+            self._seed.append(price)
+            if len(self._seed) < self.window + 2:
+                return np.nan
+
+            # same arithmetic as rsi()
+            prices = np.array(self._seed, dtype=float)
+            seed = np.diff(prices)
+            state = (prices[self.window - 1],
+                     seed[seed > 0].sum() / self.window,
+                     -seed[seed < 0].sum() / self.window)
+            state = self._step(state, prices[self.window])
+            self._state = self._step(state, prices[self.window + 1])
+        else:
+            self._state = self._step(self._state, price)
+
+        if _is_nan(price):
+            return np.nan
+        return self._rsi(self._state)
+
+    def _revert(self):
+        if self._undo is None:
+            self._seed.pop()
+        self._state = self._undo
+
+
+# ---------------------------------------------
+
+class StreamingATR(StreamingIndicator):
+    """ Incremental ``atr()`` (true range smoothed by SMA or EMA) """
+
+    def __init__(self, window=14, exp=False, **kwargs):
+        super().__init__(**kwargs)
+        self._ma = StreamingEMA(window) if exp else StreamingSMA(window)
+        self._prev_close = np.nan
+        self._undo = None
+
+    def _push(self, bar):
+        high, low, close = float(bar['high']), float(bar['low']), \
+            float(bar['close'])
+        self._undo = self._prev_close
+
+        ranges = [high - low, abs(high - self._prev_close),
+                  abs(low - self._prev_close)]
+        ranges = [value for value in ranges if not _is_nan(value)]
+        tr = max(ranges) if ranges else np.nan
+
+        self._prev_close = close
+        return self._ma._push(tr)
+
+    def _revert(self):
+        self._prev_close = self._undo
+        self._ma._revert()
+
+
+# ---------------------------------------------
+
+class StreamingMACD(StreamingIndicator):
+    """ Incremental ``macd()``
+    (value is a dict with macd, signal and histogram) """
+
+    def __init__(self, fast=3, slow=10, smooth=16, **kwargs):
+        super().__init__(**kwargs)
+        self._fast = StreamingEMA(fast)
+        self._slow = StreamingEMA(slow)
+        self._signal = StreamingEMA(smooth)
+
+    def _push(self, data):
+        price = self._input(data)
+        macd_line = self._fast._push(price) - self._slow._push(price)
+        signal = self._signal._push(macd_line)
+        return {'macd': macd_line, 'signal': signal,
+                'histogram': macd_line - signal}
+
+    def _revert(self):
+        self._fast._revert()
+        self._slow._revert()
+        self._signal._revert()
+
+
+# ---------------------------------------------
+
+class StreamingBollingerBands(StreamingIndicator):
+    """ Incremental ``bollinger_bands()``
+    (value is a dict with upper, mid and lower) """
+
+    def __init__(self, window=20, stds=2, **kwargs):
+        super().__init__(**kwargs)
+        self.stds = stds
+        self._ma = StreamingSMA(window, min_periods=1)
+        self._std = StreamingStd(window, min_periods=1)
+
+    def _push(self, data):
+        price = self._input(data)
+        ma = self._ma._push(price)
+        std = self._std._push(price)
+        return {'upper': ma + std * self.stds, 'mid': ma,
+                'lower': ma - std * self.stds}
+
+    def _revert(self):
+        self._ma._revert()
+        self._std._revert()
+
+
+# ---------------------------------------------
+
+class StreamingVWAP(StreamingIndicator):
+    """ Incremental ``vwap()`` (cumulative, from typical price) """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._state = (0., 0.)  # cumulative volume * price, volume
+        self._undo = None
+
+    def _push(self, bar):
+        typical = (float(bar['high']) + float(bar['low']) +
+                   float(bar['close'])) / 3
+        volume = float(bar['volume'])
+        self._undo = self._state
+        self._state = (self._state[0] + volume * typical,
+                       self._state[1] + volume)
+        return float(np.float64(self._state[0]) / self._state[1])
+
+    def _revert(self):
+        self._state = self._undo
+
+
+# ---------------------------------------------
+
+class StreamingStoch(StreamingIndicator):
+    """ Incremental ``stoch()`` (value is a dict with
+    fast_k and fast_d, or slow_k and slow_d) """
+
+    def __init__(self, window=14, d=3, k=3, fast=False, **kwargs):
+        super().__init__(**kwargs)
+        self.fast = fast
+        self._max = StreamingRollingMax(window)
+        self._min = StreamingRollingMin(window)
+        self._fast_d = StreamingSMA(d)
+        self._slow_k = StreamingSMA(k)
+        self._slow_d = StreamingSMA(d)
+
+    def _push(self, bar):
+        rolling_max = self._max._push(float(bar['high']))
+        rolling_min = self._min._push(float(bar['low']))
+        fast_k = float(100 * (float(bar['close']) - rolling_min) /
+                       np.float64(rolling_max - rolling_min))
+
+        if self.fast:
+            return {'fast_k': fast_k, 'fast_d': self._fast_d._push(fast_k)}
+
+        slow_k = self._slow_k._push(fast_k)
+        return {'slow_k': slow_k, 'slow_d': self._slow_d._push(slow_k)}
+
+    def _revert(self):
+        self._max._revert()
+        self._min._revert()
+        if self.fast:
+            self._fast_d._revert()
+        else:
+            self._slow_k._revert()
+            self._slow_d._revert()
+
+
 # =============================================
 
 
@@ -65,7 +65,7 @@ class Instrument(str):
             return df.drop_duplicates(subset=['_idx_'], keep='last').drop('_idx_', axis=1)
 
     # ---------------------------------------
-    def get_bars(self, lookback=None, as_dict=False):
+    def get_bars(self, lookback=None, as_dict=False, resolution=None):
         """ Get bars for this instrument
 
         :Parameters:
@@ -73,17 +73,27 @@ class Instrument(str):
                 Max number of bars to get (None = all available bars)
             as_dict : bool
                 Return a dict or a pd.DataFrame object
+            resolution : str
+                One of the algo's additional ``resolutions``
+                (None = the algo's resolution)
 
         :Retruns:
             bars : pd.DataFrame / dict
                 The bars for this instruments
         """
-        bars = self._get_symbol_dataframe(self.parent.bars, self)
+        lookback = self.bar_window if lookback is None else lookback
 
-        # add signal history to bars
-        bars = self.parent._add_signal_history(df=bars, symbol=self)
+        if resolution is not None and resolution != self.parent.resolution:
+            bars = self.parent._get_resolution_bars(self, resolution, lookback)
+        else:
+            bars = self._get_symbol_dataframe(self.parent.bars, self)
+
+            # add signal history to bars
+            bars = self.parent._add_signal_history(df=bars, symbol=self)
+
+            # add stored features (backtests)
+            bars = self.parent._add_stored_features(df=bars, symbol=self)
 
-        lookback = self.bar_window if lookback is None else lookback
         bars = bars[-lookback:]
         # if lookback is not None:
         #     bars = bars[-lookback:]
@@ -140,6 +150,73 @@ class Instrument(str):
 
         return ticks
 
+    # ---------------------------------------
+    def add_indicator(self, name, indicator, on="bar"):
+        """ Register a streaming indicator for this instrument
+        (usually in ``on_start``). It's seeded with the available
+        history and then updated incrementally on every new bar/tick.
+
+        :Parameters:
+            name : str
+                Indicator name (used by ``get_indicator``)
+            indicator : StreamingIndicator
+                eg. ``indicators.StreamingRSI(14)``
+
+        :Optional:
+            on : str
+                Update on every "bar" (default) or "tick"
+        """
+        self.parent._add_indicator(self, name, indicator, on)
+
+    # ---------------------------------------
+    def get_indicator(self, name, lookback=None):
+        """ Get a streaming indicator's value for this instrument
+
+        :Parameters:
+            name : str
+                Indicator name (as passed to ``add_indicator``)
+            lookback : int
+                Number of recent values to get (None = latest value only)
+
+        :Retruns:
+            value : float / dict / list
+                The latest value (a list of values if lookback is set)
+        """
+        try:
+            indicator = self.parent.indicators[str(self)][name][1]
+        except KeyError:
+            return None
+
+        if lookback is None:
+            return indicator.value
+        return list(indicator.values)[-lookback:]
+
+    # ---------------------------------------
+    def set_features(self, features):
+        """ Assign a FeatureSet to this instrument (usually in ``on_start``).
+        The same FeatureSet can be assigned to multiple instruments.
+
+        :Parameters:
+            features : FeatureSet
+                eg. ``FeatureSet().add("rsi", "rsi", window=14)``
+        """
+        self.parent._set_features(self, features)
+
+    # ---------------------------------------
+    def get_features(self, names=None):
+        """ Get this instrument's features. They're evaluated lazily,
+        once per bar, from ``get_bars()``
+
+        :Parameters:
+            names : str / list
+                Feature name(s) to get (None = all features)
+
+        :Retruns:
+            features : dict / mixed
+                {name: value} (a single value if names is a str)
+        """
+        return self.parent._get_features(self, names)
+
     # ---------------------------------------
     def get_tick(self):
         """ Shortcut to self.get_ticks(lookback=1, as_dict=True) """
@@ -217,8 +294,12 @@ class Instrument(str):
                 is this an iceberg (hidden) order
             tif: str
                 time in force (DAY, GTC, IOC, GTD). default is ``DAY``
+
+        :Retruns:
+            future : concurrent.futures.Future
+                The order id, once the order was sent (live trading only)
         """
-        self.parent.order(direction.upper(), self, quantity, **kwargs)
+        return self.parent.order(direction.upper(), self, quantity, **kwargs)
 
     # ---------------------------------------
     def cancel_order(self, orderId):
@@ -244,7 +325,7 @@ class Instrument(str):
         """
         kwargs['limit_price'] = 0
         kwargs['order_type'] = "MARKET"
-        self.parent.order(direction.upper(), self, quantity=quantity, **kwargs)
+        return self.parent.order(direction.upper(), self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def limit_order(self, direction, quantity, price, **kwargs):
@@ -261,7 +342,7 @@ class Instrument(str):
         """
         kwargs['limit_price'] = price
         kwargs['order_type'] = "LIMIT"
-        self.parent.order(direction.upper(), self, quantity=quantity, **kwargs)
+        return self.parent.order(direction.upper(), self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def buy(self, quantity, **kwargs):
@@ -272,7 +353,7 @@ class Instrument(str):
             quantity : int
                 Order quantity
         """
-        self.parent.order("BUY", self, quantity=quantity, **kwargs)
+        return self.parent.order("BUY", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def buy_market(self, quantity, **kwargs):
@@ -285,7 +366,7 @@ class Instrument(str):
         """
         kwargs['limit_price'] = 0
         kwargs['order_type'] = "MARKET"
-        self.parent.order("BUY", self, quantity=quantity, **kwargs)
+        return self.parent.order("BUY", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def buy_limit(self, quantity, price, **kwargs):
@@ -300,7 +381,7 @@ class Instrument(str):
         """
         kwargs['limit_price'] = price
         kwargs['order_type'] = "LIMIT"
-        self.parent.order("BUY", self, quantity=quantity, **kwargs)
+        return self.parent.order("BUY", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def sell(self, quantity, **kwargs):
@@ -311,7 +392,7 @@ class Instrument(str):
             quantity : int
                 Order quantity
         """
-        self.parent.order("SELL", self, quantity=quantity, **kwargs)
+        return self.parent.order("SELL", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def sell_market(self, quantity, **kwargs):
@@ -324,7 +405,7 @@ class Instrument(str):
         """
         kwargs['limit_price'] = 0
         kwargs['order_type'] = "MARKET"
-        self.parent.order("SELL", self, quantity=quantity, **kwargs)
+        return self.parent.order("SELL", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def sell_limit(self, quantity, price, **kwargs):
@@ -339,19 +420,19 @@ class Instrument(str):
         """
         kwargs['limit_price'] = price
         kwargs['order_type'] = "LIMIT"
-        self.parent.order("SELL", self, quantity=quantity, **kwargs)
+        return self.parent.order("SELL", self, quantity=quantity, **kwargs)
 
     # ---------------------------------------
     def exit(self):
         """ Shortcut for ``instrument.order("EXIT", ...)``
         (accepts no parameters)"""
-        self.parent.order("EXIT", self)
+        return self.parent.order("EXIT", self)
 
     # ---------------------------------------
     def flatten(self):
         """ Shortcut for ``instrument.order("FLATTEN", ...)``
         (accepts no parameters)"""
-        self.parent.order("FLATTEN", self)
+        return self.parent.order("FLATTEN", self)
 
     # ---------------------------------------
     def get_contract(self):
@@ -594,7 +675,7 @@ class Instrument(str):
             ticksize : int
                 Min. tick size
         """
-        ticksize = self.parent.get_contract_details(self)['m_minTick']
+        ticksize = self.parent.get_ticksize(self)
         return float(ticksize)
 
     # ---------------------------------------
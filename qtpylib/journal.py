@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import csv
+import logging
+import os
+import queue
+import sys
+import time
+
+from datetime import datetime
+from threading import Lock, Thread
+
+import pandas as pd
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+
+class TradeJournal(Thread):
+    """Writes trades to the daily trade log (csv) and the database
+    from a background thread, so logging a trade never blocks.
+
+    Trade records are appended to the csv file as they come; a trade
+    logged again (eg. on exit) is appended as well, and the file is
+    compacted (keeping each trade's last record) once the journal is
+    idle, at most every ``compact_interval`` seconds.
+
+    :Optional:
+        directory : str
+            Trade logs directory (``<strategy>_<YYYYMMDD>.csv`` files)
+        strategy : str
+            Strategy name
+        db_writer : callable
+            Called (on the journal's thread) with every trade record
+        compact_interval : float
+            Minimum seconds between compactions (default: 5)
+    """
+
+    COLUMNS = ['strategy', 'symbol', 'direction', 'quantity', 'entry_time',
+               'exit_time', 'exit_reason', 'order_type', 'market_price',
+               'target', 'stop', 'entry_price', 'exit_price', 'realized_pnl']
+    KEY = ['entry_time', 'symbol', 'strategy']
+
+    def __init__(self, directory=None, strategy="", db_writer=None,
+                 compact_interval=5):
+        super().__init__(name="trade_journal", daemon=True)
+        self.directory = directory
+        self.strategy = strategy
+        self.db_writer = db_writer
+        self.compact_interval = compact_interval
+        self.log = logging.getLogger(__name__)
+
+        self.queue = queue.Queue()
+        self._keys = {}  # {path: set of trade keys in the file}
+        self._dirty = set()  # paths with duplicate trade records
+        self._compacted_at = 0
+        self._files_lock = Lock()
+        self.start()
+
+    # ---------------------------------------
+    def path(self, when=None):
+        """ the trade log file of a day (default: today) """
+        when = datetime.now() if when is None else when
+        return os.path.join(self.directory, "%s_%s.csv" % (
+            self.strategy.lower(), when.strftime('%Y%m%d')))
+
+    def add(self, trade):
+        """ queue a trade record (returns immediately) """
+        trade = dict(trade)
+        for col in ('entry_time', 'exit_time'):
+            try:
+                trade[col] = trade[col].strftime("%Y-%m-%d %H:%M:%S.%f")
+            except Exception as e:
+                pass
+
+        path = self.path() if self.directory else None
+        self.queue.put((path, trade))
+
+    def flush(self):
+        """ wait for queued trades to be written and compact the logs """
+        self.queue.join()
+        self.compact()
+
+    # ---------------------------------------
+    def run(self):
+        while True:
+            try:
+                path, trade = self.queue.get(timeout=self.compact_interval)
+            except queue.Empty:
+                self.compact()
+                continue
+
+            try:
+                with self._files_lock:
+                    self._write(path, trade)
+            finally:
+                self.queue.task_done()
+
+            if self.queue.empty() and time.time() - \
+                    self._compacted_at >= self.compact_interval:
+                self.compact()
+
+    def _write(self, path, trade):
+        if self.db_writer is not None:
+            try:
+                self.db_writer(dict(trade))
+            except Exception as e:
+                self.log.error("Can't store trade in database: %s", e)
+
+        if path is None:
+            return
+
+        row = ['' if trade.get(col) is None else trade.get(col)
+               for col in self.COLUMNS]
+        try:
+            new_file = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(self.COLUMNS)
+                writer.writerow(row)
+            if new_file:
+                _chmod(path)
+        except Exception as e:
+            self.log.error("Can't write trade log (%s): %s", path, e)
+            return
+
+        # re-logged trade?
+        key = tuple(str(trade.get(col)) for col in self.KEY)
+        keys = self._keys.setdefault(path, set())
+        if key in keys:
+            self._dirty.add(path)
+        keys.add(key)
+
+    def compact(self):
+        """ remove the logs' outdated trade records """
+        with self._files_lock:
+            self._compact()
+
+    def _compact(self):
+        self._compacted_at = time.time()
+        for path in list(self._dirty):
+            self._dirty.discard(path)
+            try:
+                trades = pd.read_csv(path, header=0, dtype=str,
+                                     keep_default_na=False)
+                trades.drop_duplicates(self.KEY, keep="last", inplace=True)
+                trades.to_csv(path + ".tmp", header=True, index=False)
+                os.replace(path + ".tmp", path)
+                _chmod(path)
+            except Exception as e:
+                self.log.error("Can't compact trade log (%s): %s", path, e)
+
+        # forget previous days
+        today = self.path() if self.directory else None
+        for path in list(self._keys):
+            if path != today:
+                del self._keys[path]
+
+
+# ---------------------------------------------
+
+def _chmod(path):
+    """ make the file writeable """
+    try:
+        os.chmod(path, 0o777)
+    except Exception as e:
+        pass
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import sys
+
+from threading import Lock
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+
+class PositionLedger():
+    """In-memory positions and (average) cost basis, per symbol
+
+    Used for simulated (backtest) orders: orders are pending until
+    they're filled (``fill_pending()``, at the next bar's open),
+    fills update the position, average cost and realized PnL, and
+    prices update the unrealized PnL. All reads are O(1).
+    """
+
+    def __init__(self):
+        self.positions = {}  # {symbol: position dict}
+        self.pending = {}  # {symbol: quantity}
+        self._lock = Lock()
+
+    # ---------------------------------------
+    def _position(self, symbol):
+        if symbol not in self.positions:
+            self.positions[symbol] = {
+                "symbol": symbol,
+                "position": 0,
+                "avgCost": 0.0,
+                "lastPrice": 0.0,
+                "realizedPNL": 0.0,
+                "unrealizedPNL": 0.0,
+            }
+        return self.positions[symbol]
+
+    # ---------------------------------------
+    def order(self, symbol, quantity):
+        """ add a simulated order (signed quantity) to be filled later """
+        if quantity == 0:
+            return
+        with self._lock:
+            self.pending[symbol] = self.pending.get(symbol, 0) + quantity
+            if self.pending[symbol] == 0:
+                del self.pending[symbol]
+
+    def fill_pending(self, symbol, price):
+        """ fill the symbol's pending orders at a price
+
+        :Returns:
+            quantity : int
+                Filled quantity (0 if nothing was pending)
+        """
+        if price != price:
+            return 0
+        with self._lock:
+            quantity = self.pending.pop(symbol, 0)
+        if quantity != 0:
+            self.fill(symbol, quantity, price)
+        return quantity
+
+    # ---------------------------------------
+    def fill(self, symbol, quantity, price):
+        """Updates the position with a fill
+
+        :Parameters:
+            symbol : str
+                Symbol
+            quantity : int
+                Filled quantity (negative for sells)
+            price : float
+                Fill price
+
+        :Returns:
+            realized : float
+                PnL realized by this fill
+        """
+        with self._lock:
+            pos = self._position(symbol)
+            position = pos["position"]
+            realized = 0.0
+
+            if position == 0 or (position > 0) == (quantity > 0):
+                # open / add
+                pos["avgCost"] = (pos["avgCost"] * abs(position) +
+                                  price * abs(quantity)) / \
+                    abs(position + quantity)
+            else:
+                # reduce / close / reverse
+                closed = min(abs(quantity), abs(position))
+                realized = closed * (price - pos["avgCost"]) * \
+                    (1 if position > 0 else -1)
+                if abs(quantity) > abs(position):
+                    pos["avgCost"] = price
+                elif abs(quantity) == abs(position):
+                    pos["avgCost"] = 0.0
+
+            pos["position"] = position + quantity
+            pos["realizedPNL"] += realized
+            self._mark(pos, price)
+            return realized
+
+    # ---------------------------------------
+    def update_price(self, symbol, price):
+        """ mark the symbol's position to market """
+        if symbol in self.positions and price == price:
+            self._mark(self.positions[symbol], price)
+
+    @staticmethod
+    def _mark(pos, price):
+        pos["lastPrice"] = price
+        pos["unrealizedPNL"] = pos["position"] * (price - pos["avgCost"])
+
+    # ---------------------------------------
+    def get(self, symbol, pending=False):
+        """ the symbol's position dict (``pending=True`` includes
+        pending orders in ``position``) """
+        pos = dict(self.positions.get(symbol) or self._position(symbol))
+        if pending:
+            pos["position"] += self.pending.get(symbol, 0)
+        return pos
@@ -0,0 +1,639 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import sys
+import weakref
+
+from bisect import bisect_left
+from threading import Thread, Event
+from time import perf_counter, monotonic, time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+# default histogram buckets (in seconds)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+
+# ---------------------------------------------
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (
+        key, str(val).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, val in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+# =============================================
+# metric types
+# =============================================
+
+class _Timer():
+    """ context manager that observes the elapsed time on exit """
+
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+        self._start = 0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._child.observe(perf_counter() - self._start)
+
+
+class _CounterChild():
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeChild():
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild():
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class Metric():
+    """Base metric (a family of labeled children)
+
+    Updates take no locks: they rely on the GIL to keep the registry
+    consistent, so a concurrent update may (very rarely) be lost.
+    That's an acceptable trade-off for monitoring hot paths.
+
+    :Parameters:
+        name : str
+            Metric name (Prometheus-compatible)
+        documentation : str
+            Metric description
+        labels : tuple
+            Label names (optional)
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation="", labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """ get (or create) the child metric for the given label values """
+        try:
+            return self._children[values]
+        except KeyError:
+            child = self._new_child()
+            self._children[values] = child
+            return child
+
+    def _samples(self):
+        return [(values, child) for values, child in
+                list(self._children.items())]
+
+    def expose(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation),
+                 "# TYPE %s %s" % (self.name, self.kind)]
+        for values, child in self._samples():
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+    def _expose_child(self, values, child):
+        return ["%s%s %s" % (self.name,
+                             _format_labels(self.label_names, values),
+                             _format_value(child.value))]
+
+    def snapshot(self):
+        """ returns {label values: value} """
+        return {values: child.value for values, child in self._samples()}
+
+
+class Counter(Metric):
+    """ A monotonically increasing counter """
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    """ A value that can go up and down (or be computed on scrape) """
+    kind = "gauge"
+
+    def __init__(self, name, documentation="", labels=(), func=None):
+        self.func = func
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def _samples(self):
+        if self.func is not None:
+            self._default.set(self.func())
+        return super()._samples()
+
+
+class Histogram(Metric):
+    """ Bucketed distribution of observed values """
+    kind = "histogram"
+
+    def __init__(self, name, documentation="", labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.bounds = sorted(buckets)
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _expose_child(self, values, child):
+        lines = []
+        cumulative = 0
+        counts = list(child.counts)
+        for bound, count in zip(self.bounds + [float('inf')], counts):
+            cumulative += count
+            lines.append("%s_bucket%s %d" % (
+                self.name, _format_labels(
+                    self.label_names, values, ("le", _format_value(bound))),
+                cumulative))
+        labels = _format_labels(self.label_names, values)
+        lines.append("%s_sum%s %s" % (self.name, labels, _format_value(child.sum)))
+        lines.append("%s_count%s %d" % (self.name, labels, child.count))
+        return lines
+
+    def snapshot(self):
+        return {values: (child.count, child.sum)
+                for values, child in self._samples()}
+
+
+class _LatencyChild():
+    """ sparse log-linear (HDR-style) recorder of integer values """
+
+    __slots__ = ('bits', 'half', 'unit', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, bits, unit):
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.unit = unit
+        self.counts = {}
+        self.sum = 0.
+        self.count = 0
+        self.max = 0.
+
+    def _index(self, value):
+        # values below 2^bits get their own bucket; above that,
+        # every power of two is split into 2^(bits-1) linear buckets
+        if value < (self.half << 1):
+            return value
+        shift = value.bit_length() - self.bits
+        return (self.half << 1) + (shift - 1) * self.half + \
+            (value >> shift) - self.half
+
+    def _highest(self, index):
+        if index < (self.half << 1):
+            return index
+        shift, mantissa = divmod(index - (self.half << 1), self.half)
+        return ((mantissa + self.half + 1) << (shift + 1)) - 1
+
+    def observe(self, value):
+        index = self._index(max(int(value / self.unit), 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def time(self):
+        return _Timer(self)
+
+    def percentile(self, pct):
+        """ value at percentile (0-100), within the recorder's precision """
+        counts = sorted(list(self.counts.items()))
+        total = sum(count for _, count in counts)
+        if total == 0:
+            return 0.
+        target = max(total * pct / 100., 1)
+        seen = 0
+        for index, count in counts:
+            seen += count
+            if seen >= target:
+                return min(self._highest(index) * self.unit, self.max)
+        return self.max
+
+
+class LatencyHistogram(Metric):
+    """HDR-style latency histogram
+
+    Values are recorded in log-linear buckets (relative error of
+    ``2 ** (1 - precision)``) so tail percentiles stay accurate from
+    microseconds to seconds without pre-defined buckets.
+    Exposed as a Prometheus summary.
+
+    :Parameters:
+        name : str
+            Metric name (Prometheus-compatible)
+        documentation : str
+            Metric description
+        labels : tuple
+            Label names (optional)
+
+    :Optional:
+        precision : int
+            Sub-bucket bits per power of two (default: 7 = ~1.5%)
+        unit : float
+            Smallest resolvable value in seconds (default: 1e-6)
+        quantiles : tuple
+            Quantiles to expose (default: .5, .9, .99, .999)
+    """
+    kind = "summary"
+
+    def __init__(self, name, documentation="", labels=(), precision=7,
+                 unit=1e-6, quantiles=(.5, .9, .99, .999)):
+        self.precision = max(int(precision), 2)
+        self.unit = unit
+        self.quantiles = quantiles
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _LatencyChild(self.precision, self.unit)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def percentile(self, pct):
+        return self._default.percentile(pct)
+
+    def _expose_child(self, values, child):
+        lines = []
+        for quantile in self.quantiles:
+            lines.append("%s%s %s" % (
+                self.name, _format_labels(
+                    self.label_names, values, ("quantile", str(quantile))),
+                _format_value(child.percentile(quantile * 100))))
+        labels = _format_labels(self.label_names, values)
+        lines.append("%s_sum%s %s" % (self.name, labels, _format_value(child.sum)))
+        lines.append("%s_count%s %d" % (self.name, labels, child.count))
+        return lines
+
+    def snapshot(self):
+        return {values: (child.count, child.sum)
+                for values, child in self._samples()}
+
+
+# =============================================
+# registry
+# =============================================
+
+class Registry():
+    """ Collection of metrics, exposed in Prometheus text format """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, *args, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name, documentation="", labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation="", labels=(), func=None):
+        return self._register(Gauge, name, documentation, labels, func=func)
+
+    def histogram(self, name, documentation="", labels=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels,
+                              buckets=buckets)
+
+    def latency(self, name, documentation="", labels=(), **kwargs):
+        return self._register(LatencyHistogram, name, documentation, labels,
+                              **kwargs)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def expose(self):
+        """ render all metrics in Prometheus text exposition format """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """ flat {metric{labels}: value} dict (used for logging) """
+        out = {}
+        for metric in list(self._metrics.values()):
+            for values, value in metric.snapshot().items():
+                key = metric.name + _format_labels(metric.label_names, values)
+                out[key] = value
+        return out
+
+
+# process-wide default registry
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+latency = registry.latency
+
+
+# ---------------------------------------------
+def timed(child):
+    """ decorator that observes the run time of a function
+    in the given histogram (or histogram child) """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(perf_counter() - start)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+# =============================================
+# end-to-end latency tracing
+# =============================================
+
+# market data messages carry {stage: time.monotonic()} under this key.
+# the monotonic clock is system-wide, so stamps taken by the blotter
+# and the algo are comparable as long as they run on the same host.
+TRACE_KEY = "_trace"
+TRACE_STAGES = ("callback", "built", "broadcast",
+                "received", "dataframe", "handled")
+
+_STAGE_LATENCY = latency(
+    "qtpylib_stage_latency_seconds",
+    "Market data latency since the previous pipeline stage",
+    ("kind", "stage"))
+
+_PENDING_TRACES = {}
+
+
+def trace_stamp(trace, stage):
+    """ stamp a pipeline stage (no-op if trace is None) """
+    if trace is not None:
+        trace[stage] = monotonic()
+    return trace
+
+
+def trace_record(kind, trace):
+    """ observe the time spent between consecutive stages of a trace
+    (and from first to last stage as ``total``) """
+    stamps = [(stage, trace[stage]) for stage in TRACE_STAGES
+              if stage in trace]
+    if len(stamps) < 2:
+        return
+    for (_, previous), (stage, stamp) in zip(stamps, stamps[1:]):
+        _STAGE_LATENCY.labels(kind, stage).observe(stamp - previous)
+    _STAGE_LATENCY.labels(kind, "total").observe(stamps[-1][1] - stamps[0][1])
+
+
+def trace_bind(df, kind, trace):
+    """Attach a trace to a DataFrame handed to a (possibly threaded)
+    handler. Completed by ``trace_complete(df)``; traces that are never
+    completed are recorded (without ``handled``) once the df is released
+    """
+    key = id(df)
+
+    def _release(_):
+        pending = _PENDING_TRACES.pop(key, None)
+        if pending is not None:
+            trace_record(pending[1], pending[2])
+
+    _PENDING_TRACES[key] = (weakref.ref(df, _release), kind, trace)
+
+
+def trace_complete(df):
+    """ stamp ``handled`` and record the trace bound to df (if any) """
+    pending = _PENDING_TRACES.pop(id(df), None)
+    if pending is not None and pending[0]() is df:
+        trace_record(pending[1], trace_stamp(pending[2], "handled"))
+
+
+def traced(func):
+    """ decorator for ``handler(self, df, ...)`` methods that completes
+    the df's trace once the handler returns """
+    def wrapper(self, df, *args, **kwargs):
+        try:
+            return func(self, df, *args, **kwargs)
+        finally:
+            if _PENDING_TRACES:
+                trace_complete(df)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+# =============================================
+# exporters
+# =============================================
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port, host="127.0.0.1", reg=None):
+    """Exposes the registry over HTTP (``GET /metrics``)
+    in Prometheus text format using a background thread
+
+    :Parameters:
+        port : int
+            Local port to listen on
+
+    :Optional:
+        host : str
+            Interface to bind to (default: 127.0.0.1)
+        reg : Registry
+            Registry to expose (default: process-wide registry)
+
+    :Returns:
+        server : HTTPServer
+            The running server (call ``shutdown()`` to stop it)
+    """
+    reg = registry if reg is None else reg
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = reg.expose().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = _ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# ---------------------------------------------
+class LogReporter(Thread):
+    """Periodically dumps the registry to a logger.
+    Counters are reported along with their per-second rate
+    since the previous dump.
+    """
+
+    def __init__(self, interval, logger=None, reg=None):
+        super().__init__(daemon=True)
+        self.interval = float(interval)
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.registry = registry if reg is None else reg
+        self._stopped = Event()
+        self._previous = {}
+        self._previous_ts = time()
+        self.start()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        now = time()
+        elapsed = max(now - self._previous_ts, 1e-9)
+        current = self.registry.summary()
+
+        for key, value in sorted(current.items()):
+            if isinstance(value, tuple):
+                count, total = value
+                avg = total / count if count else 0
+                self.logger.info("[metrics] %s count=%d avg=%.6fs",
+                                 key, count, avg)
+            else:
+                rate = (value - self._previous.get(key, 0)) / elapsed
+                self.logger.info("[metrics] %s %s (%.2f/s)", key, value, rate)
+
+        self._previous = {k: v for k, v in current.items()
+                          if not isinstance(v, tuple)}
+        self._previous_ts = now
+
+    def stop(self):
+        self._stopped.set()
+
+
+# ---------------------------------------------
+def start(port=None, log_interval=None, logger=None):
+    """ start the HTTP endpoint and/or the periodic log reporter """
+    server = reporter = None
+
+    if port is not None and str(port).strip() not in ("", "0"):
+        server = serve(int(port))
+        if logger is not None:
+            logger.info("Metrics available on http://127.0.0.1:%s/metrics", port)
+
+    try:
+        log_interval = float(log_interval)
+    except (TypeError, ValueError):
+        log_interval = 0
+
+    if log_interval > 0:
+        reporter = LogReporter(log_interval, logger=logger)
+
+    return server, reporter
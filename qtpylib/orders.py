@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import sys
+
+from collections import OrderedDict, deque
+from threading import Lock
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+
+class OrderStore():
+    """Orders of record, indexed by orderId, parent order (bracket
+    children), symbol and status.
+
+    Orders that reached a terminal status (filled/cancelled) are kept
+    for reference and pruned once there are more than ``keep`` of them.
+    Orders are updated from the gateway's thread, so updates and the
+    reads that scan the indexes are serialized by a lock.
+
+    For compatibility with the nested-dict order history, the store
+    can be used as ``{symbol: {orderId: order}}``.
+
+    :Optional:
+        keep : int
+            Number of terminal orders to keep (default: 1000)
+    """
+
+    def __init__(self, keep=1000):
+        self.keep = keep
+        self.by_id = {}  # {orderId: order}
+        self.by_parent = {}  # {parentId: {orderId, ...}}
+        self.by_symbol = {}  # {symbol: {orderId: order}}
+        self.by_status = {}  # {status: {orderId, ...}}
+        self._terminal = deque()
+        self._terminal_ids = set()
+        self._lock = Lock()
+
+    @staticmethod
+    def is_terminal(status):
+        status = str(status).upper()
+        return status in ("FILLED", "INACTIVE") or "CANCELLED" in status
+
+    # ---------------------------------------
+    def add(self, symbol, orderId, quantity, order_type='entry',
+            filled=False, parentId=0):
+        """ add (or replace) an order """
+        with self._lock:
+            previous = self.by_id.get(orderId)
+            status = previous["status"] if previous is not None else \
+                "FILLED" if filled else "PENDING"
+            if previous is not None:
+                self._remove(orderId)
+
+            self._index({
+                "orderId": orderId,
+                "symbol": symbol,
+                "quantity": quantity,
+                "order_type": order_type.upper(),
+                "filled": filled,
+                "parentId": parentId,
+                "status": "FILLED" if filled else status
+            })
+
+    def update(self, orderId, status=None, symbol=None, parentId=None):
+        """ update an order's status (adding orders placed elsewhere) """
+        with self._lock:
+            order = self.by_id.get(orderId)
+            if order is None:
+                if symbol is None:
+                    return
+                self._index({
+                    "orderId": orderId,
+                    "symbol": symbol,
+                    "quantity": 0,
+                    "order_type": "",
+                    "filled": False,
+                    "parentId": parentId or 0,
+                    "status": "PENDING"
+                })
+                order = self.by_id[orderId]
+
+            status = None if status is None else str(status).upper()
+            if status is None or status == order["status"]:
+                return
+
+            self.by_status[order["status"]].discard(orderId)
+            self.by_status.setdefault(status, set()).add(orderId)
+            order["status"] = status
+            if status == "FILLED":
+                order["filled"] = True
+
+            self._add_terminal(order)
+
+    # ---------------------------------------
+    def _index(self, order):
+        orderId = order["orderId"]
+        self.by_id[orderId] = order
+        self.by_parent.setdefault(order["parentId"], set()).add(orderId)
+        self.by_symbol.setdefault(order["symbol"], OrderedDict())[
+            orderId] = order
+        self.by_status.setdefault(order["status"], set()).add(orderId)
+        self._add_terminal(order)
+
+    def _add_terminal(self, order):
+        if self.is_terminal(order["status"]) and \
+                order["orderId"] not in self._terminal_ids:
+            self._terminal_ids.add(order["orderId"])
+            self._terminal.append(order["orderId"])
+            self._prune()
+
+    def _remove(self, orderId):
+        order = self.by_id.pop(orderId, None)
+        if order is None:
+            return
+        self.by_parent.get(order["parentId"], set()).discard(orderId)
+        self.by_symbol.get(order["symbol"], {}).pop(orderId, None)
+        self.by_status.get(order["status"], set()).discard(orderId)
+
+    def _prune(self):
+        """ forget the oldest terminal orders """
+        while len(self._terminal) > self.keep:
+            orderId = self._terminal.popleft()
+            self._terminal_ids.discard(orderId)
+            self._remove(orderId)
+
+    # ---------------------------------------
+    def get(self, orderId, default=None):
+        return self.by_id.get(orderId, default)
+
+    def children(self, parentId):
+        """ orders placed as children of an order """
+        with self._lock:
+            return [self.by_id[orderId] for orderId
+                    in self.by_parent.get(parentId, ())]
+
+    def orphans(self, orderId):
+        """ active orders left over once an order was filled: the rest
+        of its bracket (for bracket children), or the brackets of the
+        symbol's other orders (for parent orders) """
+        with self._lock:
+            order = self.by_id.get(orderId)
+            if order is None:
+                return []
+
+            if order["parentId"]:
+                parentIds = [order["parentId"]]
+            else:
+                parentIds = [parentId for parentId
+                             in self.by_symbol.get(order["symbol"], {})
+                             if parentId != orderId]
+
+            return [self.by_id[childId] for parentId in parentIds
+                    for childId in self.by_parent.get(parentId, ())
+                    if childId != orderId and
+                    not self.is_terminal(self.by_id[childId]["status"])]
+
+    def find(self, symbol, order_type):
+        """ the symbol's first order of a type (eg. "STOP") """
+        with self._lock:
+            for order in self.by_symbol.get(symbol, {}).values():
+                if order["order_type"] == order_type.upper():
+                    return order
+        return None
+
+    def active(self):
+        """ orders that aren't filled/cancelled """
+        with self._lock:
+            return [order for status, orderIds in self.by_status.items()
+                    if not self.is_terminal(status)
+                    for order in (self.by_id[orderId]
+                                  for orderId in orderIds)]
+
+    # ---------------------------------------
+    def __contains__(self, symbol):
+        return symbol in self.by_symbol
+
+    def __getitem__(self, symbol):
+        return self.by_symbol[symbol]
+
+    def __iter__(self):
+        return iter(self.by_symbol)
+
+    def __len__(self):
+        return len(self.by_id)
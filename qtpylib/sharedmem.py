@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# QTPyLib: Quantitative Trading Python Library
+# https://github.com/ranaroussi/qtpylib
+#
+# Copyright 2016-2018 Ran Aroussi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import sys
+
+import numpy as np
+
+# shared memory requires python 3.8+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+# =============================================
+# check min, python version
+if sys.version_info < (3, 4):
+    raise SystemError("QTPyLib requires Python version >= 3.4")
+# =============================================
+
+AVAILABLE = shared_memory is not None
+
+KINDS = {"TICK": 1, "BAR": 2}
+KIND_NAMES = {v: k for k, v in KINDS.items()}
+
+# one fixed-size record per tick/bar
+RECORD = np.dtype([
+    ('slot_seq', np.int64),   # seqlock (-1 while being written)
+    ('seq', np.int64),        # blotter's broadcast sequence
+    ('kind', np.int64),
+    ('timestamp', np.int64),  # UTC nanoseconds
+    ('last', np.float64), ('lastsize', np.float64),
+    ('bid', np.float64), ('bidsize', np.float64),
+    ('ask', np.float64), ('asksize', np.float64),
+    ('open', np.float64), ('high', np.float64),
+    ('low', np.float64), ('close', np.float64),
+    ('volume', np.float64),
+])
+
+VALUE_FIELDS = ('last', 'lastsize', 'bid', 'bidsize', 'ask', 'asksize',
+                'open', 'high', 'low', 'close', 'volume')
+
+# header: [magic, capacity, records written]
+_MAGIC = 0x717470796C6962  # "qtpylib"
+_HEADER = 64
+
+# segments created by this process
+_OWNED = set()
+
+
+# ---------------------------------------------
+def ring_name(blotter, symbol):
+    """ shared memory segment name for a blotter/symbol pair """
+    return re.sub(r'[^A-Za-z0-9_]', '_',
+                  "qtpylib_%s_%s" % (blotter, symbol))[:240]
+
+
+def record_values(record):
+    """ a ring record's kind and tick (last, sizes, bid/ask) or bar
+    (OHLCV) values. sizes are ints, missing values are NaN """
+    kind = KIND_NAMES[int(record['kind'])]
+    fields = ('last', 'lastsize', 'bid', 'bidsize', 'ask', 'asksize') \
+        if kind == "TICK" else ('open', 'high', 'low', 'close', 'volume')
+
+    values = {}
+    for field in fields:
+        value = float(record[field])
+        if field.endswith("size") or field == "volume":
+            value = value if np.isnan(value) else int(value)
+        values[field] = value
+    return kind, values
+
+
+def _views(buf, capacity):
+    header = np.ndarray((3,), dtype=np.int64, buffer=buf)
+    records = np.ndarray((capacity,), dtype=RECORD,
+                         buffer=buf, offset=_HEADER)
+    return header, records
+
+
+# =============================================
+class RingWriter():
+    """Single-writer ring buffer of ticks/bars in shared memory
+
+    Each slot is guarded by its own sequence (seqlock): it is set to -1
+    before the slot is written and to the record's position once done,
+    after which the header's counter is advanced. Readers never block
+    the writer; a reader that falls more than ``capacity`` records
+    behind skips ahead to the oldest valid record.
+
+    :Parameters:
+        name : str
+            Shared memory segment name (see ``ring_name()``)
+
+    :Optional:
+        capacity : int
+            Number of records kept (default: 4096)
+    """
+
+    def __init__(self, name, capacity=4096):
+        if not AVAILABLE:
+            raise SystemError("Shared memory requires Python version >= 3.8")
+
+        self.name = name
+        self.capacity = int(capacity)
+        size = _HEADER + RECORD.itemsize * self.capacity
+
+        # remove stale segment (left by a crashed blotter),
+        # invalidating it for readers still attached to it
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            np.ndarray((1,), dtype=np.int64, buffer=stale.buf)[0] = 0
+            stale.close()
+            stale.unlink()
+        except Exception as e:
+            pass
+
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=size)
+        _OWNED.add(name)
+        self.header, self.records = _views(self.shm.buf, self.capacity)
+        self.records['slot_seq'] = -1
+        self.header[1] = self.capacity
+        self.header[2] = 0
+        self.header[0] = _MAGIC
+
+    def write(self, kind, seq, timestamp, data):
+        """ append a record (``data`` is a dict with VALUE_FIELDS) """
+        position = int(self.header[2])
+        slot = self.records[position % self.capacity]
+
+        slot['slot_seq'] = -1
+        slot['seq'] = seq
+        slot['kind'] = KINDS[kind]
+        slot['timestamp'] = timestamp
+        for field in VALUE_FIELDS:
+            value = data.get(field)
+            slot[field] = np.nan if value is None else value
+        slot['slot_seq'] = position
+
+        self.header[2] = position + 1
+
+    def close(self, unlink=True):
+        if unlink and self.header is not None:
+            self.header[0] = 0  # tell readers the ring is gone
+        self.header = self.records = None
+        try:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+                _OWNED.discard(self.name)
+        except Exception as e:
+            pass
+
+
+# =============================================
+class RingReader():
+    """Reads new records from a ``RingWriter``'s segment (zero-copy view)
+
+    :Parameters:
+        name : str
+            Shared memory segment name (see ``ring_name()``)
+
+    Raises ``FileNotFoundError`` if the segment doesn't exist (yet)
+    """
+
+    def __init__(self, name):
+        if not AVAILABLE:
+            raise SystemError("Shared memory requires Python version >= 3.8")
+
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+
+        # readers must not unlink the writer's segment on exit
+        if name not in _OWNED:
+            try:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception as e:
+                pass
+
+        header = np.ndarray((3,), dtype=np.int64, buffer=self.shm.buf)
+        if header[0] != _MAGIC:
+            self.shm.close()
+            raise FileNotFoundError(name)
+
+        self.capacity = int(header[1])
+        self.header, self.records = _views(self.shm.buf, self.capacity)
+
+        # start from the current position (history comes from elsewhere)
+        self.position = int(self.header[2])
+
+    @property
+    def closed(self):
+        """ True once the writer closed (or replaced) the ring """
+        return self.header is None or self.header[0] != _MAGIC
+
+    def read(self):
+        """ returns a list of new records (numpy.void copies) """
+        if self.closed:
+            return []
+
+        written = int(self.header[2])
+        if written < self.position:
+            # writer restarted
+            self.position = 0
+        elif written - self.position > self.capacity:
+            # reader lagged behind: skip to the oldest valid record
+            self.position = written - self.capacity
+
+        out = []
+        while self.position < written:
+            slot = self.records[self.position % self.capacity]
+            before = slot['slot_seq']
+            record = slot.copy()
+            if before == self.position and \
+                    slot['slot_seq'] == self.position:
+                out.append(record)
+                self.position += 1
+            elif before > self.position:
+                # overwritten while reading: skip ahead
+                self.position = int(self.header[2]) - self.capacity + 1
+            else:
+                # slot is being written
+                break
+        return out
+
+    def seek(self, seq):
+        """ moves the reader to the first record kept with a (blotter)
+        sequence greater than ``seq``, so records that were already
+        broadcast when the reader attached are read too
+        (stays at the current position if there's none) """
+        if self.closed:
+            return
+
+        written = int(self.header[2])
+        first = max(written - self.capacity, 0)
+        positions = np.arange(first, written)
+        seqs = self.records['seq'][positions % self.capacity]
+        self.position = first + int(np.searchsorted(seqs, seq, side='right'))
+
+    def close(self):
+        self.header = self.records = None
+        try:
+            self.shm.close()
+        except Exception as e:
+            pass
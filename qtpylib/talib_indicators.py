@@ -20,12 +20,17 @@
 #
 
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+
+import numpy as np
 from pandas import Series, DataFrame
 
 TALIB_MISSING = False
 
 try:
     import talib
+    from talib import abstract as talib_abstract
 except ImportError:
     TALIB_MISSING = True
     raise ImportError("TA-Lib is not installed on this system!")
@@ -66,12 +71,21 @@ def _extract_series(data):
 # ---------------------------------------------
 
 
+def _as_input(values):
+    """ contiguous float64 array (copies only if it isn't one already) """
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+# ---------------------------------------------
+
+
 def _extract_ohlc(data):
     if isinstance(data, DataFrame):
         if "open" in data.columns and "high" in data.columns \
                 and "low" in data.columns and "close" in data.columns \
                 and "volume" in data.columns:
-            return data[['open', 'high', 'low', 'close', 'volume']].T.values
+            # column views (no transposed copy)
+            return [_as_input(data[col].values)
+                    for col in ('open', 'high', 'low', 'close', 'volume')]
 
     raise ValueError("data must be Pandas with OLHC columns")
 
@@ -1052,3 +1066,125 @@ def SUM(data, **kwargs):
     _check_talib_presence()
     prices = _extract_series(data)
     return talib.SUM(prices, **kwargs)
+
+
+# =============================================
+# Batch (multi-symbol) runner
+# =============================================
+
+# {function name: (input names, output names)}
+_SIGNATURES = {}
+
+
+def _signature(name):
+    if name not in _SIGNATURES:
+        info = talib_abstract.Function(name).info
+        inputs = []
+        for value in info['input_names'].values():
+            inputs.extend([value] if isinstance(value, str) else value)
+        _SIGNATURES[name] = (inputs, list(info['output_names']))
+    return _SIGNATURES[name]
+
+
+def _batch_label(func):
+    """ label of a listed function: its name, plus its kwargs if any
+    (eg. "RSI(timeperiod=14)") """
+    if isinstance(func, str) or len(func) < 2 or not func[1]:
+        return func if isinstance(func, str) else func[0]
+    return "%s(%s)" % (func[0], ", ".join(
+        "%s=%s" % (key, func[1][key]) for key in sorted(func[1])))
+
+
+def _batch_functions(functions):
+    """ normalize to {label: (function name, kwargs)} """
+    if isinstance(functions, dict):
+        items = functions.items()
+    else:
+        items = []
+        for func in functions:
+            items.append((_batch_label(func), func))
+
+        labels = [label for label, _ in items]
+        duplicates = sorted(set(
+            label for label in labels if labels.count(label) > 1))
+        if duplicates:
+            raise ValueError("Duplicate batch functions: %s" %
+                             ", ".join(duplicates))
+
+    normalized = {}
+    for label, func in items:
+        if isinstance(func, str):
+            func = (func, {})
+        name, kwargs = func[0].upper(), dict(func[1]) if len(func) > 1 else {}
+        _signature(name)
+        normalized[label] = (name, kwargs)
+    return normalized
+
+
+def _run_symbol(data, functions):
+    """ run all functions over one symbol's arrays """
+    if isinstance(data, DataFrame):
+        columns = {col: data[col].values for col in data.columns}
+    elif isinstance(data, dict):
+        columns = data
+    else:
+        columns = {'close': data}
+
+    if 'close' not in columns and 'last' in columns:
+        columns = dict(columns, close=columns['last'])
+
+    arrays = {}
+    results = {}
+    for label, (name, kwargs) in functions.items():
+        inputs, outputs = _signature(name)
+        for col in inputs:
+            if col not in arrays:
+                arrays[col] = _as_input(columns[col])
+
+        res = getattr(talib, name)(*[arrays[col] for col in inputs],
+                                    **kwargs)
+        if len(outputs) > 1:
+            res = dict(zip(outputs, res))
+        results[label] = res
+
+    return results
+
+
+def run_batch(data, functions, threads=None):
+    """Runs TA-Lib functions over many symbols, in parallel threads
+    (TA-Lib's C functions don't hold Python's GIL)
+
+    :Parameters:
+        data : dict
+            {symbol: data}, where data is a DataFrame, a dict of
+            numpy arrays ({"open": ..., "close": ...}) or a close-price
+            array. Contiguous float64 arrays are used without copying
+        functions : list / dict
+            TA-Lib function names (eg. ["RSI", "ATR"]), (name, kwargs)
+            tuples (eg. [("RSI", {"timeperiod": 14})], labelled
+            "RSI(timeperiod=14)") or a dict of
+            {label: name / (name, kwargs)}
+
+    :Optional:
+        threads : int
+            Number of worker threads (default: number of CPUs, 0 = run
+            on the calling thread)
+
+    :Returns:
+        results : dict
+            {symbol: {label: array}} (multi-output functions return
+            {output name: array}, eg. results["AAPL"]["MACD"]["macdsignal"])
+    """
+    _check_talib_presence()
+    functions = _batch_functions(functions)
+    threads = cpu_count() if threads is None else int(threads)
+
+    if threads < 2 or len(data) < 2:
+        return {symbol: _run_symbol(values, functions)
+                for symbol, values in data.items()}
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(data))) as pool:
+        futures = {symbol: pool.submit(_run_symbol, values, functions)
+                   for symbol, values in data.items()}
+        return {symbol: future.result()
+                for symbol, future in futures.items()}
@@ -0,0 +1,89 @@
+from nose.tools import eq_
+import gc
+import time
+from qtpylib.asynctools import Scheduler, PacedDispatcher, BarTimer
+
+def test_scheduler():
+    """Test that scheduled calls fire in deadline order and can be cancelled"""
+
+    scheduler = Scheduler()
+    fired = []
+
+    now = time.time()
+    for delay in (0.04, 0.01, 0.03, 0.02):
+        scheduler.call_at(now + delay, fired.append, delay)
+    event = scheduler.call_later(0.025, fired.append, "cancelled")
+    scheduler.cancel(event)
+
+    time.sleep(0.1)
+    scheduler.stop()
+    scheduler.join(1)
+
+    eq_(fired, [0.01, 0.02, 0.03, 0.04])
+    eq_(scheduler.is_alive(), False)
+
+def test_paced_dispatcher():
+    """Test that dispatched calls are paced by the token bucket"""
+
+    dispatcher = PacedDispatcher(rate=100, capacity=5)
+    stamps = []
+
+    gc.collect()  # not mid-test
+    start = time.time()
+    futures = [dispatcher.submit(lambda i: stamps.append(time.time()) or i,
+                                 args=(i,)) for i in range(15)]
+    eq_(time.time() - start < 0.01, True)  # submit doesn't block
+
+    eq_([future.result(timeout=2) for future in futures], list(range(15)))
+    # 5 immediately (burst), then 10 at 100/sec
+    eq_(0.08 < stamps[-1] - start < 0.2, True)
+    eq_(stamps[4] - start < 0.01, True)
+
+def test_bar_timer():
+    """Test that bars close at their boundary without further ticks"""
+
+    closed = []
+    timer = BarTimer(0.1, lambda *args: closed.append((time.time(),) + args))
+
+    # ticks early in a bar
+    now = time.time()
+    start = now - now % 0.1
+    if now - start > 0.05:
+        time.sleep(start + 0.1 - now)
+        start += 0.1
+    timer.update("ES", start + 0.001, 10, 1, asset_class="FUT")
+    timer.update("ES", start + 0.002, 12, 2)
+    timer.update("ES", start + 0.003, 9, 1)
+
+    # closed at the boundary, once (nothing re-armed without ticks)
+    time.sleep(0.35)
+    timer.stop()
+
+    eq_(len(closed), 1)
+    fired, symbol, bar_start, bar = closed[0]
+    eq_(symbol, "ES")
+    eq_(abs(bar_start - start) < 1e-6, True)
+    eq_(abs(fired - (start + 0.1)) < 0.05, True)
+    eq_(bar, {"open": 10, "high": 12, "low": 9, "close": 9,
+              "volume": 4, "asset_class": "FUT"})
+
+def test_bar_timer_late_ticks():
+    """Test that out-of-order ticks don't replace (or reopen) bars"""
+
+    closed = []
+    timer = BarTimer(60, lambda *args: closed.append(args))
+    start = (time.time() // 60 - 10) * 60  # bars in the past
+
+    eq_(timer.update("ES", start + 1, 10, 1), True)
+    eq_(timer.update("ES", start + 61, 20, 1), True)   # closes 1st bar
+    eq_(timer.update("ES", start + 2, 5, 1), False)    # late: 1st bar
+    eq_(timer.update("ES", start + 62, 21, 2), True)
+
+    # the 2nd bar is kept (and closed by its timer, already due)
+    time.sleep(0.1)
+    eq_(timer.update("ES", start + 63, 1, 1), False)   # 2nd bar closed
+    timer.stop()
+
+    eq_([(args[1] - start, args[2]["open"], args[2]["close"],
+          args[2]["volume"]) for args in closed],
+        [(0, 10, 10, 1), (60, 20, 21, 3)])
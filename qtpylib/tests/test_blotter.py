@@ -0,0 +1,94 @@
+from nose.tools import eq_
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import zmq
+
+try:
+    from qtpylib.blotter import Blotter
+except Exception:
+    Blotter = None  # IB API (ezibpy/IbPy2) isn't importable
+
+def _tick(symbol, last):
+    return {"symbol": symbol, "symbol_group": symbol + "_STK",
+            "asset_class": "STK", "kind": "TICK",
+            "timestamp": "2020-01-06 15:00:00.000000",
+            "last": last, "lastsize": 100, "bid": last - .01,
+            "bidsize": 1, "ask": last + .01, "asksize": 1}
+
+def test_snapshot_round_trip():
+    """Test that clients get the latest state (and sequence) over REQ/REP"""
+
+    if Blotter is None:
+        return
+
+    endpoint = "inproc://test_snapshot"
+    blotter = Blotter(name="test_snapshot", dbskip=True, as_client=True,
+                      zmqbind=endpoint, zmqconnect=endpoint)
+    blotter.socket = blotter._zmq_context().socket(zmq.PUB)
+    blotter.socket.bind(endpoint)
+
+    blotter.broadcast(_tick("AAPL", 100.), "TICK")
+    blotter.broadcast(_tick("MSFT", 50.), "TICK")
+    blotter.broadcast(_tick("AAPL", 101.), "TICK")
+
+    threading.Thread(target=blotter._serve_snapshots, daemon=True).start()
+
+    snapshot = blotter.snapshot(["AAPL"], timeout=5000)
+    eq_(snapshot["seq"], 3)
+    eq_(list(snapshot["symbols"]), ["AAPL"])
+    eq_(snapshot["symbols"]["AAPL"]["TICK"]["last"], 101.)
+    eq_(snapshot["symbols"]["AAPL"]["TICK"]["_seq"], 3)
+
+    # all symbols, prepared as the stream's handlers get them
+    snapshot = blotter.snapshot(timeout=5000)
+    eq_(sorted(snapshot["symbols"]), ["AAPL", "MSFT"])
+    prepared = blotter._prepare_snapshot(snapshot["symbols"])
+    tick = prepared["MSFT"]["TICK"]
+    eq_(tick["last"].values[-1], 50.)
+    eq_("_seq" in tick.columns, False)
+    eq_(str(tick.index[-1]), "2020-01-06 15:00:00+00:00")
+
+    # the server keeps serving newer state
+    blotter.broadcast(_tick("MSFT", 51.), "TICK")
+    snapshot = blotter.snapshot("MSFT", timeout=5000)
+    eq_(snapshot["seq"], 4)
+    eq_(snapshot["symbols"]["MSFT"]["TICK"]["last"], 51.)
+
+    blotter.socket.close()
+
+def test_blotter_file_running():
+    """Test that only other processes of the script count as running"""
+
+    if Blotter is None:
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        script = os.path.join(tmpdir, "test_blotter_running.py")
+        with open(script, "w") as f:
+            f.write("import sys, time\n"
+                    "from qtpylib.blotter import Blotter\n"
+                    "if sys.argv[1:] == ['wait']:\n"
+                    "    time.sleep(30)\n"
+                    "print(Blotter._blotter_file_running())\n")
+
+        # same imports as this process
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+        def running():
+            return subprocess.check_output(
+                [sys.executable, script], env=env,
+                timeout=30).decode().strip()
+
+        # only this process runs the script
+        eq_(running(), "False")
+
+        # another process runs it
+        other = subprocess.Popen([sys.executable, script, "wait"], env=env)
+        try:
+            eq_(running(), "True")
+        finally:
+            other.kill()
+            other.wait()
@@ -0,0 +1,95 @@
+from nose.tools import eq_, assert_raises
+import time
+from types import SimpleNamespace
+from qtpylib import asynctools
+from qtpylib.orders import OrderStore
+
+try:
+    from qtpylib.broker import Broker
+except Exception:
+    Broker = None  # IB API (ezibpy/IbPy2) isn't importable
+
+class _Contracts():
+    """ stands in for the broker's IB contract lookups """
+
+    def get_ticksize(self, symbol):
+        if symbol == "XX":
+            raise KeyError(symbol)
+        return 0.25
+
+def test_validate_order():
+    """Test that invalid orders raise before they're queued"""
+
+    if Broker is None:
+        return
+
+    validate = Broker._validate_order
+    broker = _Contracts()
+
+    validate(broker, symbol="ES", direction="BUY", quantity=1)
+    validate(broker, symbol="ES", direction="short", quantity=2,
+             limit_price=100.25, target=101, initial_stop=99)
+    validate(broker, symbol="ES", direction="SELL", quantity=1,
+             order_type="MODIFY", orderId=7, limit_price=100)
+
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="HOLD", quantity=1)
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="BUY", quantity=0)
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="BUY", quantity=float("nan"))
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="BUY", quantity="one")
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="BUY", quantity=1, limit_price="x")
+    assert_raises(ValueError, validate, broker, symbol="ES",
+                  direction="BUY", quantity=1, order_type="MODIFY")
+    assert_raises(ValueError, validate, broker, symbol="XX",
+                  direction="BUY", quantity=1)
+
+def _order_timer_broker():
+    """ a broker's pending orders state, with its order timer """
+    methods = ("_update_pending_order", "_update_order_history",
+               "_schedule_pending_expiry", "_unschedule_pending_expiry",
+               "_cancel_expired_pending_order", "_expire_pending_order")
+    broker = type("_Broker", (), {
+        name: getattr(Broker, name) for name in methods})()
+
+    broker.cancelled = []
+    broker.ibConn = SimpleNamespace(cancelOrder=broker.cancelled.append)
+    broker.orders = SimpleNamespace(pending={}, pending_ttls={},
+                                    history=OrderStore())
+    broker._pending_expiries = {}
+    broker._order_timer = asynctools.Scheduler(name="test_order_timer")
+    return broker
+
+def test_pending_order_expiry():
+    """Test that pending orders are cancelled by the order timer"""
+
+    if Broker is None:
+        return
+
+    broker = _order_timer_broker()
+    try:
+        # expires unless filled
+        broker._update_pending_order("ES", 1, 50, 1)
+        broker._update_pending_order("NQ", 2, 50, 1)
+        broker._expire_pending_order("NQ", 2)  # filled
+        eq_(broker.cancelled, [2])
+
+        # re-scheduled once submitted
+        broker._update_pending_order("CL", 3, 50, 1)
+        broker._update_pending_order("CL", 3, 600, 1)
+
+        time.sleep(.2)
+        eq_(broker.cancelled, [2, 1])
+        eq_(sorted(broker.orders.pending), ["CL"])
+        eq_(sorted(broker.orders.pending_ttls), [3])
+
+        time.sleep(.6)
+        eq_(broker.cancelled, [2, 1, 3])
+        eq_(broker.orders.pending, {})
+        eq_(broker.orders.pending_ttls, {})
+        eq_(broker._pending_expiries, {})
+    finally:
+        broker._order_timer.stop()
@@ -0,0 +1,69 @@
+from nose.tools import eq_
+import pandas as pd
+import numpy as np
+from qtpylib import indicators as qtind
+from qtpylib.features import FeatureSet
+
+def test_feature_set():
+    """Test that feature sets share intermediates and match the indicators"""
+
+    rng = np.random.RandomState(1)
+    close = pd.Series(100 + np.cumsum(rng.normal(0, 1, 300)),
+                      index=pd.date_range('2018-01-01', periods=300, freq='T'))
+    bars = pd.DataFrame({'open': close, 'high': close + rng.rand(300),
+                         'low': close - rng.rand(300), 'close': close,
+                         'volume': rng.randint(1, 100, 300)})
+
+    features = FeatureSet()
+    features.add("rsi", "rsi", window=13)
+    features.add("tdi", "tdi")
+    features.add("rsi_sma", "sma", on="rsi", window=5)
+    features.add("kc", "keltner_channel", window=20)
+    features.add("atr", "atr", window=20)
+    features.add("cci", "cci")
+
+    # one rsi, typical price, true range and atr node
+    kinds = [key[0] for key in features.nodes]
+    for kind in ('rsi', 'typical_price', 'true_range', 'atr'):
+        eq_(kinds.count(kind), 1)
+
+    calls = []
+    values = features.evaluate(lambda: calls.append(1) or bars)
+    eq_(len(calls), 1)
+    pd.testing.assert_series_equal(values['rsi'], qtind.rsi(close, 13))
+    pd.testing.assert_frame_equal(values['tdi'], qtind.tdi(close))
+    pd.testing.assert_series_equal(values['rsi_sma'],
+                                   qtind.sma(qtind.rsi(close, 13), 5))
+    pd.testing.assert_frame_equal(values['kc'],
+                                  qtind.keltner_channel(bars, 20))
+    pd.testing.assert_series_equal(values['cci'], qtind.cci(bars))
+
+    # cached values are re-used
+    cache = {}
+    first = features.evaluate(bars, "atr", cache)
+    assert features.evaluate(bars, "atr", cache) is first
+
+def test_feature_store():
+    """Test that the feature store re-uses stored, point-in-time features"""
+    import tempfile
+    from qtpylib.features import FeatureStore
+
+    rng = np.random.RandomState(1)
+    close = pd.Series(100 + np.cumsum(rng.normal(0, 1, 200)),
+                      index=pd.date_range('2018-01-01', periods=200, freq='T'))
+    bars = pd.DataFrame({'open': close, 'high': close + 1,
+                         'low': close - 1, 'close': close,
+                         'volume': rng.randint(1, 100, 200)})
+
+    features = FeatureSet().add("rsi", "rsi").add("kc", "keltner_channel")
+    features.add("cci", "cci")  # looks ahead (std of the entire series)
+
+    store = FeatureStore(tempfile.mkdtemp(), fmt="pickle")
+    stored = store.get(features, bars, "ES", "1T")
+    eq_(list(stored.columns), ['rsi', 'kc_upper', 'kc_mid', 'kc_lower'])
+    np.testing.assert_allclose(stored['rsi'], qtind.rsi(close))
+
+    # served from disk when nothing changed
+    features.evaluate = None
+    pd.testing.assert_frame_equal(store.get(features, bars, "ES", "1T",
+                                            names=["rsi", "kc"]), stored)
@@ -0,0 +1,342 @@
+from nose.tools import eq_
+import datetime
+import os
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from qtpylib import futures
+
+def _bar(symbol, expiry, price, volume):
+    return {"symbol": symbol, "expiry": expiry, "open": price,
+            "high": price, "low": price, "close": price, "volume": volume}
+
+def test_continuous_contract_active_by_volume():
+    """Test that the most traded (unexpired) contract becomes active"""
+
+    contract = futures.ContinuousContract("ES_F", window=5)
+    index = pd.date_range("2020-01-06", periods=60, freq="1T", tz="UTC")
+
+    # a back month is seen first, then the (more traded) front month
+    for timestamp in index[:30]:
+        contract.add(timestamp, _bar("ESM2020", "2020-06-19", 105, 10))
+    for timestamp in index[30:]:
+        contract.add(timestamp, _bar("ESM2020", "2020-06-19", 105, 10))
+        contract.add(timestamp, _bar("ESH2020", "2020-03-20", 100, 1000))
+
+    eq_(contract.active, "ESH2020")
+    eq_(contract.offset, -5.)
+    bars = contract.get_bars()
+    eq_(list(bars['symbol'].unique()), ["ESM2020", "ESH2020"])
+    eq_(bars['close'].unique().tolist(), [100.])  # back-adjusted by -5
+
+    # rolls forward on volume, and doesn't return to the rolled contract
+    roll = pd.date_range(index[-1], periods=30, freq="1T")[1:]
+    for i, timestamp in enumerate(roll):
+        contract.add(timestamp, _bar("ESH2020", "2020-03-20", 100,
+                                     1000 if i > 10 else 10))
+        contract.add(timestamp, _bar("ESM2020", "2020-06-19", 105, 500))
+
+    eq_(contract.active, "ESM2020")
+    eq_(contract.offset, 0.)
+    bars = contract.get_bars()
+    eq_(bars.index.is_unique, True)
+    eq_(bars['close'].unique().tolist(), [105.])
+
+def test_continuous_contract_expiry_and_resolution():
+    """Test rolling at expiry and aggregating bars into the resolution"""
+
+    contract = futures.ContinuousContract("ES_F", resolution="5T")
+
+    # history, at the resolution
+    history = pd.date_range("2020-03-19 23:40", periods=4, freq="5T",
+                            tz="UTC")
+    for timestamp in history:
+        contract.add(timestamp, _bar("ESH2020", "2020-03-19", 100, 100))
+        contract.add(timestamp, _bar("ESM2020", "2020-06-19", 103, 10))
+    eq_(contract.active, "ESH2020")
+
+    # streamed 1-minute bars, after the front month's expiry
+    new = 0
+    stream = pd.date_range("2020-03-20", periods=10, freq="1T", tz="UTC")
+    for i, timestamp in enumerate(stream):
+        new += contract.add(timestamp, _bar(
+            "ESM2020", "2020-06-19", 103 + i, 10)) is not None
+
+    eq_(contract.active, "ESM2020")
+    eq_(new, 2)  # one per 5T bar
+
+    bars = contract.get_bars()
+    eq_(len(bars), 6)
+    eq_(bars.index[-2:].tolist(), list(stream[::5]))
+    eq_(bars['volume'].tolist()[-2:], [50, 50])
+    eq_(bars['high'].tolist()[-2:], [107, 112])
+    eq_(bars['open'].tolist()[-2:], [103, 108])
+    np.testing.assert_allclose(bars['close'].values[:4], 103)
+
+def test_continuous_contract_revise():
+    """Test that revised bars replace (not add to) the bars they revise"""
+
+    contract = futures.ContinuousContract("ES_F", window=2, resolution="5T")
+    stream = pd.date_range("2020-01-06", periods=2, freq="1T", tz="UTC")
+
+    contract.add(stream[0], _bar("ESH2020", "2020-03-20", 100, 10))
+    contract.add(stream[1], _bar("ESH2020", "2020-03-20", 101, 10))
+
+    revised = _bar("ESH2020", "2020-03-20", 102, 15)
+    revised['low'] = 99
+    eq_(contract.revise(stream[1], revised)['close'], 102)
+    eq_(contract.revise(stream[1], revised)['close'], 102)  # idempotent
+    eq_(contract.revise(stream[0], revised), None)  # not the last bar
+
+    bars = contract.get_bars()
+    eq_(len(bars), 1)
+    eq_(bars['open'].tolist(), [100])
+    eq_(bars['high'].tolist(), [102])
+    eq_(bars['low'].tolist(), [99])
+    eq_(bars['close'].tolist(), [102])
+    eq_(bars['volume'].tolist(), [25])
+    eq_(contract._volumes["ESH2020"][1], 25)
+
+    # revised volumes count when picking the active contract
+    contract.add(stream[1], _bar("ESM2020", "2020-06-19", 103, 20))
+    eq_(contract.active, "ESH2020")
+    eq_(contract.revise(stream[1], _bar("ESM2020", "2020-06-19", 103, 30)),
+        None)  # not the active contract's bar
+    contract.add(stream[1] + pd.Timedelta("1T"),
+                 _bar("ESM2020", "2020-06-19", 104, 1))
+    eq_(contract.active, "ESM2020")
+
+def _specs_file(tmpdir):
+    specs_file = os.path.join(tmpdir, "futures_spec.pkl")
+    pd.DataFrame([
+        {"symbol": "ES", "class": "ES", "exchange": "GLOBEX",
+         "margin": 6000},
+        {"symbol": "MES", "class": "MES", "exchange": "GLOBEX",
+         "margin": 600},
+        {"symbol": "GC", "class": "GC", "exchange": "NYMEX",
+         "margin": 7000},
+        {"symbol": "GC", "class": "MGC", "exchange": "COMEX",
+         "margin": 700},
+        {"symbol": "ZN", "class": "ZN", "exchange": "ECBOT",
+         "margin": 1500},
+        {"symbol": "10Y", "class": "ZN", "exchange": "CBOT",
+         "margin": 1400},
+    ]).to_pickle(specs_file)
+    return specs_file
+
+def test_futures_specs_lookups():
+    """Test the specs' symbol, class and exchange lookups"""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        specs = futures.FuturesSpecs(cache_file=_specs_file(tmpdir))
+
+        eq_(len(specs.get()), 6)
+        eq_(specs.get("es")['margin'], 6000)
+        eq_(specs.get("XX"), None)
+
+        # symbol first, then class
+        eq_(specs.get("GC")['margin'], 7000)
+        eq_(specs.get("MGC")['margin'], 700)
+        eq_(specs.get("ZN")['margin'], 1500)
+
+        # by exchange: symbol first, then class
+        eq_(specs.get("GC", "COMEX")['margin'], 700)
+        eq_(specs.get("ZN", "CBOT")['margin'], 1400)
+        eq_(specs.get("ZN", "ECBOT")['margin'], 1500)
+        eq_(specs.get("ES", "NYMEX"), None)
+
+def test_futures_specs_refresh_backoff():
+    """Test that a failed refresh isn't retried on every lookup"""
+
+    downloads = []
+
+    def download():
+        downloads.append(time.time())
+        raise IOError("no network")
+
+    original = futures._download_ib_futures
+    futures._download_ib_futures = download
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            specs = futures.FuturesSpecs(cache_file=_specs_file(tmpdir),
+                                         ttl=60)
+            os.utime(specs.cache_file, (time.time() - 120,) * 2)
+
+            # stale: refreshed in the background (and fails)
+            eq_(specs.get("ES")['margin'], 6000)
+            while specs._refreshing:
+                time.sleep(.01)
+            eq_(len(downloads), 1)
+
+            for _ in range(10):
+                eq_(specs.get("ES")['margin'], 6000)
+            time.sleep(.1)
+            eq_(len(downloads), 1)
+    finally:
+        futures._download_ib_futures = original
+
+def test_futures_specs_snapshot():
+    """Test that the bundled specs are used when they can't be downloaded"""
+
+    downloads = []
+
+    def download():
+        downloads.append(time.time())
+        raise IOError("no network")
+
+    original = futures._download_ib_futures
+    futures._download_ib_futures = download
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, "futures_spec.pkl")
+            specs = futures.FuturesSpecs(cache_file=cache_file)
+
+            eq_(specs.get("ES")['exchange'], "GLOBEX")
+            eq_(specs.get("6E")['symbol'], "EUR")
+            eq_(specs.get("ZN", "ECBOT")['currency'], "USD")
+            eq_(len(downloads), 1)
+
+            # not cached, and not re-downloaded before RETRY_SEC
+            for _ in range(10):
+                eq_(specs.get("GC")['exchange'], "NYMEX")
+            time.sleep(.1)
+            eq_(len(downloads), 1)
+            eq_(os.path.exists(cache_file), False)
+    finally:
+        futures._download_ib_futures = original
+
+class _Cursor():
+    """ DB-API cursor returning the bars' (grouped) volumes """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [("symbol_group",), ("expiry",), ("volume",)]
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.conn.rows
+
+    def close(self):
+        pass
+
+class _Connection():
+    """ DB-API connection stub (pandas warns about non-sqlite ones) """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+def test_active_contracts_from_db():
+    """Test the most active expiry selection from the bars' volumes"""
+
+    conn = _Connection([
+        ("ES_F", datetime.date(2020, 3, 20), 900),
+        ("ES_F", datetime.date(2020, 6, 19), 1200),
+        ("CL_F", datetime.date(2020, 4, 21), 500),
+        ("CL_F", datetime.date(2020, 5, 19), 500),
+        ("GC_F", datetime.date(2020, 4, 28), 0),
+    ])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        active = futures._active_contracts_from_db(
+            ["ES", "CL", "GC"], conn, lookback=5)
+
+    # highest volume, then the nearest expiry; no volume = unresolved
+    eq_(active, {"ES": "202006", "CL": "202004"})
+
+    sql, params = conn.executed[0]
+    eq_(params[:3], ["ES_F", "CL_F", "GC_F"])
+    eq_(len(params), 5)
+    eq_("GROUP BY s.symbol_group, s.expiry" in sql, True)
+
+def test_active_contracts_guesses_not_cached():
+    """Test that guessed expiries aren't kept in the roll calendar"""
+
+    def scrape(symbol, url=None, n=1):
+        raise IOError("no network")
+
+    original = (futures._scrape_active_contract,
+                futures._guess_active_contract,
+                futures._roll_calendar_file, futures._roll_calendar)
+    futures._scrape_active_contract = scrape
+    futures._guess_active_contract = lambda: "203001"
+
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                warnings.catch_warnings():
+            futures._roll_calendar = None
+            futures._roll_calendar_file = lambda: os.path.join(
+                tmpdir, "futures_roll_calendar.pkl")
+
+            warnings.simplefilter("ignore", UserWarning)
+            conn = _Connection([("ES_F", datetime.date(2020, 6, 19), 10)])
+            eq_(futures.get_active_contracts(["es", "NQ"], conn),
+                {"ES": "202006", "NQ": "203001"})
+
+            eq_(list(futures._roll_calendar.keys()), ["ES"])
+            eq_(list(pd.read_pickle(futures._roll_calendar_file())), ["ES"])
+
+            # only the guessed symbol is looked up again
+            conn.rows = []
+            eq_(futures.get_active_contracts(["ES", "NQ"], conn),
+                {"ES": "202006", "NQ": "203001"})
+            eq_(conn.executed[-1][1][0], "NQ_F")
+    finally:
+        (futures._scrape_active_contract, futures._guess_active_contract,
+         futures._roll_calendar_file, futures._roll_calendar) = original
+
+def test_create_continuous_contract():
+    """Test the roll schedule and back-adjustment of overlapping expiries"""
+
+    index = pd.date_range("2020-03-18", "2020-06-22 18:00",
+                          freq="6H", tz="UTC")
+    contracts = [  # symbol, expiry, first bar, last bar, price (+5 spread)
+        ("ESH2020", "2020-03-20", index[0], "2020-03-23", 100),
+        ("ESM2020", "2020-06-19", index[0], index[-1], 105),
+        ("ESU2020", "2020-09-18", "2020-05-01", index[-1], 110),
+    ]
+
+    frames = []
+    for symbol, expiry, first, last, price in contracts:
+        rows = index[(index >= first) & (index <= last)]
+        frames.append(pd.DataFrame(index=rows, data={
+            "symbol": symbol, "expiry": expiry, "open": price,
+            "high": price + 1, "low": price - 1, "close": price,
+            "volume": 100}))
+    df = pd.concat(frames).sort_index(kind="mergesort")
+
+    schedule = futures._roll_schedule(
+        pd.to_datetime(df['expiry'], utc=True).values,
+        pd.DatetimeIndex(df.index).floor('D').values, df['close'].values)
+    eq_([str(day.date()) for day in schedule['roll']],
+        ["2020-03-20", "2020-06-19", "2020-09-18"])
+    eq_(schedule['offset'].tolist(), [10., 5., 0.])
+
+    contract = futures.create_continuous_contract(df)
+
+    # every timestamp once, from the active contract
+    eq_(contract.index.is_unique, True)
+    eq_(list(contract.index), list(index))
+    day = contract.index.floor('D')
+    eq_(set(contract[day <= "2020-03-20"]['symbol']), {"ESH2020"})
+    eq_(set(contract[(day > "2020-03-20") & (day <= "2020-06-19")]
+            ['symbol']), {"ESM2020"})
+    eq_(set(contract[day > "2020-06-19"]['symbol']), {"ESU2020"})
+
+    # back-adjusted: no gaps at the rolls
+    eq_(contract['close'].unique().tolist(), [110])
+    eq_(contract['high'].unique().tolist(), [111])
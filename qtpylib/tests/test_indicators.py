@@ -36,3 +36,269 @@ def test_indicator_stoch_fast():
     last_stoch_fast_d = int(my_stoch['fast_d'].tail(1)*1000)
     eq_(last_stoch_fast_k, 30769)
     eq_(last_stoch_fast_d, 33488)
+
+def test_streaming_indicators():
+    """Test that streaming indicators match their batch versions"""
+
+    rng = np.random.RandomState(7)
+    close = pd.Series(100 + np.cumsum(rng.normal(0, 1, 300)))
+    bars = pd.DataFrame({'high': close + rng.rand(300),
+                         'low': close - rng.rand(300),
+                         'close': close,
+                         'volume': rng.randint(1, 100, 300)})
+
+    def stream(indicator):
+        values = []
+        for i, bar in enumerate(bars.to_dict(orient='records')):
+            # revise each bar once (as with partially built bars)
+            indicator.update(dict(bar, close=bar['close'] + 1), i)
+            values.append(indicator.update(bar, i))
+        return values
+
+    np.testing.assert_allclose(stream(qtind.StreamingSMA(20)),
+                               qtind.sma(close, 20), rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingEMA(20)),
+                               qtind.wma(close, 20), rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingRSI(14))[15:],
+                               qtind.rsi(close, 14)[15:], rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingATR(14)),
+                               qtind.atr(bars, 14), rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingVWAP()),
+                               qtind.vwap(bars), rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingRollingMax(14)),
+                               close.rolling(14).max(), rtol=1e-10)
+
+    np.testing.assert_allclose(stream(qtind.StreamingRollingMin(14)),
+                               close.rolling(14).min(), rtol=1e-10)
+    np.testing.assert_allclose(stream(qtind.StreamingStd(20)),
+                               qtind.rolling_std(close, 20), rtol=1e-8)
+
+    bands = stream(qtind.StreamingBollingerBands(20))
+    batch = qtind.bollinger_bands(close, 20)
+    for col in ('upper', 'mid', 'lower'):
+        np.testing.assert_allclose([v[col] for v in bands], batch[col],
+                                   rtol=1e-8)
+
+    macd = stream(qtind.StreamingMACD())
+    np.testing.assert_allclose([v['signal'] for v in macd],
+                               qtind.macd(close)['signal'], rtol=1e-10)
+
+    stoch = stream(qtind.StreamingStoch())
+    np.testing.assert_allclose([v['slow_d'] for v in stoch],
+                               qtind.stoch(bars)['slow_d'], rtol=1e-10)
+
+def test_streaming_rsi_nan():
+    """Test that the streaming rsi skips missing prices"""
+
+    close = pd.Series(100 + np.cumsum(
+        np.random.RandomState(5).normal(0, 1, 200)))
+    close[[60, 61, 120]] = np.nan
+
+    rsi = qtind.StreamingRSI(14)
+    values = np.array([rsi.update(price, i) for i, price in enumerate(close)])
+
+    eq_(np.isnan(values[15:]).sum(), 3)
+    eq_(np.isnan(values[[60, 61, 120]]).all(), True)
+
+    # same as the rsi of the prices without the missing ones
+    valid = close.notnull().values
+    np.testing.assert_allclose(values[valid][15:],
+                               qtind.rsi(close.dropna(), 14)[15:],
+                               rtol=1e-10)
+
+def _rsi_loop(series, window=14):
+    """Reference (loop based) rsi implementation"""
+    deltas = np.diff(series)
+    seed = deltas[:window + 1]
+    ups = seed[seed > 0].sum() / window
+    downs = -seed[seed < 0].sum() / window
+    rsival = np.zeros_like(series)
+    rsival[:window] = 100. - 100. / (1. + ups / downs)
+    for i in range(window, len(series)):
+        delta = deltas[i - 1]
+        upval, downval = (delta, 0) if delta > 0 else (0, -delta)
+        ups = (ups * (window - 1) + upval) / window
+        downs = (downs * (window - 1.) + downval) / window
+        rsival[i] = 100. - 100. / (1. + ups / downs)
+    return rsival
+
+def _heikinashi_open_loop(bars):
+    """Reference (loop based) heikin-ashi open"""
+    ha_close = (bars['open'] + bars['high'] +
+                bars['low'] + bars['close']).values / 4
+    ha_open = np.empty(len(bars))
+    ha_open[0] = (bars['open'].values[0] + bars['close'].values[0]) / 2
+    for i in range(1, len(bars)):
+        ha_open[i] = (ha_open[i - 1] + ha_close[i - 1]) / 2
+    return ha_open
+
+def test_recursive_indicators_parity():
+    """Test that loop-free rsi/heikinashi match the loop implementations"""
+
+    rng = np.random.RandomState(11)
+    for length in (5, 14, 15, 16, 500):
+        close = pd.Series(100 + np.cumsum(rng.normal(0, 1, length)))
+        np.testing.assert_allclose(qtind.rsi(close, 14), _rsi_loop(close),
+                                   rtol=1e-12)
+
+        bars = pd.DataFrame({'open': close.shift(1).fillna(close[0]),
+                             'high': close + rng.rand(length),
+                             'low': close - rng.rand(length),
+                             'close': close},
+                            index=pd.date_range('2018-01-01', periods=length,
+                                                freq='T'))
+        ha = qtind.heikinashi(bars)
+        eq_(len(ha), length)
+        np.testing.assert_array_equal(ha['open'], _heikinashi_open_loop(bars))
+        np.testing.assert_array_equal(ha['high'], np.maximum(
+            bars['high'], np.maximum(ha['open'], ha['close'])))
+
+def test_recursive_indicators_nan_parity():
+    """Test that loop-free rsi/heikinashi propagate NaNs like the loops"""
+
+    rng = np.random.RandomState(13)
+    close = pd.Series(100 + np.cumsum(rng.normal(0, 1, 500)))
+    close[[3, 250]] = np.nan
+
+    expected = _rsi_loop(close)
+    actual = qtind.rsi(close, 14)
+    eq_(np.isnan(actual).sum(), np.isnan(expected).sum())
+    np.testing.assert_allclose(actual, expected, rtol=1e-12)
+
+    bars = pd.DataFrame({'open': close.shift(1).fillna(close[0]),
+                         'high': close + rng.rand(500),
+                         'low': close - rng.rand(500),
+                         'close': close},
+                        index=pd.date_range('2018-01-01', periods=500,
+                                            freq='T'))
+    ha = qtind.heikinashi(bars)
+    ha_open = _heikinashi_open_loop(bars)
+    np.testing.assert_array_equal(ha['open'], ha_open)
+    np.testing.assert_array_equal(ha['high'], pd.DataFrame(
+        {'high': bars['high'], 'open': ha_open, 'close': ha['close']}
+    ).max(axis=1))
+    np.testing.assert_array_equal(ha['low'], pd.DataFrame(
+        {'low': bars['low'], 'open': ha_open, 'close': ha['close']}
+    ).min(axis=1))
+
+def test_recursive_indicators_benchmark():
+    """Micro-benchmark: loop-free rsi should beat the loop implementation"""
+    from timeit import timeit
+
+    close = pd.Series(100 + np.cumsum(np.random.RandomState(3).normal(
+        0, 1, 20000)))
+    loop = min(timeit(lambda: _rsi_loop(close), number=1) for _ in range(3))
+    vectorized = min(timeit(lambda: qtind.rsi(close), number=1)
+                     for _ in range(3))
+    assert vectorized < loop, (vectorized, loop)
+
+def _strided_rolling(data, window, func, **kwargs):
+    """Reference (O(n*window)) rolling statistic"""
+    return func(qtind.numpy_rolling_window(data, window), axis=-1, **kwargs)
+
+def test_rolling_statistics():
+    """Test the O(n) rolling mean/std and rolling min/max"""
+
+    rng = np.random.RandomState(5)
+    close = 1e4 + np.cumsum(rng.normal(0, 1, 2000))
+    close[100] = np.nan
+    for window in (2, 7, 200):
+        mean = qtind.numpy_rolling_mean(close, window)[window - 1:]
+        std = qtind.numpy_rolling_std(close, window)[window - 1:]
+        np.testing.assert_allclose(
+            mean, _strided_rolling(close, window, np.mean), rtol=1e-14)
+        np.testing.assert_allclose(
+            std, _strided_rolling(close, window, np.std, ddof=1), rtol=1e-9)
+
+    series = pd.Series(close)
+    np.testing.assert_array_equal(qtind.rolling_max(series, 14),
+                                  series.rolling(14).max())
+    np.testing.assert_array_equal(qtind.rolling_min(series, 14),
+                                  series.rolling(14).min())
+
+def test_rolling_statistics_benchmark():
+    """Micro-benchmark: O(n) rolling std vs. the strided implementation"""
+    from timeit import timeit
+
+    close = 1e4 + np.cumsum(np.random.RandomState(3).normal(0, 1, 1000000))
+    strided = timeit(lambda: _strided_rolling(close, 200, np.std, ddof=1),
+                     number=1)
+    linear = min(timeit(lambda: qtind.numpy_rolling_std(close, 200),
+                        number=1) for _ in range(3))
+    assert linear < strided, (linear, strided)
+
+def test_panel_indicators():
+    """Test that panel indicators match the per-symbol indicators"""
+
+    rng = np.random.RandomState(2)
+    index = pd.date_range('2018-01-01', periods=300, freq='T')
+    frames = []
+    for symbol, start in (('AAA', 0), ('BBB', 40)):
+        close = 100 + np.cumsum(rng.normal(0, 1, 300))
+        frames.append(pd.DataFrame({'symbol': symbol, 'close': close,
+                                    'high': close + rng.rand(300),
+                                    'low': close - rng.rand(300)},
+                                   index=index)[start:])
+    bars = pd.concat(frames).sort_index()
+
+    eq_(qtind.panel(bars).shape, (300, 2))
+    for symbol in ('AAA', 'BBB'):
+        single = bars[bars['symbol'] == symbol]
+        close = single['close']
+
+        def check(panel_result, expected):
+            np.testing.assert_allclose(
+                panel_result[symbol].reindex(single.index), expected,
+                rtol=1e-10)
+
+        check(qtind.panel_sma(bars, 20), qtind.sma(close, 20))
+        check(qtind.panel_rsi(bars), qtind.rsi(close))
+        check(qtind.panel_macd(bars)['signal'], qtind.macd(close)['signal'])
+        check(qtind.panel_bollinger_bands(bars)['upper'],
+              qtind.bollinger_bands(close)['upper'])
+        check(qtind.panel_atr(bars), qtind.atr(single).values)
+        check(qtind.panel_stoch(bars)['slow_d'], qtind.stoch(single)['slow_d'])
+
+def test_panel_indicators_gaps():
+    """Test that panel indicators skip a symbol's missing bars"""
+
+    rng = np.random.RandomState(4)
+    index = pd.date_range('2018-01-01', periods=300, freq='T')
+    frames = []
+    for symbol in ('AAA', 'BBB'):
+        close = 100 + np.cumsum(rng.normal(0, 1, 300))
+        frames.append(pd.DataFrame({'symbol': symbol, 'close': close,
+                                    'high': close + rng.rand(300),
+                                    'low': close - rng.rand(300)},
+                                   index=index))
+
+    # mid-series gaps (a halt and scattered missing bars)
+    missing = np.zeros(300, dtype=bool)
+    missing[100:130] = True
+    missing[rng.choice(300, 20, replace=False)] = True
+    frames[1] = frames[1][~missing]
+    bars = pd.concat(frames).sort_index()
+
+    single = frames[1]
+    close = single['close']
+
+    def check(panel_result, expected):
+        result = panel_result['BBB']
+        eq_(result[missing].isnull().all(), True)
+        np.testing.assert_allclose(result.reindex(single.index), expected,
+                                   rtol=1e-10)
+
+    check(qtind.panel_sma(bars, 20), qtind.sma(close, 20))
+    check(qtind.panel_rolling_max(bars, 14), qtind.rolling_max(close, 14))
+    check(qtind.panel_returns(bars), qtind.returns(close))
+    check(qtind.panel_rsi(bars), qtind.rsi(close))
+    check(qtind.panel_macd(bars)['signal'], qtind.macd(close)['signal'])
+    check(qtind.panel_bollinger_bands(bars)['lower'],
+          qtind.bollinger_bands(close)['lower'])
+    check(qtind.panel_zscore(bars), qtind.zscore(single))
+    check(qtind.panel_atr(bars), qtind.atr(single).values)
+    check(qtind.panel_stoch(bars)['slow_d'], qtind.stoch(single)['slow_d'])
+
+    # the other symbol is unaffected
+    np.testing.assert_allclose(qtind.panel_sma(bars, 20)['AAA'],
+                               qtind.sma(frames[0]['close'], 20), rtol=1e-10)
@@ -0,0 +1,33 @@
+from nose.tools import eq_
+import os
+import tempfile
+from datetime import datetime
+import pandas as pd
+from qtpylib.journal import TradeJournal
+
+def test_trade_journal():
+    """Test that re-logged trades are compacted to their last record"""
+
+    directory = tempfile.mkdtemp()
+    stored = []
+    journal = TradeJournal(directory=directory, strategy="Test",
+                           db_writer=stored.append)
+
+    entry = datetime(2018, 1, 2, 10, 30)
+    trade = {'strategy': 'Test', 'symbol': 'ES', 'direction': 'LONG',
+             'quantity': 1, 'entry_time': entry, 'exit_time': None,
+             'entry_price': 100., 'exit_price': None}
+    journal.add(trade)
+    journal.add(dict(trade, symbol='NQ'))
+    journal.add(dict(trade, exit_time=datetime(2018, 1, 2, 11),
+                     exit_price=101.))
+    journal.flush()
+
+    eq_(len(stored), 3)
+    eq_(stored[0]['entry_time'], '2018-01-02 10:30:00.000000')
+
+    trades = pd.read_csv(journal.path(), dtype=str, keep_default_na=False)
+    eq_(list(trades.columns), TradeJournal.COLUMNS)
+    eq_(trades['symbol'].tolist(), ['NQ', 'ES'])
+    eq_(trades['exit_price'].tolist(), ['', '101.0'])
+    os.remove(journal.path())
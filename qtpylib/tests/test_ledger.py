@@ -0,0 +1,42 @@
+from nose.tools import eq_
+from qtpylib.ledger import PositionLedger
+
+def test_position_ledger():
+    """Test positions, average cost and PnL of simulated fills"""
+
+    ledger = PositionLedger()
+
+    # orders are pending until filled
+    ledger.order("ES", 2)
+    eq_(ledger.get("ES")["position"], 0)
+    eq_(ledger.get("ES", pending=True)["position"], 2)
+    eq_(ledger.fill_pending("ES", 100.), 2)
+    eq_(ledger.fill_pending("ES", 101.), 0)
+
+    # add, mark, reduce
+    ledger.fill("ES", 2, 104.)
+    eq_(ledger.get("ES")["avgCost"], 102.)
+    ledger.update_price("ES", 105.)
+    eq_(ledger.get("ES")["unrealizedPNL"], 12.)
+    eq_(ledger.fill("ES", -1, 106.), 4.)
+    eq_(ledger.get("ES")["position"], 3)
+    eq_(ledger.get("ES")["avgCost"], 102.)
+
+    # reverse
+    eq_(ledger.fill("ES", -5, 100.), -6.)
+    position = ledger.get("ES")
+    eq_(position["position"], -2)
+    eq_(position["avgCost"], 100.)
+    eq_(position["realizedPNL"], -2.)
+    ledger.update_price("ES", 99.)
+    eq_(ledger.get("ES")["unrealizedPNL"], 2.)
+
+    # flat
+    ledger.fill("ES", 2, 99.)
+    eq_(ledger.get("ES")["position"], 0)
+    eq_(ledger.get("ES")["avgCost"], 0.)
+
+    # pending orders only count when asked for
+    ledger.order("ES", 3)
+    eq_(ledger.get("ES")["position"], 0)
+    eq_(ledger.get("ES", pending=True)["position"], 3)
@@ -0,0 +1,45 @@
+from nose.tools import eq_
+from qtpylib import metrics as qtmetrics
+
+def test_metrics_counter_histogram():
+    """Test counters/histograms and their Prometheus exposition"""
+
+    reg = qtmetrics.Registry()
+    ticks = reg.counter("test_ticks_total", "ticks", ("symbol",))
+    ticks.labels("ES").inc()
+    ticks.labels("ES").inc(2)
+    ticks.labels("NQ").inc()
+
+    latency = reg.histogram("test_seconds", "latency", buckets=(0.1, 1.))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    eq_(ticks.snapshot(), {("ES",): 3, ("NQ",): 1})
+
+    text = reg.expose()
+    assert 'test_ticks_total{symbol="ES"} 3.0' in text
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert 'test_seconds_count 3' in text
+
+def test_metrics_latency_trace():
+    """Test HDR-style percentiles and stage tracing"""
+
+    reg = qtmetrics.Registry()
+    latency = reg.latency("test_latency_seconds", "latency")
+    for i in range(1, 1001):
+        latency.observe(i / 1e6)
+
+    # within the recorder's precision (~1.5%)
+    assert abs(latency.percentile(50) - 500e-6) < 500e-6 * 0.016
+    assert abs(latency.percentile(99) - 990e-6) < 990e-6 * 0.016
+    eq_(latency.percentile(100), 1000e-6)
+
+    trace = {"callback": 1.0, "built": 1.001, "broadcast": 1.002,
+             "received": 1.004, "dataframe": 1.005, "handled": 1.010}
+    before = qtmetrics._STAGE_LATENCY.labels("TEST", "total").count
+    qtmetrics.trace_record("TEST", trace)
+    eq_(qtmetrics._STAGE_LATENCY.labels("TEST", "total").count, before + 1)
+    eq_(qtmetrics._STAGE_LATENCY.labels("TEST", "received").count, before + 1)
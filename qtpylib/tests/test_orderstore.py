@@ -0,0 +1,76 @@
+from nose.tools import eq_
+import sys
+from threading import Thread
+from qtpylib.orders import OrderStore
+
+def test_order_store():
+    """Test order indexes and pruning of terminal orders"""
+
+    orders = OrderStore(keep=2)
+    orders.add("ES", 1, 2)
+    orders.add("ES", 2, -2, order_type="target", parentId=1)
+    orders.add("ES", 3, -2, order_type="stop", parentId=1)
+    orders.update(4, "SUBMITTED", symbol="NQ")  # placed elsewhere
+
+    eq_(orders["ES"][1]["quantity"], 2)
+    eq_(orders.find("ES", "STOP")["orderId"], 3)
+    eq_(sorted(o["orderId"] for o in orders.active()), [1, 2, 3, 4])
+    eq_(sorted(o["orderId"] for o in orders.children(1)), [2, 3])
+    eq_(orders.orphans(1), [])  # the entry's own bracket stays
+
+    orders.add("ES", 1, 2, filled=True)
+    orders.update(2, "Filled")
+    eq_(orders.get(1)["status"], "FILLED")
+    eq_(sorted(o["orderId"] for o in orders.active()), [3, 4])
+    eq_([o["orderId"] for o in orders.orphans(2)], [3])  # target hit
+
+    # keeps the last 2 terminal orders
+    orders.update(3, "Cancelled")
+    eq_(orders.get(1), None)
+    eq_(1 in orders["ES"], False)
+    eq_(sorted(orders.by_id), [2, 3, 4])
+    eq_(sorted(o["orderId"] for o in orders.children(1)), [2, 3])
+
+def test_order_store_orphans():
+    """Test that a new entry orphans the symbol's earlier brackets"""
+
+    orders = OrderStore()
+    orders.add("ES", 1, 2)
+    orders.add("ES", 2, -2, order_type="target", parentId=1)
+    orders.add("ES", 3, -2, order_type="stop", parentId=1)
+    orders.add("NQ", 4, 1)
+    orders.add("NQ", 5, -1, order_type="stop", parentId=4)
+    orders.add("ES", 6, -2)
+    orders.add("ES", 7, 2, order_type="stop", parentId=6)
+
+    orders.update(3, "CANCELLED")
+    eq_([o["orderId"] for o in orders.orphans(6)], [2])
+    eq_(orders.orphans(8), [])
+
+def test_order_store_threads():
+    """Test that orders can be scanned while they're being updated"""
+
+    orders = OrderStore(keep=100)
+    for orderId in range(500):
+        orders.add("ES", orderId, 1)
+
+    def update():
+        for orderId in range(500):
+            orders.update(orderId, "SUBMITTED")
+            orders.update(orderId, "CANCELLED")
+            orders.update(orderId + 500, "SUBMITTED", symbol="NQ")
+
+    # switch threads as often as possible
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        thread = Thread(target=update)
+        thread.start()
+        while thread.is_alive():
+            orders.active()
+        thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    eq_(len(orders.active()), 500)
+    eq_(len(orders), 600)
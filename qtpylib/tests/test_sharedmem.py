@@ -0,0 +1,98 @@
+from nose.tools import eq_
+import numpy as np
+from qtpylib import sharedmem as qtshm
+
+def test_sharedmem_ring():
+    """Test shared memory ring buffer read/overrun/close"""
+
+    if not qtshm.AVAILABLE:
+        return
+
+    name = qtshm.ring_name("test", "ES_F")
+    writer = qtshm.RingWriter(name, capacity=4)
+    reader = qtshm.RingReader(name)
+
+    try:
+        for i in range(3):
+            writer.write("TICK", i + 1, 0, {"last": i * 1.5, "lastsize": 1})
+        records = reader.read()
+        eq_([int(r['seq']) for r in records], [1, 2, 3])
+        eq_(float(records[-1]['last']), 3.)
+        eq_(reader.read(), [])
+
+        # reader falls behind: skips to the oldest valid record
+        for i in range(10):
+            writer.write("BAR", i + 4, 0, {"close": i})
+        eq_([int(r['seq']) for r in reader.read()], [10, 11, 12, 13])
+    finally:
+        writer.close()
+
+    eq_(reader.closed, True)
+    reader.close()
+
+def test_sharedmem_ring_seek():
+    """Test attaching a reader to a ring from a known sequence"""
+
+    if not qtshm.AVAILABLE:
+        return
+
+    name = qtshm.ring_name("test", "NQ_F")
+    writer = qtshm.RingWriter(name, capacity=4)
+
+    try:
+        # other symbols' broadcasts take sequences too
+        for seq in (2, 5, 7, 8, 11, 12):
+            writer.write("TICK", seq, 0, {"last": seq, "lastsize": 1})
+
+        reader = qtshm.RingReader(name)
+        eq_(reader.read(), [])
+
+        reader.seek(7)
+        eq_([int(r['seq']) for r in reader.read()], [8, 11, 12])
+
+        # older than the records kept: from the oldest one
+        reader.seek(0)
+        eq_([int(r['seq']) for r in reader.read()], [7, 8, 11, 12])
+
+        # newer than the records kept (eg. blotter restarted): head
+        reader.seek(100)
+        eq_(reader.read(), [])
+        writer.write("TICK", 1, 0, {"last": 1, "lastsize": 1})
+        eq_([int(r['seq']) for r in reader.read()], [1])
+        reader.close()
+    finally:
+        writer.close()
+
+def test_sharedmem_missing_values():
+    """Test reading records with missing sizes/volume"""
+
+    if not qtshm.AVAILABLE:
+        return
+
+    name = qtshm.ring_name("test", "CL_F")
+    writer = qtshm.RingWriter(name, capacity=4)
+    reader = qtshm.RingReader(name)
+
+    try:
+        writer.write("TICK", 1, 0, {"last": 10.5, "lastsize": None,
+                                    "bid": 10.25, "ask": 10.75})
+        writer.write("BAR", 2, 0, {"open": 10, "high": 11, "low": 9,
+                                   "close": 10.5})
+        writer.write("TICK", 3, 0, {"last": 10.5, "lastsize": 3,
+                                    "bidsize": 1, "asksize": 2})
+        tick, bar, sized = [qtshm.record_values(r) for r in reader.read()]
+    finally:
+        writer.close()
+        reader.close()
+
+    eq_(tick[0], "TICK")
+    eq_(tick[1]["last"], 10.5)
+    eq_(all(np.isnan(tick[1][field])
+            for field in ("lastsize", "bidsize", "asksize")), True)
+
+    eq_(bar[0], "BAR")
+    eq_(bar[1]["close"], 10.5)
+    eq_(np.isnan(bar[1]["volume"]), True)
+
+    eq_([sized[1][f] for f in ("lastsize", "bidsize", "asksize")], [3, 1, 2])
+    eq_(type(sized[1]["lastsize"]), int)
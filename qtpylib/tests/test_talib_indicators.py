@@ -0,0 +1,61 @@
+from nose.tools import eq_, assert_raises
+import numpy as np
+import pandas as pd
+
+try:
+    from qtpylib import talib_indicators as ta
+except ImportError:
+    ta = None  # TA-Lib is not installed
+
+def _bars(n=50, seed=0):
+    close = 100 + np.random.RandomState(seed).randn(n).cumsum()
+    return pd.DataFrame({"open": close + .1, "high": close + 1,
+                         "low": close - 1, "close": close,
+                         "volume": np.arange(n) % 7 + 1})
+
+def test_extract_ohlc():
+    """Test OHLCV extraction to contiguous float64 arrays"""
+
+    if ta is None:
+        return
+
+    bars = _bars()
+    arrays = ta._extract_ohlc(bars)
+    eq_(len(arrays), 5)
+    for col, values in zip(("open", "high", "low", "close", "volume"),
+                           arrays):
+        eq_(values.dtype, np.float64)
+        eq_(values.flags["C_CONTIGUOUS"], True)
+        np.testing.assert_array_equal(values, bars[col].values)
+
+    assert_raises(ValueError, ta._extract_ohlc, bars[["close"]])
+
+def test_run_batch():
+    """Test batch runs match single runs and label kwargs variants"""
+
+    if ta is None:
+        return
+
+    data = {"ES": _bars(seed=1), "NQ": _bars(seed=2)}
+    functions = ["ATR", ("RSI", {"timeperiod": 5}),
+                 ("RSI", {"timeperiod": 14}), "MACD"]
+
+    for threads in (0, 2):
+        results = ta.run_batch(data, functions, threads=threads)
+        eq_(sorted(results), ["ES", "NQ"])
+        for symbol, bars in data.items():
+            res = results[symbol]
+            eq_(sorted(res), ["ATR", "MACD", "RSI(timeperiod=14)",
+                              "RSI(timeperiod=5)"])
+            np.testing.assert_allclose(
+                res["RSI(timeperiod=5)"],
+                ta.RSI(bars, timeperiod=5), equal_nan=True)
+            np.testing.assert_allclose(
+                res["RSI(timeperiod=14)"],
+                ta.RSI(bars, timeperiod=14), equal_nan=True)
+            np.testing.assert_allclose(res["ATR"], ta.ATR(bars),
+                                       equal_nan=True)
+            eq_(sorted(res["MACD"]), ["macd", "macdhist", "macdsignal"])
+
+    # identical entries would overwrite each other
+    assert_raises(ValueError, ta.run_batch, data, ["RSI", "RSI"])
@@ -0,0 +1,177 @@
+from nose.tools import eq_
+import warnings
+import numpy as np
+import pandas as pd
+
+try:
+    from qtpylib import tools
+except Exception:
+    tools = None  # IB API (ezibpy/IbPy2) isn't importable
+
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+def _ticks(n=200, seed=0):
+    rs = np.random.RandomState(seed)
+    index = pd.date_range("2020-01-06 15:00", periods=n, freq="1S",
+                          tz="UTC", name="datetime")
+    ticks = pd.DataFrame({
+        "last": 100 + rs.randn(n).cumsum().round(2),
+        "lastsize": rs.randint(1, 300, n).astype(float),
+        "symbol": "AAPL", "symbol_group": "AAPL_STK", "asset_class": "STK"
+    }, index=index)
+    ticks.iloc[[17, 50], 1] = np.nan  # ticks without a size
+    return tools.force_options_columns(ticks)
+
+def test_tick_bar_builder():
+    """Test that tick/volume/dollar bars built per tick match resample()"""
+
+    if tools is None:
+        return
+
+    ticks = _ticks()
+    for resolution in ("5K", "1000V", "50000$"):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = tools.resample(ticks.copy(), resolution, tz="UTC")
+
+        builder = tools.TickBarBuilder(resolution)
+        bars = []
+        for timestamp, tick in zip(ticks.index,
+                                   ticks.to_dict(orient='records')):
+            bar = builder.update(tick, timestamp)
+            if bar is not None:
+                bars.append(bar)
+        if builder.bar is not None:
+            bars.append(builder.bar)  # in progress
+        bars = pd.DataFrame(bars).set_index("datetime")
+
+        eq_(len(bars), len(expected))
+        eq_(list(bars.index), list(expected.index))
+        np.testing.assert_allclose(bars[OHLCV].values.astype(float),
+                                   expected[OHLCV].values.astype(float))
+
+def test_bar_resampler():
+    """Test incremental bar resampling, revisions and the window"""
+
+    if tools is None:
+        return
+
+    rs = np.random.RandomState(1)
+    close = 100 + rs.randn(60).cumsum()
+    bars = pd.DataFrame({
+        "open": close - .5, "high": close + 1, "low": close - 1,
+        "close": close, "volume": rs.randint(1, 100, 60).astype(float)
+    }, index=pd.date_range("2020-01-06 15:02", periods=60, freq="1T",
+                           tz="UTC"))
+    expected = bars.resample("5T").agg(tools.BarResampler.AGGREGATIONS)
+
+    resampler = tools.BarResampler("5T", window=5)
+    for timestamp, bar in zip(bars.index, bars.to_dict(orient='records')):
+        # bars still being built are re-sent with updated values
+        resampler.update(dict(bar, high=bar["close"], volume=1), timestamp)
+        resampler.update(bar, timestamp)
+
+    df = resampler.to_dataframe()
+    eq_(len(df), 5)
+    eq_(list(df.index), list(expected.index[-5:]))
+    np.testing.assert_allclose(df[OHLCV].values,
+                               expected[OHLCV].values[-5:])
+    eq_(len(resampler.to_dataframe(2)), 2)
+
+    # first period is partial (starts at 15:02)
+    resampler = tools.BarResampler("5T")
+    for timestamp, bar in zip(bars.index[:3], bars.to_dict('records')[:3]):
+        resampler.update(bar, timestamp)
+    np.testing.assert_allclose(resampler.to_dataframe()[OHLCV].values,
+                               expected[OHLCV].values[:1])
+
+def _old_record(rows, timestamp, data):
+    """ DataStore.record() before incremental recording
+    (re-builds and returns the entire output on every call) """
+    if isinstance(data, pd.DataFrame):
+        data = data[-1:].to_dict(orient='records')[0]
+    data = dict(data, datetime=timestamp)
+    new_data = {}
+    if "symbol" not in data.keys():
+        new_data = dict(data)
+    else:
+        sym = data["symbol"]
+        new_data["symbol"] = data["symbol"]
+        for key in data.keys():
+            if key not in ['datetime', 'symbol_group', 'asset_class']:
+                new_data[sym + '_' + str(key).upper()] = data[key]
+    new_data['datetime'] = timestamp
+
+    rows.append(pd.DataFrame(data=new_data, index=[timestamp]))
+    recorded = pd.concat(rows, sort=True)
+    if "symbol" not in recorded.columns:
+        return None
+
+    recorded['datetime'] = recorded.index
+    symbols = recorded['symbol'].dropna().unique().tolist()
+    recorded.drop(['symbol'] + [sym + '_SYMBOL' for sym in symbols],
+                  axis=1, inplace=True, errors='ignore')
+    for sym in symbols:
+        opt_cols = recorded.columns[
+            recorded.columns.str.startswith(sym + '_OPT_')].tolist()
+        recorded.drop(opt_cols, axis=1, inplace=True)
+
+    recorded = recorded.groupby(recorded['datetime']).first()
+    for sym in symbols:
+        recorded[sym + '_POSITION'] = recorded[sym + '_POSITION'
+                                               ].shift(1).fillna(0)
+
+    recorded.columns = [col.replace('_FUT_', '_').replace(
+                        '_OPT_OPT_', '_OPT_') for col in recorded.columns]
+    return recorded
+
+def test_datastore_output():
+    """Test that incremental recording writes what record() used to"""
+
+    if tools is None:
+        return
+
+    import os
+    import tempfile
+
+    rs = np.random.RandomState(2)
+    index = pd.date_range("2020-01-06 15:00", periods=12, freq="1T",
+                          tz="UTC", name="datetime")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_file = os.path.join(tmpdir, "recorded.csv")
+        store = tools.DataStore(output_file, flush_interval=3600)
+        rows, expected = [], None
+
+        def record(timestamp, data):
+            store.record(timestamp, data)
+            try:
+                return _old_record(rows, timestamp, data)
+            except KeyError:
+                return None  # no position recorded yet (Algo ignored it)
+
+        for i, timestamp in enumerate(index):
+            for symbol in ("ES", "NQ"):
+                price = 100 + rs.randn()
+                bar = tools.force_options_columns(pd.DataFrame({
+                    "symbol": symbol, "symbol_group": symbol + "_F",
+                    "asset_class": "FUT", "open": price, "high": price + 1,
+                    "low": price - 1, "close": price, "volume": i + 1
+                }, index=[timestamp]))
+                expected = record(timestamp, bar)
+                if i % 4 == 1:
+                    expected = record(timestamp,
+                                      {symbol + "_POSITION": i % 3 - 1})
+            expected = record(timestamp, {"signal": i % 2})
+
+            # periodic writes leave out the last (open) row
+            if i % 5 == 4:
+                store.flush(final=False)
+
+        store.flush()
+
+        written = pd.read_csv(output_file, index_col=0)
+        expected.to_csv(os.path.join(tmpdir, "expected.csv"))
+        expected = pd.read_csv(os.path.join(tmpdir, "expected.csv"),
+                               index_col=0)
+        pd.testing.assert_frame_equal(written, expected)
@@ -19,10 +19,13 @@
 # limitations under the License.
 #
 
+import atexit
 import datetime
 import time
 import os
 import sys
+from collections import deque
+from threading import Lock
 from stat import S_IWRITE
 from math import ceil
 
@@ -158,7 +161,8 @@ def create_ib_tuple(instrument):
                     expiry = symdata[2]
                 else:
                     # default to most active
-                    expiry = futures.get_active_contract(symdata[1])
+                    expiry = futures.get_active_contracts(
+                        [symdata[1]])[symdata[1]]
 
                 instrument = (spec['symbol'].upper(), "FUT",
                               spec['exchange'].upper(), spec['currency'].upper(),
@@ -607,7 +611,8 @@ def resample(data, resolution="1T", tz=None, ffill=True, dropna=False,
 
     def __resample_ticks(data, freq=1000, by='last'):
         """
-        function that re-samples tick data into an N-tick or N-volume OHLC format
+        function that re-samples tick data into an N-tick, N-volume
+        or N-dollar OHLC format
 
         df = pandas pd.dataframe of raw tick data
         freq = resoltuin grouping
@@ -631,8 +636,11 @@ def resample(data, resolution="1T", tz=None, ffill=True, dropna=False,
             size_col = 'volume'
 
         # add group indicator evey N df
-        if by == 'size' or by == 'lastsize' or by == 'volume':
-            df['cumvol'] = df[size_col].cumsum()
+        if by in ('size', 'lastsize', 'volume', 'dollar'):
+            if by == 'dollar':
+                df['cumvol'] = (df[price_col] * df[size_col]).cumsum()
+            else:
+                df['cumvol'] = df[size_col].cumsum()
             df['mark'] = round(
                 round(round(df['cumvol'] / .1) * .1, 2) / freq) * freq
             df['diff'] = df['mark'].diff().fillna(0).astype(int)
@@ -712,32 +720,12 @@ def resample(data, resolution="1T", tz=None, ffill=True, dropna=False,
         ['symbol', 'symbol_group', 'asset_class']].last()
     combined = []
 
-    if "K" in resolution:
-        if periods > 1:
-            for sym in meta_data.index.values:
-                symdata = __resample_ticks(data[data['symbol'] == sym].copy(),
-                                           freq=periods, by='last')
-                symdata['symbol'] = sym
-                symdata['symbol_group'] = meta_data[
-                    meta_data.index == sym]['symbol_group'].values[0]
-                symdata['asset_class'] = meta_data[
-                    meta_data.index == sym]['asset_class'].values[0]
-
-                # cleanup
-                symdata.dropna(inplace=True, subset=[
-                                'open', 'high', 'low', 'close', 'volume'])
-                if sym[-3:] in ("OPT", "FOP"):
-                    symdata.dropna(inplace=True)
-
-                combined.append(symdata)
-
-            data = pd.concat(combined, sort=True)
-
-    elif "V" in resolution:
+    if resolution[-1] in ("K", "V", "$"):
         if periods > 1:
+            by = {"K": "last", "V": "lastsize", "$": "dollar"}[resolution[-1]]
             for sym in meta_data.index.values:
                 symdata = __resample_ticks(data[data['symbol'] == sym].copy(),
-                                           freq=periods, by='lastsize')
+                                           freq=periods, by=by)
                 symdata['symbol'] = sym
                 symdata['symbol_group'] = meta_data[
                     meta_data.index == sym]['symbol_group'].values[0]
@@ -865,18 +853,256 @@ def resample(data, resolution="1T", tz=None, ffill=True, dropna=False,
     return __finalize(data, tz)
 
 
+# =============================================
+# incremental tick/volume/dollar bars
+# =============================================
+
+class TickBarBuilder():
+    """Builds N-tick (``K``), N-volume (``V``) or N-dollar (``$``) bars
+    incrementally, in O(1) per tick, grouping ticks the same way
+    ``resample()`` does for the entire tick history.
+
+    N-tick bars are complete on their Nth tick. Volume/dollar bars are
+    complete when a tick starts the next bar (the cumulative volume,
+    rounded to the nearest multiple of N, changes).
+
+    :Parameters:
+        resolution : str
+            eg. "100K", "5000V", "1000000$"
+    """
+
+    OPT_COLUMNS = ('opt_price', 'opt_underlying', 'opt_dividend',
+                   'opt_volume', 'opt_iv', 'opt_oi', 'opt_delta',
+                   'opt_gamma', 'opt_theta', 'opt_vega')
+
+    def __init__(self, resolution):
+        self.periods = int("".join([s for s in resolution if s.isdigit()]))
+        self.kind = resolution[-1]
+        self.bar = None  # bar in progress
+        self.count = 0
+        self._cumvol = 0.
+        self._mark = None
+        self._last = {}  # forward-filled tick values
+
+    # ---------------------------------------
+    def _ffill(self, tick, col):
+        value = tick.get(col, np.nan)
+        if value is None or value != value:
+            return self._last.get(col, np.nan)
+        self._last[col] = value
+        return value
+
+    def _new_bar(self, price, size):
+        """ does this tick start a new bar? """
+        if self.kind == "K":
+            return self.count % self.periods == 0
+
+        if self.kind == "$":
+            size = price * size
+        if size == size:  # cumsum skips NaNs
+            self._cumvol += size
+            mark = np.round(np.round(np.round(
+                self._cumvol / .1) * .1, 2) / self.periods) * self.periods
+        else:
+            mark = np.nan
+
+        diff = 0 if self._mark is None or mark != mark or \
+            self._mark != self._mark else int(mark - self._mark)
+        self._mark = mark
+        return self.count == 0 or diff >= self.periods - 1
+
+    # ---------------------------------------
+    def update(self, tick, timestamp):
+        """Adds a tick (dict with ``last``, ``lastsize`` and ``opt_*``)
+
+        :Returns:
+            bar : dict
+                The completed bar (with a ``datetime`` key), or None
+        """
+        raw_price = tick.get('last', np.nan)
+        raw_size = tick.get('lastsize', np.nan)
+        raw_price = np.nan if raw_price is None else raw_price
+        raw_size = np.nan if raw_size is None else raw_size
+
+        completed = None
+        if self._new_bar(raw_price, raw_size) and self.bar is not None:
+            completed, self.bar = self.bar, None
+
+        price = self._ffill(tick, 'last')
+        size = self._ffill(tick, 'lastsize')
+        opt = {col: self._ffill(tick, col) for col in self.OPT_COLUMNS}
+        self.count += 1
+
+        if self.bar is None:
+            self.bar = dict(datetime=timestamp, open=price, high=price,
+                            low=price, close=price,
+                            volume=size if size == size else 0, **opt)
+        else:
+            bar = self.bar
+            # groupby first/max/min/last/sum skip NaNs
+            if bar['open'] != bar['open']:
+                bar['open'] = price
+            bar['high'] = np.fmax(bar['high'], price)
+            bar['low'] = np.fmin(bar['low'], price)
+            if price == price:
+                bar['close'] = price
+            if size == size:
+                bar['volume'] += size
+            for col, value in opt.items():
+                if value == value:
+                    bar[col] = value
+
+        # n-tick bars are complete on their nth tick
+        if self.kind == "K" and self.count % self.periods == 0:
+            completed, self.bar = self.bar, None
+
+        return completed
+
+
+# =============================================
+# incremental multi-resolution bars
+# =============================================
+
+class BarResampler():
+    """Derives coarser (time-based) bars from a stream of bars,
+    incrementally (O(1) per bar), keeping a bounded window.
+    Bars are aggregated as ``resample()`` does (first/max/min/last/sum),
+    labeled by the start of their period.
+
+    A bar with the same timestamp as the previous one revises it
+    (eg. when fed bars that are still being built).
+
+    :Parameters:
+        resolution : str
+            Fixed-frequency pandas resolution (eg. "15T", "1H", "1D")
+
+    :Optional:
+        window : int
+            Number of bars to keep (default: 100)
+    """
+
+    AGGREGATIONS = {
+        'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+        'volume': 'sum'
+    }
+
+    def __init__(self, resolution, window=100):
+        try:
+            pd.Timestamp('2000-01-01').floor(resolution)
+        except Exception as e:
+            raise ValueError(
+                "Unsupported resolution %s (must be time-based)" % resolution)
+
+        self.resolution = resolution
+        self.bars = deque(maxlen=window)  # [(period start, bar), ...]
+        self._base = None  # period's bar before the latest input bar
+        self._last = None  # timestamp of the latest input bar
+
+    # ---------------------------------------
+    def _merge(self, base, bar):
+        if base is None:
+            return dict(bar)
+
+        merged = dict(base)
+        for col, value in bar.items():
+            if value is None or value != value:
+                continue
+            current = merged.get(col)
+            how = self.AGGREGATIONS.get(col, 'last')
+            if current is None or current != current or how == 'last':
+                merged[col] = value
+            elif how == 'max':
+                merged[col] = max(current, value)
+            elif how == 'min':
+                merged[col] = min(current, value)
+            elif how == 'sum':
+                merged[col] = current + value
+        return merged
+
+    def update(self, bar, timestamp):
+        """ adds a bar (dict) with the given timestamp """
+        timestamp = pd.Timestamp(timestamp)
+        period = timestamp.floor(self.resolution)
+        same_period = bool(self.bars) and self.bars[-1][0] == period
+
+        if same_period and timestamp == self._last:
+            # revision of the latest input bar
+            merged = self._merge(self._base, bar)
+        elif same_period:
+            self._base = self.bars[-1][1]
+            merged = self._merge(self._base, bar)
+        else:
+            self._base = None
+            merged = self._merge(None, bar)
+            self.bars.append((period, merged))
+
+        self.bars[-1] = (period, merged)
+        self._last = timestamp
+
+    # ---------------------------------------
+    def to_dataframe(self, lookback=None):
+        """ the bars as a pd.DataFrame (indexed by datetime) """
+        bars = list(self.bars)
+        if lookback is not None:
+            bars = bars[-lookback:]
+        if not bars:
+            return pd.DataFrame()
+        index = pd.DatetimeIndex([bar[0] for bar in bars], name='datetime')
+        return pd.DataFrame([bar[1] for bar in bars], index=index)
+
+
 # =============================================
 # store event in a temp data store
 # =============================================
 
 class DataStore():
+    """Records bars and custom data (see ``Algo.record()``)
+
+    Data is buffered in memory, column by column, with one row per
+    datetime (data recorded for an existing datetime fills its empty
+    values). Only rows added since the last access are converted to
+    a DataFrame, and the derived columns (eg. the shifted positions)
+    are computed when the data is accessed (``recorded``) or written.
+
+    The output file is written every ``flush_interval`` seconds and on
+    ``flush()`` (called on exit). New rows are appended to csv/h5 files
+    (the file is re-written if columns were added); pickle and parquet
+    files are re-written.
+
+    :Optional:
+        output_file : str
+            Path to save the recorded data (csv/h5/pickle/parquet)
+        flush_interval : float
+            Seconds between writes to the output file (default: 1)
+    """
 
-    def __init__(self, output_file=None):
+    def __init__(self, output_file=None, flush_interval=1):
         self.auto = None
-        self.recorded = None
         self.output_file = output_file
-        self.rows = []
-
+        self.flush_interval = flush_interval
+
+        self._lock = Lock()
+        self._index = []  # row datetimes
+        self._rows = {}  # {datetime: row}
+        self._columns = {}  # {column: [values]}
+        self._symbols = []
+        self._sorted = True
+        self._changes = 0
+
+        self._frame = None  # rows converted to a DataFrame
+        self._view = None
+        self._view_changes = -1
+
+        self._written = 0  # rows written to the output file
+        self._written_columns = None
+        self._written_open = False  # the last row written may change
+        self._written_changes = 0
+        self._flushed_at = time.time()
+
+        if output_file is not None:
+            atexit.register(self.flush)
+
+    # ---------------------------------------
     def record(self, timestamp, *args, **kwargs):
         """ add custom data to data store """
         if self.output_file is None:
@@ -895,9 +1121,6 @@ class DataStore():
         if kwargs:
             data.update(dict(kwargs))
 
-        data['datetime'] = timestamp
-        # self.rows.append(pd.DataFrame(data=data, index=[timestamp]))
-
         new_data = {}
         if "symbol" not in data.keys():
             new_data = dict(data)
@@ -907,65 +1130,168 @@ class DataStore():
             for key in data.keys():
                 if key not in ['datetime', 'symbol_group', 'asset_class']:
                     new_data[sym + '_' + str(key).upper()] = data[key]
+        new_data.pop('datetime', None)
 
-        new_data['datetime'] = timestamp
+        with self._lock:
+            self._add(timestamp, new_data)
 
-        # append to rows
-        self.rows.append(pd.DataFrame(data=new_data, index=[timestamp]))
-
-        # create dataframe
-        recorded = pd.concat(self.rows, sort=True)
+        # save
+        if time.time() - self._flushed_at >= self.flush_interval:
+            self.flush(final=False)
+
+    def _add(self, timestamp, data):
+        """ add data to the timestamp's row (first value wins) """
+        self._changes += 1
+        row = self._rows.get(timestamp)
+        if row is None:
+            row = len(self._index)
+            if row and self._sorted and timestamp < self._index[-1]:
+                self._sorted = False
+            self._rows[timestamp] = row
+            self._index.append(timestamp)
+            for values in self._columns.values():
+                values.append(np.nan)
+
+        # converted/written rows changed
+        if self._frame is not None and row < len(self._frame) or \
+                not self._sorted:
+            self._frame = None
+            self._written_columns = None
+
+        for key, value in data.items():
+            if key not in self._columns:
+                self._columns[key] = [np.nan] * len(self._index)
+            current = self._columns[key][row]
+            if current is None or current != current:
+                self._columns[key][row] = value
+
+        if "symbol" in data and data["symbol"] not in self._symbols:
+            self._symbols.append(data["symbol"])
+
+    # ---------------------------------------
+    @property
+    def recorded(self):
+        """ the recorded data (one row per datetime), or None """
+        with self._lock:
+            return self._get_view()
+
+    def _get_view(self):
+        if self._view_changes == self._changes:
+            return self._view
+        self._view_changes = self._changes
+
+        if "symbol" not in self._columns:
+            self._view = None
+            return None
 
-        if "symbol" not in recorded.columns:
-            return
+        # cleanup:
 
+        # remove symbols
+        symbols = self._symbols
+        columns = [col for col in self._columns if col not in
+                   ['symbol'] + [sym + '_SYMBOL' for sym in symbols]]
 
-        # group by symbol
-        recorded['datetime'] = recorded.index
-        data = recorded.groupby(['symbol', 'datetime'], as_index=False).sum()
-        data.set_index('datetime', inplace=True)
+        # remove non-option data if not working with options
+        for sym in symbols:
+            columns = [col for col in columns
+                       if not col.startswith(sym + '_OPT_')]
+
+        # no position recorded yet = flat
+        positions = [sym + '_POSITION' for sym in symbols]
+        columns = sorted(set(columns + positions))
+
+        # convert new rows (the last row may still change)
+        start = 0 if self._frame is None else len(self._frame)
+        rows = pd.DataFrame(
+            {col: self._columns[col][start:] if col in self._columns
+             else np.nan for col in columns},
+            index=pd.Index(self._index[start:], name='datetime'),
+            columns=columns)
+
+        # numbers are floats (as when rows were concatenated with the
+        # other symbols' rows, which lack their columns)
+        integers = rows.select_dtypes(include='integer').columns
+        rows[integers] = rows[integers].astype(float)
+        recorded = rows if self._frame is None else \
+            pd.concat([self._frame, rows], sort=False)[columns]
+        if self._sorted:
+            self._frame = recorded[:-1]
+        else:
+            recorded = recorded.sort_index()
 
-        symbols = data['symbol'].unique().tolist()
-        data.drop(columns=['symbol'], inplace=True)
+        # shift position
+        recorded = recorded.copy()
+        for col in positions:
+            recorded[col] = recorded[col].shift(1).fillna(0)
 
+        self._view = recorded
+        return self._view
 
-        # cleanup:
+    # ---------------------------------------
+    def flush(self, final=True):
+        """Writes the recorded data to the output file
 
-        # remove symbols
-        recorded.drop(['symbol'] + [sym + '_SYMBOL' for sym in symbols],
-                      axis=1, inplace=True)
+        :Optional:
+            final : bool
+                Also write the last datetime's row (which may still
+                change if more data is recorded for it). Default: True
+        """
+        if self.output_file is None:
+            return
 
-        # remove non-option data if not working with options
-        for sym in symbols:
+        with self._lock:
+            self._flushed_at = time.time()
+            recorded = self._get_view()
+            if recorded is None:
+                return
+
+            rows = len(recorded) if final else len(recorded) - 1
+            if rows < self._written or (rows == self._written and (
+                    not final or self._written_changes == self._changes)):
+                return
+
+            # cleanup columns names before saving...
+            recorded = recorded[:rows].copy()
+            recorded.columns = [col.replace('_FUT_', '_').replace(
+                                '_OPT_OPT_', '_OPT_') for col in recorded.columns]
+
+            # the last written row is re-written if it was still open
+            append = self._written > 0 and not self._written_open and \
+                list(recorded.columns) == self._written_columns
             try:
-                opt_cols = recorded.columns[
-                    recorded.columns.str.startswith(sym + '_OPT_')].tolist()
-                if len(opt_cols) == len(recorded[opt_cols].isnull().all()):
-                    recorded.drop(opt_cols, axis=1, inplace=True)
+                self._write(recorded, append)
             except Exception as e:
-                pass
+                return
 
-        # group df
-        recorded = recorded.groupby(recorded['datetime']).first()
+            self._written = rows
+            self._written_open = final
+            self._written_changes = self._changes
+            self._written_columns = list(recorded.columns)
 
-        # shift position
-        for sym in symbols:
-            recorded[sym + '_POSITION'] = recorded[sym + '_POSITION'
-                                                   ].shift(1).fillna(0)
-
-        # make this public
-        self.recorded = recorded.copy()
-
-        # cleanup columns names before saving...
-        recorded.columns = [col.replace('_FUT_', '_').replace(
-                            '_OPT_OPT_', '_OPT_') for col in recorded.columns]
+        chmod(self.output_file)
 
-        # save
+    def _write(self, recorded, append):
         if ".csv" in self.output_file:
-            recorded.to_csv(self.output_file)
+            if append:
+                recorded[self._written:].to_csv(
+                    self.output_file, mode='a', header=False)
+            else:
+                recorded.to_csv(self.output_file)
+
         elif ".h5" in self.output_file:
-            recorded.to_hdf(self.output_file, 0)
+            try:
+                if append:
+                    recorded[self._written:].to_hdf(
+                        self.output_file, 0, format='table', append=True)
+                else:
+                    recorded.to_hdf(self.output_file, 0, format='table',
+                                    mode='w')
+            except Exception as e:
+                # not appendable (eg. mixed types): re-write
+                recorded.to_hdf(self.output_file, 0, mode='w')
+
+        elif ".parquet" in self.output_file:
+            recorded.to_parquet(self.output_file)
+
         elif (".pickle" in self.output_file) | (".pkl" in self.output_file):
             recorded.to_pickle(self.output_file)
-
-        chmod(self.output_file)
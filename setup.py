@@ -61,6 +61,7 @@ setup(
     include_package_data=True,
     package_data={
         'static': ['qtpylib/_webapp/*'],
-        'db': ['qtpylib/schema.sql*']
+        'db': ['qtpylib/schema.sql*'],
+        'futures': ['qtpylib/futures_spec.csv']
     },
 )